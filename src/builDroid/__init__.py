@@ -1,6 +1,7 @@
 #!/usr/bin/env python3.10
 import argparse
 import os
+import shutil
 import subprocess
 import sys
 import importlib.resources
@@ -8,9 +9,22 @@ import time
 import hashlib
 import json
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from .utils import api_token_setup, api_token_reset, clone_and_set_metadata, new_experiment, create_results_sheet, run_post_process
+from .utils import api_token_setup, api_token_reset, clone_and_set_metadata, new_experiment
 from .utils import cleaner
+from .utils.workspace import WORKSPACE_MODES
+from .utils.tracing import current_tracer, span, trace_pipeline
+
+if TYPE_CHECKING:
+    from .utils.post_process import PostProcessPool
+
+def __getattr__(name):
+    # Still importable from the package root, but only loaded when used.
+    if name in ("create_results_sheet", "run_post_process", "PostProcessPool"):
+        from . import utils
+        return getattr(utils, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- Constants and Configuration ---
 # Use the same Python interpreter that is running this script for subprocesses.
@@ -31,6 +45,7 @@ def setup_docker_config():
     docker_config_path.parent.mkdir(parents=True, exist_ok=True)
     docker_config_path.write_text("{}")
 
+@span("fingerprint")
 def generate_project_hash(repo_source, local_path):
     """
     Generates a SHA-256 hash representing the state of the project's source files.
@@ -125,55 +140,86 @@ def run_builDroid_with_checks(
     """
     
     from builDroid.app.main import run_builDroid
+    from builDroid.commands.docker_helpers_static import remove_volume, remove_overlay_dirs, prune_docker_resources, export_overlay_upper
 
     resource_path: Path = importlib.resources.files('builDroid').joinpath('files', 'ai_settings.yaml')
     ai_settings = resource_path.read_text(encoding='utf-8')
 
     try:
-        run_builDroid(
-            cycle_limit=cycle_limit,
-            ai_settings=ai_settings,
-            debug=debug,
-            conversation=conversation,
-            working_directory=Path(
-                __file__
-            ).parent.parent.parent,
-            metadata=metadata
-        )
+        with span("agent_run"):
+            run_builDroid(
+                cycle_limit=cycle_limit,
+                ai_settings=ai_settings,
+                debug=debug,
+                conversation=conversation,
+                working_directory=Path(
+                    __file__
+                ).parent.parent.parent,
+                metadata=metadata
+            )
     finally:
-        project_name = metadata["project_name"]
-        project_path = metadata["project_url"]
-        project_name = os.path.basename(project_path) if local_path else project_name
-        # Extract the project if specified
-        if extract_project:
-            if local_path:
+        with span("extract_and_cleanup"):
+            project_name = metadata["project_name"]
+            project_path = metadata["project_url"]
+            project_name = os.path.basename(project_path) if local_path else project_name
+            workspace_mode = metadata.get("workspace_mode", "copy")
+            host_project_path = project_path if local_path else f"builDroid_workspace/{project_name}"
+            # Extract the project if specified
+            if extract_project and workspace_mode == "bind":
+                print(f"Workspace was bind-mounted; changes are already in: {host_project_path}")
+            elif extract_project and workspace_mode == "overlay" and metadata.get("overlay_upper_dir"):
+                upper_dir = metadata["overlay_upper_dir"]
                 if override_project:
-                    print(f"Overriding existing project at: {project_path}")
-                    subprocess.run(['rm', '-rf', project_path], check=True)
-                    subprocess.run(['docker', 'cp', f'{project_name}:/{project_name}', project_path], check=True)
+                    print(f"Exporting changed files onto existing project at: {host_project_path}")
+                    export_path = host_project_path
                 else:
-                    print(f"Copying project to local path: {project_path}_builDroid")
-                    subprocess.run(['rm', '-rf', f"{project_path}_builDroid"], check=True)
-                    subprocess.run(['docker', 'cp', f'{project_name}:/{project_name}', f"{project_path}_builDroid"], check=True)
-            else:
-                if override_project:
-                    print(f"Overriding existing project at: builDroid_workspace/{project_name}")
-                    subprocess.run(['rm', '-rf', f"builDroid_workspace/{project_name}"], check=True)
-                    subprocess.run(['docker', 'cp', f'{project_name}:/{project_name}', f"builDroid_workspace/{project_name}"], check=True)
+                    # The result has to be a complete project, as in copy mode, and the
+                    # checkout must stay untouched, so the changes go onto a copy of it.
+                    # That copy stays on the host; only the changed files leave the container.
+                    export_path = f"{host_project_path}_builDroid"
+                    print(f"Copying project with changed files to: {export_path}")
+                    subprocess.run(['rm', '-rf', export_path], check=True)
+                    shutil.copytree(host_project_path, export_path, symlinks=True)
+                try:
+                    changed = export_overlay_upper(upper_dir, metadata["image"], export_path)
+                    print(f"Exported {changed} changed path(s) from the overlay workspace.")
+                except (OSError, RuntimeError) as e:
+                    print(f"Warning: could not export the overlay changes ({e}). Copying the project out of the container instead.")
+                    subprocess.run(['rm', '-rf', export_path], check=True)
+                    subprocess.run(['docker', 'cp', f'{project_name}:/{project_name}', export_path], check=True)
+            elif extract_project:
+                if local_path:
+                    if override_project:
+                        print(f"Overriding existing project at: {project_path}")
+                        subprocess.run(['rm', '-rf', project_path], check=True)
+                        subprocess.run(['docker', 'cp', f'{project_name}:/{project_name}', project_path], check=True)
+                    else:
+                        print(f"Copying project to local path: {project_path}_builDroid")
+                        subprocess.run(['rm', '-rf', f"{project_path}_builDroid"], check=True)
+                        subprocess.run(['docker', 'cp', f'{project_name}:/{project_name}', f"{project_path}_builDroid"], check=True)
                 else:
-                    print(f"Copying project to: builDroid_workspace/{project_name}_builDroid")
-                    subprocess.run(['rm', '-rf', f"builDroid_workspace/{project_name}_builDroid"], check=True)
-                    subprocess.run(['docker', 'cp', f'{project_name}:/{project_name}', f"builDroid_workspace/{project_name}_builDroid"], check=True)
-        if keep_container:
-            if stop_container:
-                print(f"Stopping container {project_name} but keeping it for further analysis.")
-                # Stop the container without removing it
-                subprocess.run(["docker", "stop", project_name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                    if override_project:
+                        print(f"Overriding existing project at: builDroid_workspace/{project_name}")
+                        subprocess.run(['rm', '-rf', f"builDroid_workspace/{project_name}"], check=True)
+                        subprocess.run(['docker', 'cp', f'{project_name}:/{project_name}', f"builDroid_workspace/{project_name}"], check=True)
+                    else:
+                        print(f"Copying project to: builDroid_workspace/{project_name}_builDroid")
+                        subprocess.run(['rm', '-rf', f"builDroid_workspace/{project_name}_builDroid"], check=True)
+                        subprocess.run(['docker', 'cp', f'{project_name}:/{project_name}', f"builDroid_workspace/{project_name}_builDroid"], check=True)
+            if keep_container:
+                if stop_container:
+                    print(f"Stopping container {project_name} but keeping it for further analysis.")
+                    # Stop the container without removing it
+                    subprocess.run(["docker", "stop", project_name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                else:
+                    print(f"Keeping container {project_name} running for further analysis.")
             else:
-                print(f"Keeping container {project_name} running for further analysis.")
-        else:
-            subprocess.run(["docker", "rm", "-vf", project_name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            subprocess.run(["docker", "system", "prune", "--volumes", "-f"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                subprocess.run(["docker", "rm", "-vf", project_name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                if metadata.get("overlay_volume"):
+                    remove_volume(metadata["overlay_volume"])
+                    # The changed files were exported above; the layers are no longer needed.
+                    remove_overlay_dirs(os.path.dirname(metadata["overlay_upper_dir"]), metadata["image"])
+                prune_docker_resources()
 
 
 def run_with_retries(
@@ -187,11 +233,20 @@ def run_with_retries(
     keep_container: bool,
     user_retry: bool,
     local_path: bool,
-    stop_container: bool = True
-    ):
+    stop_container: bool = True,
+    defer_post_process: bool = False
+    ) -> bool:
     """
     Runs the main logic, handles retries, and performs post-processing.
+
+    With `defer_post_process`, the last attempt is not post-processed here, so the
+    caller can queue it on a PostProcessPool.
+
+    Returns:
+        bool: True if the post-processing of the last attempt was deferred.
     """
+    from .utils import run_post_process
+
     for attempt in range(1, MAX_RETRIES + 1):
         print("=" * 70)
         print(f"STARTING ITERATION {attempt}:")
@@ -201,16 +256,22 @@ def run_with_retries(
         if os.path.exists(f"builDroid_tests/{project_name}/output/FAILURE"):
             with open(f"builDroid_tests/{project_name}/output/FAILURE", "r") as f:
                 metadata["past_attempt"] = f.read()
-        run_builDroid_with_checks(cycle_limit=cycle_limit, conversation=conversation, debug=debug,
-                                  extract_project=extract_project, override_project=override_project,
-                                  metadata=metadata, keep_container=keep_container, local_path=local_path,
-                                  stop_container=stop_container)
+        with span("attempt", attempt=attempt):
+            run_builDroid_with_checks(cycle_limit=cycle_limit, conversation=conversation, debug=debug,
+                                      extract_project=extract_project, override_project=override_project,
+                                      metadata=metadata, keep_container=keep_container, local_path=local_path,
+                                      stop_container=stop_container)
+        # Only the first attempt continues an interrupted session.
+        metadata.pop("resume", None)
+
+        if defer_post_process and attempt == MAX_RETRIES and not user_retry:
+            return True
 
         # Run post-processing and check the result
         if run_post_process(project_name):
             print(f"Post-process succeeded. The extracted .apk file is in the "
                   f"builDroid_tests/{project_name}/output folder.")
-            return # Exit the function on success
+            return False # Exit the function on success
 
         print(f"Attempt {attempt} failed.")
 
@@ -231,15 +292,16 @@ def run_with_retries(
                 if run_post_process(project_name):
                     print(f"Post-process succeeded. The extracted .apk file is in the "
                         f"builDroid_tests/{project_name}/output folder.")
-                    return # Exit the function on success
+                    return False # Exit the function on success
                 print(f"User prompted retry failed. Exiting program.")
-                return 
+                return False
             elif user_input.startswith("N") or user_input.startswith("n"):
-                return
+                return False
             else:
                 user_input = input(f"Invalid input. Please answer with yes/no. \nBuild failed after {MAX_RETRIES} attempts. Retry? (yes/no): ")
 
 
+@trace_pipeline("process_repository")
 def process_repository(
     repo_source: str,
     cycle_limit: int = DEFAULT_NUM,
@@ -250,9 +312,24 @@ def process_repository(
     user_retry: bool = False,
     local_path: bool = False,
     project_name: str = None,
-    stop_container: bool = True
+    stop_container: bool = True,
+    workspace_mode: str = "copy",
+    sdk_cache: bool = False,
+    post_process_pool: "PostProcessPool | None" = None,
+    resume: bool = False
     ) -> str:
-    """Processes a single repository."""
+    """
+    Processes a single repository.
+
+    With `resume`, a run that was interrupted continues from the session saved
+    in its test directory instead of starting over.
+
+    If a `post_process_pool` is given, post-processing and the cache update run
+    on the pool and this function returns as soon as the build is over. Call
+    `post_process_pool.join()` before reading the results.
+    """
+    if workspace_mode not in WORKSPACE_MODES:
+        raise ValueError(f"Unknown workspace mode '{workspace_mode}'. Expected one of: {', '.join(WORKSPACE_MODES)}")
 
     # Set up API token and increment experiment
     api_token_setup()
@@ -275,7 +352,10 @@ def process_repository(
     image = "buildroid:1.3.2"
 
     # Clone the Github repository and set metadata
-    metadata = clone_and_set_metadata(project_name, repo_source, image, local_path)
+    with span("clone"):
+        metadata = clone_and_set_metadata(project_name, repo_source, image, local_path)
+    metadata["workspace_mode"] = workspace_mode
+    metadata["sdk_cache"] = sdk_cache
 
     project_key = generate_project_hash(repo_source, local_path)
     print(f"Project hash generated: {project_key}")
@@ -290,10 +370,17 @@ def process_repository(
     debug = False
     start_time = time.time()
 
-    metadata.update({"past_attempt": new_experiment(project_name)})
+    from .agents.session import session_path
+    if resume and os.path.exists(session_path(project_name)):
+        print(f"Resuming the interrupted run of {project_name}.")
+        metadata.update({"past_attempt": "", "resume": True})
+    else:
+        metadata.update({"past_attempt": new_experiment(project_name)})
+    # The test directory was just recreated; the trace is written there when the pipeline ends.
+    current_tracer().project_name = project_name
 
     # Run the main task with retries
-    run_with_retries(project_name=project_name, 
+    post_process_deferred = run_with_retries(project_name=project_name, 
                      cycle_limit=cycle_limit, 
                      conversation=conversation, 
                      debug=debug, 
@@ -303,7 +390,8 @@ def process_repository(
                      user_retry=user_retry, 
                      metadata=metadata,
                      local_path=local_path,
-                     stop_container=stop_container
+                     stop_container=stop_container,
+                     defer_post_process=post_process_pool is not None
                      )
 
     end_time = time.time()
@@ -316,25 +404,33 @@ def process_repository(
         for name in files:
             if name.endswith(".apk"):
                 apk_name = name
-    update_cache(
-        cache,
-        project_name=project_name,
-        project_key=project_key,
-        cycle_limit=cycle_limit,
-        conversation=conversation,
-        debug=debug,
-        extract_project=extract_project,
-        override_project=override_project,
-        keep_container=keep_container,
-        user_retry=user_retry,
-        metadata=metadata,
-        local_path=local_path,
-        start_time=start_time_str,
-        end_time=end_time_str,
-        elapsed_time=float(f"{elapsed_time:.2f}"),
-        apk_name=apk_name
-    )
-    save_cache_to_file(project_name, cache)
+
+    def save_build_result():
+        # The build status is read from the post-process output, so this runs after it.
+        update_cache(
+            cache,
+            project_name=project_name,
+            project_key=project_key,
+            cycle_limit=cycle_limit,
+            conversation=conversation,
+            debug=debug,
+            extract_project=extract_project,
+            override_project=override_project,
+            keep_container=keep_container,
+            user_retry=user_retry,
+            metadata=metadata,
+            local_path=local_path,
+            start_time=start_time_str,
+            end_time=end_time_str,
+            elapsed_time=float(f"{elapsed_time:.2f}"),
+            apk_name=apk_name
+        )
+        save_cache_to_file(project_name, cache)
+
+    if post_process_deferred:
+        post_process_pool.submit(project_name, then=save_build_result)
+    else:
+        save_build_result()
     return apk_name if apk_name else "BUILD_FAILED"
 
 def main():
@@ -356,6 +452,10 @@ Examples:
   # Clean test results
   buildroid clean
 
+  # List or pre-seed the shared Android SDK cache
+  buildroid sdk list
+  buildroid sdk seed "platforms;android-34" "build-tools;34.0.0"
+
 For more information on a specific command, use:
   buildroid <command> --help
   e.g., buildroid build --help
@@ -405,6 +505,25 @@ Examples for 'build' command:
         action="store_true",
         help="Keeps container after build. (By default, containers are removed)."
     )
+    build_parser.add_argument(
+        "-w", "--workspace",
+        choices=WORKSPACE_MODES,
+        default="copy",
+        help="How the project is made available in the container. Default: copy\n"
+             "  copy:    copy the project into the container and back out after the build.\n"
+             "  bind:    bind-mount the project, so the container edits it in place.\n"
+             "  overlay: mount the project read-only under an overlay; only changed files are exported."
+    )
+    build_parser.add_argument(
+        "-r", "--resume",
+        action="store_true",
+        help="Continue the interrupted run of a project from its saved session instead of starting over."
+    )
+    build_parser.add_argument(
+        "-s", "--sdk-cache",
+        action="store_true",
+        help="Mount the shared Android SDK cache volume, so SDK packages are downloaded once per host."
+    )
     clean_parser = subparsers.add_parser(
         "clean",
         help="Clean test results and/or Docker resources.",
@@ -414,6 +533,7 @@ Examples for 'build' command:
 Examples for 'clean' command:
   clean                    # Cleans test results and prompts for Docker clean type.
   clean -d                 # Cleans Docker resources and keep test results.
+  clean -n -k              # Cleans test results, including the fix knowledge base.
 """
     )
     clean_group = clean_parser.add_mutually_exclusive_group()
@@ -427,6 +547,32 @@ Examples for 'clean' command:
         action="store_true",
         help="Remove Docker resources (only containers or all resources)"
     )
+    clean_parser.add_argument(
+        "-k", "--knowledge",
+        action="store_true",
+        help="Also remove the fix knowledge base, which is kept by default."
+    )
+    sdk_parser = subparsers.add_parser(
+        "sdk",
+        help="List or pre-seed the shared Android SDK cache.",
+        description="Manage the Docker volume that `build --sdk-cache` mounts as the Android SDK.\n"
+                    "The volume is kept by builDroid's Docker cleanup; remove it with `docker volume rm buildroid-android-sdk`.",
+        formatter_class=argparse.RawTextHelpFormatter,
+        epilog="""
+Examples for 'sdk' command:
+  sdk list
+  sdk seed "platforms;android-34" "build-tools;34.0.0" "ndk;26.1.10909125"
+"""
+    )
+    sdk_subparsers = sdk_parser.add_subparsers(dest="sdk_command", required=True)
+    sdk_subparsers.add_parser("list", help="List the SDK packages in the cache.")
+    seed_parser = sdk_subparsers.add_parser("seed", help="Install SDK packages into the cache.")
+    seed_parser.add_argument(
+        "packages",
+        metavar="PACKAGE",
+        nargs="+",
+        help="sdkmanager package names, e.g. \"platforms;android-34\"."
+    )
     args = parser.parse_args()
     
     if args.command is None:
@@ -436,12 +582,18 @@ Examples for 'clean' command:
     # If command is clean, clean and exit immediately.
     if args.command == "clean":
         if not args.docker:
-            cleaner.clean_workspace(args.no_docker)
+            cleaner.clean_workspace(args.no_docker, remove_knowledge=args.knowledge)
         else:
             cleaner.clean_docker_resources()
         print("Exiting after cleaning.")
         sys.exit(0)
 
+    elif args.command == "sdk":
+        from .utils import sdk_cache
+        if args.sdk_command == "list":
+            sys.exit(sdk_cache.list_sdk_cache())
+        sys.exit(sdk_cache.seed_sdk_cache(args.packages))
+
     elif args.command == "build":
         if DEV_DEBUG:
             import debugpy
@@ -456,20 +608,31 @@ Examples for 'clean' command:
         if "github.com" in repo_source:
             # Handle the case where input is a single URL string
             print("Processing a single repository URL.")
-            process_repository(repo_source=repo_source, cycle_limit=args.num, conversation=args.conv, keep_container=args.keep_container, user_retry=True)
+            process_repository(repo_source=repo_source, cycle_limit=args.num, conversation=args.conv, keep_container=args.keep_container, user_retry=True, workspace_mode=args.workspace, sdk_cache=args.sdk_cache, resume=args.resume)
         elif args.local:
             print("Processing a local repository.")
-            process_repository(repo_source=repo_source, cycle_limit=args.num, conversation=args.conv, keep_container=args.keep_container, user_retry=True, local_path=True)
+            process_repository(repo_source=repo_source, cycle_limit=args.num, conversation=args.conv, keep_container=args.keep_container, user_retry=True, local_path=True, workspace_mode=args.workspace, sdk_cache=args.sdk_cache, resume=args.resume)
         else:
             # Handle the case where the input is a file
             print(f"Processing repositories from file: {repo_source}")
             with open(repo_source, 'r') as f:
                 repo_urls = [line.strip() for line in f if line.strip()]
             
+            # Nobody watches a batch scroll by, so skip the typing effect.
+            from .logs import logger
+            logger.typing = False
+            from .utils import PostProcessPool, create_results_sheet
+            # Post-process finished projects in the background while the next ones build.
+            post_process_pool = PostProcessPool(batch_unclassified=True)
             for url in repo_urls:
-                process_repository(repo_source=url, cycle_limit=args.num, conversation=args.conv, keep_container=args.keep_container, user_retry=False)
+                process_repository(repo_source=url, cycle_limit=args.num, conversation=args.conv, keep_container=args.keep_container, user_retry=False, workspace_mode=args.workspace, sdk_cache=args.sdk_cache, post_process_pool=post_process_pool, resume=args.resume)
+            post_process_pool.join()
             # Generate the final results sheet after all repos are processed
             create_results_sheet()
+        from .utils.llm_scheduler import save_scheduler_stats
+        save_scheduler_stats()
+        from .utils.llm_hedging import save_hedge_stats
+        save_hedge_stats()
         api_token_reset()
         print("Execution finished.")
 
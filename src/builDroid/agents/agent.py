@@ -2,19 +2,26 @@ from __future__ import annotations
 
 import json
 import os
+import sqlite3
+import time
 from typing import TYPE_CHECKING, Any
 
 if TYPE_CHECKING:
+    from google.genai.chats import Chat
+    from openai import Stream
+
     from builDroid.config import AIConfig, Config
     from builDroid.models.command_registry import CommandRegistry
 
 from builDroid.utils.json_utils import extract_dict_from_response
+from builDroid.utils.gradle_log import summarize_gradle_output
+from builDroid.utils.error_classifier import get_classifier
+from builDroid.utils.fix_knowledge import find_fixes, format_fix_hint, record_fix_trace, reset_fix_trace
+from builDroid.utils.metrics import record_command
+from builDroid.commands.docker_helpers_static import write_file_to_container
 from builDroid.logs import logger
 
 from .base import AgentThoughts, BaseAgent, CommandArgs, CommandName
-from google import genai
-from google.genai.chats import Chat
-from openai import OpenAI, Stream
 
 class Agent(BaseAgent):
     """Agent class for interacting with builDroid."""
@@ -38,6 +45,10 @@ class Agent(BaseAgent):
         )
 
         self.workspace = config.workspace_path
+        if not self.resumed:
+            # A new attempt starts over in a fresh container; the commands of
+            # earlier attempts did not lead to its result.
+            reset_fix_trace(self.project_name)
 
     def execute(
         self,
@@ -50,20 +61,77 @@ class Agent(BaseAgent):
         elif command_name is not None and command_name.lower().startswith("error"):
             result = f"Could not execute command: {command_name}{command_args}"
         else:
+            started = time.monotonic()
             command_result = execute_command(
                 command_name=command_name,
                 arguments=command_args,
                 agent=self,
             )
+            record_command(command_name, time.monotonic() - started, str(command_result))
+            logger.raw_output(f"Cycle {self.cycle_count}: {command_name} {command_args}", str(command_result))
             if command_result == "goals_accomplished: SUCCESS":
                 return command_result
-            if len(str(command_result)) < 5000:
+            self.error_matches = get_classifier().find_all(str(command_result))
+            for match in self.error_matches:
+                logger.debug(f"Detected {match.category} / {match.issue}: {match.text}")
+            record_fix_trace(self.project_name, self.cycle_count, command_name, command_args, self.error_matches)
+            if not self.config.conversation:
+                escalation = self.cascade.observe_errors(
+                    self.error_matches, build_succeeded="BUILD SUCCESSFUL" in str(command_result)
+                )
+                if escalation is not None:
+                    logger.info(f"{escalation}. Escalating to model {self.cascade.model}")
+            digest = self._summarize_build_output(str(command_result))
+            if digest is not None:
+                result = f"Command {command_name} returned: " f"{digest}"
+            elif len(str(command_result)) < 5000:
                 result = f"Command {command_name} returned: " f"{command_result}"
             else:
                 result = f"Command {command_name} returned: " f"{str(command_result)[:2000]}  ...  {str(command_result)[-3000:]}" 
+            hint = self._fix_hint()
+            if hint is not None:
+                result += "\n\n" + hint
                 
         return result
 
+    def _fix_hint(self) -> str | None:
+        """Fixes from other projects for the errors just detected. Each fix is offered once."""
+        if not self.error_matches:
+            return None
+        try:
+            fixes = find_fixes(self.error_matches, self.project_name, exclude=self.hinted_fixes)
+        except sqlite3.Error as e:
+            logger.warn(f"Could not read the fix knowledge base: {e}")
+            return None
+        if not fixes:
+            return None
+        self.hinted_fixes.update((fix["signature"], fix["project"]) for fix in fixes)
+        logger.info(f"Suggesting {len(fixes)} fix(es) from other projects")
+        return format_fix_hint(fixes)
+
+    def _summarize_build_output(self, output: str) -> str | None:
+        """
+        Replaces long Gradle build output with a digest of the failure.
+
+        The full output is saved in the container, where the agent can read it in
+        parts, and in the project's test directory on the host.
+        """
+        log_name = f"cycle_{self.cycle_count}.log"
+        container_log_path = f"/tmp/buildroid-logs/{log_name}"
+        digest = summarize_gradle_output(output, container_log_path)
+        if digest is None:
+            return None
+        host_log_dir = os.path.join("builDroid_tests", self.project_name, "logs")
+        os.makedirs(host_log_dir, exist_ok=True)
+        with open(os.path.join(host_log_dir, log_name), "w", encoding="utf-8") as f:
+            f.write(output)
+        try:
+            write_file_to_container(self.channels, container_log_path, output)
+        except Exception as e:
+            logger.warn(f"Could not save the build log in the container: {e}")
+            digest = digest.replace(container_log_path, os.path.join(host_log_dir, log_name) + " on the host")
+        return digest
+
 
     def parse_and_process_response(
         self, llm_response: str, *args, **kwargs
@@ -3,23 +3,40 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import contextvars
 import time
 from colorama import Fore
 from abc import ABCMeta, abstractmethod
-from typing import Any, Literal, Optional
+from typing import TYPE_CHECKING, Any, Literal, Optional
 import json
 import os
+import threading
 from importlib.resources import files
+from types import SimpleNamespace
 import functools
 
 from builDroid.config import AIConfig, Config
 from builDroid.models.command_registry import CommandRegistry
-from google import genai
-from google.genai.chats import Chat
-from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable
-from openai import OpenAI, Stream
+from builDroid.utils.metrics import current_cycle, record_retry
+from builDroid.utils.model_cascade import ModelCascade
+from builDroid.utils.llm_scheduler import (
+    estimate_tokens, get_scheduler, is_bad_request, retry_after_seconds, scheduled_call
+)
+from builDroid.utils.llm_hedging import get_hedge_policy, request_cancelled
+from builDroid.utils.json_stream import CommandStreamParser, MalformedResponseError
+
+# The provider SDKs are slow to import; each is imported when its provider is used.
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai.chats import Chat
+    from openai import OpenAI, Stream
 
 from builDroid.logs import logger
+RESUMED_RUN_RESULT = (
+    "builDroid was interrupted and has been restarted. The container was recreated, "
+    "so packages installed and files changed by earlier commands may be gone: "
+    "check the state you rely on before continuing."
+)
 DEFAULT_TRIGGERING_PROMPT = (
     "Determine exactly one command to use based on the given goals "
     "and the progress you have made so far, "
@@ -30,14 +47,30 @@ CommandName = str
 CommandArgs = dict[str, str]
 AgentThoughts = dict[str, Any]
 
-def retry(max_attempts=3, backoff_base=1.5, exceptions_to_catch=(ResourceExhausted, ServiceUnavailable)):
+def _rate_limit_errors() -> tuple[type[Exception], ...]:
+    """The exceptions reported as rate limits. Imported on the first failure only."""
+    try:
+        from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable
+    except ImportError:
+        return ()
+    return (ResourceExhausted, ServiceUnavailable)
+
+# Whether the call running in this context is the last attempt `retry` makes.
+_last_attempt: contextvars.ContextVar[bool] = contextvars.ContextVar("buildroid_last_retry_attempt", default=False)
+
+def retry(max_attempts=3, backoff_base=1.5, exceptions_to_catch=None):
     """
     A decorator to retry a function if an exception occurs.
 
+    If the provider sent a Retry-After header, the whole LLM scheduler is paused
+    for that long instead, so concurrent callers do not retry into the same limit.
+
     :param max_attempts: Maximum number of times to attempt the function.
     :param backoff_base: Factor by which the delay increases each time (e.g., 2 for exponential).
-    :param exceptions_to_catch: A tuple of exception types to catch and retry on.
-                                Defaults to all exceptions.
+    :param exceptions_to_catch: A tuple of exception types reported as rate limits.
+                                Defaults to the Google API rate limit errors.
+                                All exceptions are retried, except requests the
+                                provider rejected as bad (see `is_bad_request`).
     """
     def decorator(func):
         @functools.wraps(func)
@@ -46,41 +79,86 @@ def retry(max_attempts=3, backoff_base=1.5, exceptions_to_catch=(ResourceExhaust
             error_msg = f"{Fore.RED}Unknown Error: {{err}}. Waiting {{backoff}} seconds...{Fore.RESET}"
             for attempt in range(1, max_attempts + 1):
                 backoff = round(backoff_base ** (attempt), 2)
+                started = time.monotonic()
+                token = _last_attempt.set(attempt >= max_attempts)
                 try:
                     return func(*args, **kwargs)
-                except exceptions_to_catch as e:
-                    logger.warn(backoff_msg.format(backoff=backoff))
-                    if attempt >= max_attempts:
-                        raise
                 except Exception as e:  # Catch-all for other potential error
-                    logger.warn(error_msg.format(err=e, backoff=backoff))
-                    if attempt >= max_attempts:
+                    retry_after = retry_after_seconds(e)
+                    if retry_after is not None:
+                        backoff = round(retry_after, 2)
+                    elif isinstance(e, MalformedResponseError):
+                        # Not the provider's limit: ask again right away.
+                        backoff = 0
+                    if attempt >= max_attempts or request_cancelled() or is_bad_request(e):
                         raise
-                time.sleep(backoff)
+                    if retry_after is not None or isinstance(e, exceptions_to_catch or _rate_limit_errors()):
+                        logger.warn(backoff_msg.format(backoff=backoff))
+                    else:
+                        logger.warn(error_msg.format(err=e, backoff=backoff))
+                finally:
+                    _last_attempt.reset(token)
+                if retry_after is not None:
+                    # The next attempt waits out the pause in the scheduler, like every other caller.
+                    get_scheduler().pause(retry_after)
+                    record_retry(time.monotonic() - started)
+                elif backoff:
+                    record_retry(time.monotonic() - started + backoff)
+                    time.sleep(backoff)
+                else:
+                    record_retry(time.monotonic() - started)
         return wrapper
     return decorator
 
+def create_client(api_key: str, base_url: str):
+    """Creates the provider client for an endpoint: Gemini for Google URLs, else OpenAI-compatible."""
+    if "google" in base_url:
+        from google import genai
+        return genai.Client(api_key=api_key)
+    from openai import OpenAI
+    if "" == base_url:
+        return OpenAI(api_key=api_key)
+    return OpenAI(api_key=api_key, base_url=base_url)
+
 def create_chat_completion(
     client,
     model,
-    prompt
+    prompt,
+    schema: dict | None = None,
 ) -> str:
-    if type(client) is genai.Client:
-        return create_chat_completion_gemini(client, model, prompt)
-    elif type(client) is OpenAI:
-        return create_chat_completion_gpt(client, model, prompt)
+    """
+    Creates a chat completion. With a JSON `schema`, the provider is asked for
+    structured output that follows it.
+    """
+    # Compare by module, so the SDK of the other provider is not imported.
+    client_module = type(client).__module__
+    if client_module.startswith("google.genai"):
+        return create_chat_completion_gemini(client, model, prompt, schema)
+    elif client_module.startswith("openai"):
+        return create_chat_completion_gpt(client, model, prompt, schema)
     return "ERROR: Client not supported."
 
+def _gemini_schema_config(schema: dict | None) -> dict:
+    if schema is None:
+        return {}
+    return {"config": {"response_mime_type": "application/json", "response_schema": schema}}
+
+def _gpt_schema_format(schema: dict | None) -> dict:
+    if schema is None:
+        return {}
+    return {"response_format": {"type": "json_schema", "json_schema": {"name": "agent_reply", "schema": schema}}}
+
 @retry()
 def create_chat_completion_gemini(
     client: genai.Client,
     model,
-    prompt
+    prompt,
+    schema: dict | None = None,
 ) -> str:
     """Create a chat completion with Gemini."""
-    response = client.models.generate_content(
-        model=model, contents=prompt
-    )
+    response = scheduled_call(prompt, lambda: client.models.generate_content(
+        model=model, contents=prompt, **_gemini_schema_config(schema)
+    ))
     return response.text
 
 @retry()
@@ -88,40 +166,139 @@ def create_chat_completion_gpt(
     client: OpenAI,
     model,
     prompt,
+    schema: dict | None = None,
 ) -> str:
     """Create a chat completion with GPT."""
-    response = client.chat.completions.create(
+    response = scheduled_call(prompt, lambda: client.chat.completions.create(
         model=model, messages=[
         {
         "role": "user",
         "content": prompt
         },
         ],
-    )
+        **_gpt_schema_format(schema),
+    ))
     return response.choices[0].message.content
     
+def streaming_enabled() -> bool:
+    return os.getenv("LLM_STREAMING", default="false").lower() == "true"
+
+def stream_chat_completion(
+    client,
+    model,
+    prompt,
+    schema: dict | None = None,
+) -> str:
+    """
+    Like `create_chat_completion`, but streams the response and returns as soon
+    as its command is complete. Malformed output is retried without waiting for
+    the rest of it; the last attempt is read to the end and returned whole, for
+    the regular parsing.
+    """
+    client_module = type(client).__module__
+    if client_module.startswith("google.genai"):
+        return stream_chat_completion_gemini(client, model, prompt, schema)
+    elif client_module.startswith("openai"):
+        return stream_chat_completion_gpt(client, model, prompt, schema)
+    return "ERROR: Client not supported."
+
+def _read_stream(stream, prompt: str, chunk_text) -> SimpleNamespace:
+    """
+    Feeds a response stream to a CommandStreamParser until the command is complete.
+    The rest of the stream is read and logged in a background thread.
+
+    A malformed stream is aborted with MalformedResponseError, except on the
+    last retry attempt: that one is read to the end, since the regular parsing
+    may still find the reply, e.g. after a long preamble.
+
+    Returns:
+        The reply as `text`, with an estimated `usage`, since the provider only
+        reports usage at the end of the stream.
+    """
+    parser = CommandStreamParser()
+    chunks = iter(stream)
+    try:
+        for chunk in chunks:
+            if parser.feed(chunk_text(chunk) or "") is not None:
+                break
+    except MalformedResponseError as e:
+        if not _last_attempt.get():
+            stream.close()
+            raise
+        logger.warn(f"Streamed response is malformed: {e}. Reading it to the end")
+        parser.text += "".join(chunk_text(chunk) or "" for chunk in chunks)
+    if parser.reply is None:
+        # The stream ended first, or was malformed and read to the end: leave
+        # the text to the regular parsing.
+        text = parser.text
+        stream.close()
+    else:
+        text = json.dumps(parser.reply, indent=2)
+        threading.Thread(
+            target=_drain_stream, args=(stream, chunks, chunk_text), daemon=True, name="llm-stream-drain"
+        ).start()
+    usage = SimpleNamespace(prompt_tokens=estimate_tokens(prompt), completion_tokens=estimate_tokens(parser.text))
+    return SimpleNamespace(text=text, usage=usage)
+
+def _drain_stream(stream, chunks, chunk_text) -> None:
+    rest = []
+    try:
+        for chunk in chunks:
+            rest.append(chunk_text(chunk) or "")
+    except Exception as e:
+        rest.append(f"\n[stream failed: {e}]")
+    finally:
+        stream.close()
+    if "".join(rest).strip():
+        logger.debug(f"Rest of the streamed response, after its command: {''.join(rest)}")
+
 @retry()
-def send_message_gemini(
-    chat: Chat,
-    prompt: str
+def stream_chat_completion_gemini(
+    client: genai.Client,
+    model,
+    prompt,
+    schema: dict | None = None,
 ) -> str:
-    """Send a message to current chat with Gemini."""
-    response = chat.send_message(message=prompt)
+    """Stream a chat completion with Gemini."""
+    response = scheduled_call(prompt, lambda: _read_stream(
+        client.models.generate_content_stream(model=model, contents=prompt, **_gemini_schema_config(schema)),
+        prompt,
+        lambda chunk: chunk.text,
+    ))
     return response.text
 
 @retry()
-def send_message_gpt(
-    chat: Stream,
-    model: str,
+def stream_chat_completion_gpt(
     client: OpenAI,
-    prompt: str,
+    model,
+    prompt,
+    schema: dict | None = None,
 ) -> str:
-    """Send a message to current chat with GPT."""
-    chat = client.responses.create(
-        model=model, input=prompt,
-        previous_response_id=chat.id
-    )
-    return chat.output_text
+    """Stream a chat completion with GPT."""
+    response = scheduled_call(prompt, lambda: _read_stream(
+        client.chat.completions.create(
+            model=model, messages=[{"role": "user", "content": prompt}], stream=True,
+            **_gpt_schema_format(schema),
+        ),
+        prompt,
+        lambda chunk: chunk.choices[0].delta.content if chunk.choices else "",
+    ))
+    return response.text
+
+def _is_json_reply(response: str) -> bool:
+    """Whether a response holds a JSON object, as the agent's replies must."""
+    if not response or response.startswith("ERROR:"):
+        return False
+    start, end = response.find("{"), response.rfind("}")
+    if start == -1:
+        return False
+    try:
+        return isinstance(json.loads(response[start:end + 1]), dict)
+    except json.JSONDecodeError:
+        return False
+
+# (BASE_URL, model) pairs that turned down structured output, in this process
+_structured_output_rejected: set[tuple[str, str]] = set()
 
 class BaseAgent(metaclass=ABCMeta):
     """Base class for all builDroid agents."""
@@ -159,6 +336,7 @@ class BaseAgent(metaclass=ABCMeta):
         """The default instruction passed to the AI for a thinking cycle."""
 
         self.chat = None
+        """The ConversationSession of conversation mode, started on the first cycle."""
 
         self.cycle_budget = cycle_budget
         """
@@ -194,6 +372,20 @@ class BaseAgent(metaclass=ABCMeta):
 
         self.container = None
         self.shell_socket = None
+        self.channels = None
+        self.file_index = None
+        self.sdk_prefetcher = None
+        self.error_matches = []
+        self.hinted_fixes: set[tuple[str, str]] = set()
+        """(signature, project) of the fixes from other projects already suggested."""
+        self.metrics = None
+        self.cascade = ModelCascade.from_settings(ai_config.model_cascade, config.llm_model)
+        """Picks the model of stateless cycles. Conversation mode keeps `config.llm_model`."""
+
+        self.resumed = False
+        """Whether the agent continues the saved session of an interrupted run."""
+        if self.metadata.get("resume"):
+            self.resume_session()
 
     def to_dict(self):
         return {
@@ -218,6 +410,30 @@ class BaseAgent(metaclass=ABCMeta):
             "container": str(self.container),
         }
 
+    def save_session(self) -> None:
+        """Saves what is needed to resume the run to builDroid_tests/{project}/session.json."""
+        from .session import save_session
+        save_session(self.project_name, {
+            "conversation": self.config.conversation,
+            "cycle_count": self.cycle_count,
+            "session": self.chat.to_dict() if self.chat is not None else None,
+        })
+
+    def resume_session(self) -> None:
+        """
+        Continues from the session saved by an interrupted run of the same mode.
+        Stateless runs continue from their prompt_history.
+        """
+        from .session import ConversationSession, load_session
+        state = load_session(self.project_name)
+        if state is None or state["conversation"] != self.config.conversation or not state["cycle_count"]:
+            return
+        self.cycle_count = state["cycle_count"]
+        if state["session"] is not None:
+            self.chat = ConversationSession.from_dict(state["session"])
+        self.resumed = True
+        logger.info(f"{Fore.GREEN}Resuming the session of {self.project_name} after cycle {self.cycle_count}{Fore.RESET}")
+
     def save_to_file(self, filename):
         # Save object attributes as JSON to a file
         with open(filename, 'w') as file:
@@ -237,15 +453,7 @@ class BaseAgent(metaclass=ABCMeta):
         Returns:
             The command name and arguments, if any, and the agent's thoughts.
         """
-        if "google" in self.config.openai_api_base:
-            client = genai.Client(api_key=self.config.openai_api_key)
-        elif "" == self.config.openai_api_base:
-            client = OpenAI(api_key=self.config.openai_api_key)
-        else:
-            client = OpenAI(
-                api_key=self.config.openai_api_key,
-                base_url=self.config.openai_api_base,
-            )
+        client = create_client(self.config.openai_api_key, self.config.openai_api_base)
 
         if not self.config.conversation:
             if self.cycle_count == 0:
@@ -261,26 +469,42 @@ class BaseAgent(metaclass=ABCMeta):
                     result = "NO RESULT"
                 prompt += "\n\n==================Command " + str(self.cycle_count) + "==================\n" + previous_command + "\n==================Command Result==================\n" + result
 
-            logger.info(
-                f"{Fore.GREEN}Creating chat completion with model {self.config.llm_model}{Fore.RESET}"
-            )
-            response = create_chat_completion(client, self.config.llm_model, prompt)
+            level, model = self.cascade.level, self.cascade.model
+            response, prompt = self._cascade_completion(client, level, prompt)
+            reply = self.on_response(response, thought_process_id, prompt)
+            # An unparseable response is asked again, right away, of the next tier.
+            # extract_dict_from_response stands in "missing_command" for JSON it cannot parse.
+            while reply[0] is None or reply[0] == "missing_command":
+                self.cascade.record_parse_failure(level)
+                if not self.cascade.escalate():
+                    break
+                logger.warn(f"Response of model {model} could not be parsed. Escalating to {self.cascade.model}")
+                level, model = self.cascade.level, self.cascade.model
+                response, prompt = self._cascade_completion(client, level, prompt)
+                reply = self.on_response(response, thought_process_id, prompt)
+            # Saved once the tier is settled: a higher tier that turns down
+            # structured output is sent the prompt with the command list added.
             self.cycle_count += 1
             with open(f"builDroid_tests/{self.project_name}/prompt_history", "w") as patf:
                 patf.write(prompt)
-            return self.on_response(response, thought_process_id, prompt)
-        
+            self.cascade.record_cycle(level)
+            self.cascade.save_stats(self.project_name)
+            cycle = current_cycle()
+            if cycle is not None:
+                cycle.model = model
+            self.save_session()
+            return reply
+
+        from .session import open_session, send_in_session
         if self.cycle_count == 0: # Initial cycle: send guidelines as system instructions
             prompt = self.construct_base_prompt()
+            self.chat = open_session(client, self.config.llm_model)
             logger.info(
                 f"{Fore.GREEN}Starting chat with model {self.config.llm_model}{Fore.RESET}"
             )
-            if "google" in self.config.openai_api_base:
-                self.chat = client.chats.create(model=self.config.llm_model)
-            else:
-                self.chat = client.responses.create(model=self.config.llm_model, input=prompt)
-                response = self.chat.output_text
         else:
+            if result is None:
+                result = "NO RESULT"
             prompt = self.cycle_instruction + "\n==================Previous Command Result==================\n" + result
 
         with open(f"builDroid_tests/{self.project_name}/prompt_history", "a+") as patf:
@@ -289,14 +513,72 @@ class BaseAgent(metaclass=ABCMeta):
         logger.info(
             f"{Fore.GREEN}Sending request to model {self.config.llm_model}{Fore.RESET}"
         )
-        if "google" in self.config.openai_api_base:
-            response = send_message_gemini(self.chat, prompt)
-        elif self.cycle_count > 0:
-            response = send_message_gpt(self.chat, self.config.llm_model, client, prompt)
+        self.chat, response = send_in_session(self.chat, client, prompt)
 
         self.cycle_count += 1
+        self.save_session()
         return self.on_response(response, thought_process_id, prompt)
    
+    def _cascade_completion(self, client, level: int, prompt: str) -> tuple[str, str]:
+        """
+        Creates a chat completion with the model of cascade tier `level` and adds its latency and usage to the tier.
+
+        Returns:
+            The response, and the prompt that was sent: if the model turned down
+            structured output, the command list is added to the prompt and it is
+            sent again as free text.
+        """
+        model = self.cascade.tiers[level].model
+        logger.info(
+            f"{Fore.GREEN}Creating chat completion with model {model}{Fore.RESET}"
+        )
+        cycle = current_cycle()
+        before = (cycle.llm_calls, cycle.prompt_tokens, cycle.completion_tokens) if cycle else (0, 0, 0)
+        started = time.monotonic()
+        schema = self.command_registry.reply_schema() if self._structured_output(model) else None
+        try:
+            response = self._complete(client, model, prompt, schema)
+        except Exception as e:
+            if schema is None or not (is_bad_request(e) or isinstance(e, TypeError)):
+                raise
+            logger.warn(f"Model {model} does not take structured output ({e}). Using free text instead.")
+            _structured_output_rejected.add((self.config.openai_api_base, model))
+            prompt = self._with_command_list(prompt)
+            response = self._complete(client, model, prompt, None)
+        seconds = time.monotonic() - started
+        after = (cycle.llm_calls, cycle.prompt_tokens, cycle.completion_tokens) if cycle else (1, 0, 0)
+        self.cascade.record_completion(level, seconds, *(a - b for a, b in zip(after, before)))
+        return response, prompt
+
+    def _complete(self, client, model: str, prompt: str, schema: dict | None) -> str:
+        complete = stream_chat_completion if streaming_enabled() else create_chat_completion
+        hedge = get_hedge_policy()
+        if hedge is None:
+            return complete(client, model, prompt, schema)
+        # Each side gets its own client, because the losing one is closed to cancel it.
+        return hedge.run(
+            (create_client(self.config.openai_api_key, self.config.openai_api_base),
+             lambda primary: complete(primary, model, prompt, schema)),
+            lambda: (create_client(hedge.api_key, hedge.base_url),
+                     lambda secondary: complete(secondary, hedge.model, prompt, schema)),
+            is_valid=_is_json_reply,
+        )
+
+    def _structured_output(self, model: str) -> bool:
+        """Whether stateless requests to `model` ask for replies in the command schema."""
+        return (
+            self.config.openai_functions
+            and not self.config.conversation
+            and (self.config.openai_api_base, model) not in _structured_output_rejected
+        )
+
+    def _with_command_list(self, prompt: str) -> str:
+        """Adds the command list to a prompt that was built for structured output."""
+        commands = "\n".join(self.prompt_dictionary["commands"])
+        if commands in prompt:
+            return prompt
+        return prompt + "\n" + commands
+
     @abstractmethod
     def execute(
         self,
@@ -331,6 +613,9 @@ class BaseAgent(metaclass=ABCMeta):
         
         definitions_prompt = ""
         static_sections_names = ["goals", "commands"]
+        if self._structured_output(self.cascade.model):
+            # The response schema lists the commands and their arguments.
+            static_sections_names = ["goals"]
 
         for key in static_sections_names:
             if isinstance(self.prompt_dictionary[key], list):
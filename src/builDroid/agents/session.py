@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import json
+import os
+from abc import ABCMeta, abstractmethod
+from typing import TYPE_CHECKING
+
+from builDroid.utils.llm_scheduler import is_bad_request, scheduled_call
+
+from .base import retry
+
+if TYPE_CHECKING:
+    from google import genai
+    from openai import OpenAI
+
+SESSION_FILE_NAME = "session.json"
+
+
+def session_path(project_name: str) -> str:
+    return os.path.join("builDroid_tests", project_name, SESSION_FILE_NAME)
+
+
+class ConversationSession(metaclass=ABCMeta):
+    """
+    A conversation between the agent and the model, for conversation mode.
+
+    `send` adds a prompt to the conversation and returns the reply. The
+    session's state is plain data (`to_dict`), so it can be saved after every
+    turn and resumed after a crash with a new client.
+    """
+
+    kind: str
+
+    def __init__(self, model: str, turns: int = 0):
+        self.model = model
+        self.turns = turns
+
+    @abstractmethod
+    def send(self, client, prompt: str) -> str:
+        ...
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "model": self.model, "turns": self.turns}
+
+    @staticmethod
+    def from_dict(data: dict) -> ConversationSession:
+        if data["kind"] == ResponsesSession.kind:
+            return ResponsesSession(data["model"], data.get("turns", 0), data.get("response_id"))
+        if data["kind"] == LocalHistorySession.kind:
+            return LocalHistorySession(data["model"], data.get("turns", 0), data.get("messages", []))
+        raise ValueError(f"Unknown session kind '{data['kind']}'")
+
+
+class ResponsesSession(ConversationSession):
+    """
+    The OpenAI Responses API keeps the conversation on the provider's side:
+    each turn uploads only the new prompt, with the id of the last response.
+    """
+
+    kind = "responses"
+
+    def __init__(self, model: str, turns: int = 0, response_id: str | None = None):
+        super().__init__(model, turns)
+        self.response_id = response_id
+
+    def send(self, client: OpenAI, prompt: str) -> str:
+        response = send_response_gpt(client, self.model, prompt, self.response_id)
+        self.response_id = response.id
+        self.turns += 1
+        return response.output_text
+
+    def to_dict(self) -> dict:
+        return {**super().to_dict(), "response_id": self.response_id}
+
+
+class LocalHistorySession(ConversationSession):
+    """
+    Keeps the messages locally and sends all of them each turn, for Gemini and
+    for OpenAI-compatible endpoints without a Responses API.
+    """
+
+    kind = "local"
+
+    def __init__(self, model: str, turns: int = 0, messages: list[dict] | None = None):
+        super().__init__(model, turns)
+        self.messages = messages or []
+
+    def send(self, client, prompt: str) -> str:
+        messages = self.messages + [{"role": "user", "content": prompt}]
+        if type(client).__module__.startswith("google.genai"):
+            reply = send_messages_gemini(client, self.model, messages)
+        else:
+            reply = send_messages_gpt(client, self.model, messages)
+        # Only kept once answered, so a failed turn can be sent again.
+        self.messages = messages + [{"role": "assistant", "content": reply or ""}]
+        self.turns += 1
+        return reply
+
+    def to_dict(self) -> dict:
+        return {**super().to_dict(), "messages": self.messages}
+
+
+def open_session(client, model: str) -> ConversationSession:
+    """Starts the session that keeps the most state on the provider's side for `client`."""
+    if type(client).__module__.startswith("openai"):
+        return ResponsesSession(model)
+    return LocalHistorySession(model)
+
+
+def send_in_session(session: ConversationSession, client, prompt: str) -> tuple[ConversationSession, str]:
+    """
+    Sends a prompt in a session. A Responses session whose endpoint has no
+    Responses API falls back to a local history, if it has not started yet.
+
+    Returns:
+        The session, which may have been replaced, and the reply.
+    """
+    try:
+        return session, session.send(client, prompt)
+    except Exception as e:
+        if not isinstance(session, ResponsesSession) or session.turns or not is_bad_request(e):
+            raise
+    session = LocalHistorySession(session.model)
+    return session, session.send(client, prompt)
+
+
+def save_session(project_name: str, state: dict) -> None:
+    """Writes the session state; a crash mid-write leaves the previous state."""
+    path = session_path(project_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def load_session(project_name: str) -> dict | None:
+    """Reads the saved session state of a project. Returns None if there is none."""
+    path = session_path(project_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _messages_text(messages: list[dict]) -> str:
+    return "\n".join(message["content"] for message in messages)
+
+@retry()
+def send_response_gpt(
+    client: OpenAI,
+    model: str,
+    prompt: str,
+    previous_response_id: str | None,
+):
+    """Send a prompt with the OpenAI Responses API, continuing `previous_response_id`."""
+    kwargs = {"previous_response_id": previous_response_id} if previous_response_id else {}
+    return scheduled_call(prompt, lambda: client.responses.create(model=model, input=prompt, **kwargs))
+
+@retry()
+def send_messages_gemini(
+    client: genai.Client,
+    model: str,
+    messages: list[dict],
+) -> str:
+    """Create a chat completion with Gemini from the whole conversation."""
+    contents = [
+        {"role": "model" if message["role"] == "assistant" else "user", "parts": [{"text": message["content"]}]}
+        for message in messages
+    ]
+    response = scheduled_call(_messages_text(messages), lambda: client.models.generate_content(
+        model=model, contents=contents
+    ))
+    return response.text
+
+@retry()
+def send_messages_gpt(
+    client: OpenAI,
+    model: str,
+    messages: list[dict],
+) -> str:
+    """Create a chat completion with GPT from the whole conversation."""
+    response = scheduled_call(_messages_text(messages), lambda: client.chat.completions.create(
+        model=model, messages=messages
+    ))
+    return response.choices[0].message.content
@@ -17,14 +17,19 @@ from importlib.resources import files
 from colorama import Fore, Style
 
 from builDroid.agents.agent import Agent, AgentThoughts, CommandArgs, CommandName
-from builDroid.agents.base import DEFAULT_TRIGGERING_PROMPT
+from builDroid.agents.base import DEFAULT_TRIGGERING_PROMPT, RESUMED_RUN_RESULT
 from builDroid.app.spinner import Spinner
 from builDroid.commands import COMMAND_CATEGORIES
 from builDroid.config import AIConfig, Config
 from builDroid.config.config import set_api_token
 from builDroid.logs import logger
 from builDroid.models.command_registry import CommandRegistry
-from builDroid.commands.docker_helpers_static import build_image, start_container, check_image_exists, create_persistent_shell, locate_or_import_gradlew
+from builDroid.utils.metrics import MetricsRecorder
+from builDroid.utils.tracing import span
+from builDroid.commands.android_sdk import SdkPrefetcher
+from builDroid.commands.gradle_project import GradleProject
+from builDroid.commands.project_index import ProjectFileIndex
+from builDroid.commands.docker_helpers_static import build_image, start_container, check_image_exists, create_persistent_shell, ContainerChannels, locate_or_import_gradlew, prepare_workspace_volumes, ensure_sdk_cache_volume, execute_command_in_container, SDKMANAGER_LOCK_FUNCTION
 
 def run_builDroid(
     cycle_limit: int,
@@ -63,7 +68,11 @@ def run_builDroid(
         metadata=metadata,
     )
 
-    run_interaction_loop(agent)
+    # Also log to builDroid_tests/{project}/logs while the agent runs.
+    with logger.project(metadata["project_name"].replace(".git", "")):
+        run_interaction_loop(agent)
+    # Let the log listener catch up before the caller prints its own output.
+    logger.flush()
 
 def run_interaction_loop(
     agent: Agent,
@@ -81,8 +90,12 @@ def run_interaction_loop(
     ai_config = agent.ai_config
     logger.debug(f"{ai_config.ai_name} System Prompt: {str(agent.prompt_dictionary)}")
     agent.project_name = agent.project_name.replace(".git","")
+    agent.metrics = MetricsRecorder(agent.project_name)
 
     cycle_budget = cycles_remaining = config.cycle_limit
+    if agent.resumed:
+        # The cycles of the interrupted run count against the limit.
+        cycles_remaining = max(cycle_budget - agent.cycle_count, 0)
 
     spinner = Spinner("Thinking...", plain_output=config.plain_output)
 
@@ -126,55 +139,87 @@ def run_interaction_loop(
             print(image_log)
             sys.exit(1)
     
-    agent.container = start_container(f"buildroid:1.3.2", f"{agent.project_name[:63]}")
-    agent.shell_socket = create_persistent_shell(agent.container)
+    ct_name = f"{agent.project_name[:63]}"
+    ct_name = os.path.basename(ct_name) if os.path.exists(ct_name) else ct_name
+    container_project_path = f"/{os.path.basename(agent.project_name)}"
+    volumes = prepare_workspace_volumes(
+        agent.metadata.get("workspace_mode", "copy"),
+        agent.workspace_path,
+        container_project_path,
+        ct_name,
+        agent.metadata,
+    )
+    if agent.metadata.get("sdk_cache"):
+        volumes = {**(volumes or {}), **ensure_sdk_cache_volume()}
+    agent.container = start_container(f"buildroid:1.3.2", ct_name, volumes=volumes)
     if agent.container is None:
         sys.exit(1)
-    print(image_log + "Container launched successfully. Now copying project files to the container...")
-    print( agent.workspace_path)
-    subprocess.run(['docker', 'cp', agent.workspace_path, f'{agent.container.id}:/{os.path.basename(agent.project_name)}'])
+    agent.shell_socket = create_persistent_shell(agent.container)
+    # sdkmanager runs started by the agent take the same install lock as builDroid's own.
+    execute_command_in_container(agent.shell_socket, SDKMANAGER_LOCK_FUNCTION)
+    agent.channels = ContainerChannels(agent.container)
+    if agent.metadata.get("workspace_mode", "copy") == "copy":
+        print(image_log + "Container launched successfully. Now copying project files to the container...")
+        print( agent.workspace_path)
+        with span("workspace_copy"):
+            subprocess.run(['docker', 'cp', agent.workspace_path, f'{agent.container.id}:{container_project_path}'])
+    else:
+        print(image_log + f"Container launched successfully. Project mounted at {container_project_path} ({agent.metadata['workspace_mode']} mode).")
+    agent.file_index = ProjectFileIndex(agent.channels, container_project_path)
+    with span("file_index_scan"):
+        agent.file_index.scan()
     locate_or_import_gradlew(agent)
+    # Install the SDK packages the project declares while the first cycles run.
+    agent.sdk_prefetcher = SdkPrefetcher(agent.channels)
+    agent.sdk_prefetcher.start(GradleProject.load(agent.file_index))
     print("Now starting the build process...")
 
     command_name = None
     command_args = None
     assistant_reply_dict = None
-    result = None
+    result = RESUMED_RUN_RESULT if agent.resumed else None
     response = ""
     while cycles_remaining > 0:
         logger.debug(f"Cycle budget: {cycle_budget}; remaining: {cycles_remaining}")
-        ########
-        # Plan #
-        ########
-        # Have the agent determine the next action to take.
-        with spinner:
-            command_name, command_args, assistant_reply_dict, response = agent.think(response, result)
-
-        ###############
-        # Update User #
-        ###############
-        # Print the assistant's thoughts and the next command to the user.
-        update_user(config, ai_config, command_name, command_args, assistant_reply_dict)
-        logger.typewriter_log("CYCLES REMAINING: ", Fore.CYAN, f"{cycles_remaining}")
-        cycles_remaining -= 1
-
-        ###################
-        # Execute Command #
-        ###################
-        # Decrement the cycle counter first to reduce the likelihood of a SIGINT
-        # happening during command execution, setting the cycles remaining to 1,
-        # and then having the decrement set it to 0, exiting the application.
-        agent.left_commands = cycles_remaining
-        result = agent.execute(command_name, command_args)
-        if result == "goals_accomplished: SUCCESS":
-            agent.shell_socket.close()
-            return
-        if result is not None:
-            logger.info(title="SYSTEM: ", title_color=Fore.YELLOW, message=result)
-        else:
-            logger.info(title="SYSTEM: ", title_color=Fore.YELLOW, message="Unable to execute command")
+        # LLM requests and commands made in this block are recorded in the project's metrics.jsonl.
+        with agent.metrics.cycle(agent.cycle_count + 1), span("cycle", cycle=agent.cycle_count + 1) as cycle_span:
+            ########
+            # Plan #
+            ########
+            # Have the agent determine the next action to take.
+            with spinner, span("think"):
+                command_name, command_args, assistant_reply_dict, response = agent.think(response, result)
+            if cycle_span is not None:
+                cycle_span.set_attribute("command", str(command_name))
+
+            ###############
+            # Update User #
+            ###############
+            # Print the assistant's thoughts and the next command to the user.
+            update_user(config, ai_config, command_name, command_args, assistant_reply_dict)
+            logger.typewriter_log("CYCLES REMAINING: ", Fore.CYAN, f"{cycles_remaining}")
+            cycles_remaining -= 1
+
+            ###################
+            # Execute Command #
+            ###################
+            # Decrement the cycle counter first to reduce the likelihood of a SIGINT
+            # happening during command execution, setting the cycles remaining to 1,
+            # and then having the decrement set it to 0, exiting the application.
+            agent.left_commands = cycles_remaining
+            with span("execute"):
+                result = agent.execute(command_name, command_args)
+            if result == "goals_accomplished: SUCCESS":
+                agent.channels.close()
+                agent.shell_socket.close()
+                return
+            if result is not None:
+                logger.info(title="SYSTEM: ", title_color=Fore.YELLOW, message=result)
+            else:
+                logger.info(title="SYSTEM: ", title_color=Fore.YELLOW, message="Unable to execute command")
     
     logger.info("Last cycle. Shutting down...")
+    agent.channels.close()
     agent.shell_socket.close()
     return
 
@@ -0,0 +1,148 @@
+"""Predictive installation of the Android SDK packages a project declares"""
+
+from __future__ import annotations
+
+import re
+import shlex
+from concurrent.futures import Future, TimeoutError
+
+from builDroid.commands.docker_helpers_static import SDK_INSTALL_LOCK, ContainerChannels
+from builDroid.commands.gradle_project import GradleProject
+from builDroid.logs import logger
+
+# The SDK directories whose entries map one-to-one to sdkmanager package names.
+SDK_PACKAGE_DIRS = ("platforms", "build-tools", "ndk")
+# Prints one `<dir>/<entry>` line per installed package.
+LIST_SDK_PACKAGES_SCRIPT = (
+    'cd "$ANDROID_HOME" && for d in ' + " ".join(SDK_PACKAGE_DIRS) + '; do '
+    '[ -d "$d" ] && for p in "$d"/*; do [ -e "$p" ] && echo "$p"; done; '
+    'done; true'
+)
+
+# Longest wait for the background download before a build or install runs anyway.
+SDK_PREFETCH_WAIT_SECONDS = 600
+# An sdkmanager or Gradle invocation: the command word of a simple command, after
+# variable assignments and wrappers such as `sudo`, `timeout 600` or `sh`. File
+# names like build.gradle and arguments like gradle/wrapper do not match.
+_SDK_OR_BUILD_INVOCATION = re.compile(
+    r"(?:^|[;&|(`]|\$\()\s*"
+    r"(?:\w+=\S*\s+)*"
+    r"(?:(?:sudo|nohup|time|env|timeout\s+\S+|(?:ba)?sh)\s+)*"
+    r"(?:\S*/)?(?:sdkmanager|gradlew|gradle)(?:\.bat)?(?=$|[\s;&|)`])"
+)
+
+
+def runs_sdkmanager_or_gradle(command: str) -> bool:
+    """Whether a shell command line runs sdkmanager or a Gradle build."""
+    return _SDK_OR_BUILD_INVOCATION.search(command) is not None
+
+
+def parse_sdk_package_list(output: bytes) -> set[str]:
+    """Turns the output of LIST_SDK_PACKAGES_SCRIPT into sdkmanager package names."""
+    return {
+        line.replace("/", ";", 1)
+        for line in output.decode("utf-8", errors="replace").splitlines()
+        if "/" in line
+    }
+
+
+def sdkmanager_command(packages: list[str]) -> str:
+    """
+    Returns a shell command installing `packages`, accepting licenses.
+
+    The install holds SDK_INSTALL_LOCK, so containers sharing the SDK cache never
+    run sdkmanager on it at the same time.
+    """
+    return f"yes | flock {SDK_INSTALL_LOCK} sdkmanager " + " ".join(shlex.quote(p) for p in packages)
+
+
+def installed_sdk_packages(channels: ContainerChannels) -> set[str]:
+    """
+    Lists the platforms, build-tools and NDKs installed in the container.
+
+    Returns:
+        set: sdkmanager package names, e.g. `platforms;android-34`.
+    """
+    exit_code, stdout, stderr = channels.exec(["sh", "-c", LIST_SDK_PACKAGES_SCRIPT])
+    if exit_code != 0:
+        logger.warn(f"Could not list installed SDK packages: {stderr.decode('utf-8', errors='replace').strip()}")
+        return set()
+    return parse_sdk_package_list(stdout)
+
+
+def required_sdk_packages(project: GradleProject) -> set[str]:
+    """Returns the SDK packages declared by the project's build scripts."""
+    packages = set()
+    for level in [*project.compile_sdk_versions().values(), *project.target_sdk_versions().values()]:
+        packages.add(f"platforms;android-{level}")
+    for version in project.build_tools_versions().values():
+        packages.add(f"build-tools;{version}")
+    for version in project.ndk_versions().values():
+        packages.add(f"ndk;{version}")
+    return packages
+
+
+class SdkPrefetcher:
+    """
+    Installs the SDK packages a project needs before the first build asks for them.
+
+    `start` compares the packages declared in the Gradle scripts with the ones
+    installed in the container and downloads the missing ones in a single
+    background `sdkmanager` run. Anything that installs SDK packages or builds
+    the project should call `wait` first, so two `sdkmanager` processes never
+    write to the SDK at the same time.
+    """
+
+    def __init__(self, channels: ContainerChannels):
+        self.channels = channels
+        self.packages: list[str] = []
+        """The packages being prefetched."""
+        self._future: Future | None = None
+
+    def start(self, project: GradleProject) -> list[str]:
+        """
+        Starts downloading the missing packages in the background.
+
+        Returns:
+            list: The packages being downloaded.
+        """
+        missing = required_sdk_packages(project) - installed_sdk_packages(self.channels)
+        if not missing:
+            return []
+        self.packages = sorted(missing)
+        print(f"Prefetching SDK packages in the background: {', '.join(self.packages)}")
+        self._future = self.channels.submit(["sh", "-c", sdkmanager_command(self.packages)])
+        return self.packages
+
+    @property
+    def pending(self) -> bool:
+        return self._future is not None and not self._future.done()
+
+    def wait(self, timeout: float = SDK_PREFETCH_WAIT_SECONDS) -> bool:
+        """
+        Blocks until the background download (if any) is over, for at most `timeout` seconds.
+
+        Returns:
+            bool: False if the download is still running.
+        """
+        if self._future is None:
+            return True
+        if self.pending:
+            print("Waiting for the SDK prefetch to finish...")
+        try:
+            exit_code, _, stderr = self._future.result(timeout=timeout)
+        except TimeoutError:
+            logger.warn(f"SDK prefetch still running after {timeout:.0f}s; not waiting for it any longer")
+            return False
+        except Exception as e:
+            logger.warn(f"SDK prefetch failed: {e}")
+        else:
+            if exit_code != 0:
+                logger.warn(f"SDK prefetch exited with {exit_code}: {stderr.decode('utf-8', errors='replace').strip()[-500:]}")
+        self._future = None
+        return True
+
+    def is_installed(self, package: str) -> bool:
+        """Waits for the prefetch, then checks whether `package` is installed."""
+        self.wait()
+        return package in installed_sdk_packages(self.channels)
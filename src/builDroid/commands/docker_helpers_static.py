@@ -1,17 +1,41 @@
 import docker
 from docker.errors import ImageNotFound
+import contextvars
+import io
 import os
+import posixpath
+import shutil
 import subprocess
+import tarfile
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from builDroid.logs import logger
+from builDroid.utils.tracing import span
+from builDroid.utils.workspace import WORKSPACE_MODES, export_overlay_changes
 import socket
 from importlib.resources import files, as_file
 import re
 
+ANDROID_HOME = "/home/vscode/Android/Sdk" # ANDROID_HOME in Template.dockerfile
+# Named volume shared by all containers, so SDK packages are downloaded once per host.
+# It is labeled so builDroid's own prune calls can skip it.
+SDK_CACHE_VOLUME = "buildroid-android-sdk"
+SDK_CACHE_LABEL = "buildroid.sdk-cache"
+SDK_INSTALL_LOCK = f"{ANDROID_HOME}/.buildroid-install.lock"
+# Serializes sdkmanager runs across every container sharing the SDK cache.
+SDKMANAGER_LOCK_FUNCTION = (
+    f'sdkmanager() {{ flock "{SDK_INSTALL_LOCK}" "{ANDROID_HOME}/cmdline-tools/latest/bin/sdkmanager" "$@"; }}'
+)
+
 PROMPT_MARKER = "\r\n__AGENT_SHELL_END_MARKER__$"
 SOCKET_RECV_TIMEOUT = 5.0 # Timeout for each individual recv() call
 COMMAND_TOTAL_TIMEOUT = 60.0 # Overall timeout for the command to complete
+MAX_FILE_READ_BYTES = 1024 * 1024 # Largest file read_file returns without a line range
+MAX_SIDE_CHANNELS = 4 # Concurrent non-TTY execs/archive transfers per container
+MAX_BACKGROUND_CHANNELS = 2 # Side channels background jobs may hold, so queries are never starved
 
+@span("docker.create_shell")
 def create_persistent_shell(container):
     """
     Creates a persistent shell session inside the container using Docker's attach API.
@@ -68,6 +92,7 @@ def close_persistent_shell(socket):
         print(f"Error closing socket: {e}")
 
 
+@span("docker.check_image")
 def check_image_exists(image_name):
     client = docker.from_env()
     try:
@@ -82,6 +107,7 @@ def check_image_exists(image_name):
         return False
 
 
+@span("docker.build_image")
 def build_image(dockerfile_path, tag):
     client = docker.from_env()
     try:
@@ -93,46 +119,188 @@ def build_image(dockerfile_path, tag):
 import docker
 
 
-def start_container(image_tag, name):
+@span("docker.start_container")
+def start_container(image_tag, name, volumes=None):
     client = docker.from_env()
     subprocess.run(['docker', 'rm', '-vf', name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
     try:
         ct_name = os.path.basename(name) if os.path.exists(name) else name
         print(f"Running new container from image {image_tag}...", ct_name)
-        
-        container = client.containers.run(image_tag, detach=True, tty=True, stdin_open=True, name=ct_name)
+
+        container = client.containers.run(image_tag, detach=True, tty=True, stdin_open=True, name=ct_name, volumes=volumes)
         print(f"Container {container.short_id} is running.")
         return container
     except Exception as e:
         print(f"An error occurred while running the container: {e}")
         return None
 
+@span("docker.create_overlay_volume")
+def create_overlay_volume(volume_name, lower_dir, upper_dir, work_dir):
+    """
+    Creates a Docker volume backed by an overlay filesystem on the host.
+
+    The host checkout is used as the read-only lower layer, so every write made
+    inside the container lands in `upper_dir` and the checkout stays pristine.
+
+    Returns:
+        str: The volume name, or None if the volume could not be created.
+    """
+    client = docker.from_env()
+    subprocess.run(['docker', 'volume', 'rm', '-f', volume_name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        client.volumes.create(
+            name=volume_name,
+            driver="local",
+            driver_opts={
+                "type": "overlay",
+                "device": "overlay",
+                "o": f"lowerdir={os.path.abspath(lower_dir)},upperdir={os.path.abspath(upper_dir)},workdir={os.path.abspath(work_dir)}",
+            },
+        )
+        return volume_name
+    except Exception as e:
+        print(f"An error occurred while creating the overlay volume: {e}")
+        return None
+
+def remove_volume(volume_name):
+    subprocess.run(['docker', 'volume', 'rm', '-f', volume_name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+@span("docker.ensure_sdk_cache_volume")
+def ensure_sdk_cache_volume():
+    """
+    Creates the shared SDK cache volume if it does not exist yet.
+
+    Docker fills an empty named volume with the image's content on first mount,
+    so the cache starts out with the packages baked into the image.
+
+    Returns:
+        dict: The volumes mapping that mounts the cache over ANDROID_HOME.
+    """
+    client = docker.from_env()
+    try:
+        client.volumes.get(SDK_CACHE_VOLUME)
+    except docker.errors.NotFound:
+        client.volumes.create(name=SDK_CACHE_VOLUME, driver="local", labels={SDK_CACHE_LABEL: "true"})
+    return {SDK_CACHE_VOLUME: {"bind": ANDROID_HOME, "mode": "rw"}}
+
+@span("docker.prune")
+def prune_docker_resources():
+    """Prunes unused Docker resources, keeping the shared SDK cache volume."""
+    subprocess.run(
+        ["docker", "system", "prune", "--volumes", "-f", "--filter", f"label!={SDK_CACHE_LABEL}"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+@span("prepare_workspace")
+def prepare_workspace_volumes(workspace_mode, host_path, container_path, ct_name, metadata):
+    """
+    Builds the `volumes` argument for `start_container` according to the workspace mode.
+
+    Args:
+        workspace_mode: One of WORKSPACE_MODES.
+        host_path: The project checkout on the host.
+        container_path: Where the project should appear inside the container.
+        ct_name: The container name, used to name the overlay volume and its layers.
+        metadata: The project metadata. Overlay details are recorded here so the
+            extraction step can export the changed files later.
+
+    Returns:
+        dict | None: The volumes mapping, or None when the project has to be copied.
+    """
+    if workspace_mode == "bind":
+        return {os.path.abspath(host_path): {"bind": container_path, "mode": "rw"}}
+    if workspace_mode == "overlay":
+        overlay_dir = os.path.join("builDroid_workspace", ".overlay", ct_name)
+        remove_overlay_dirs(overlay_dir, metadata["image"])
+        upper_dir = os.path.join(overlay_dir, "upper")
+        work_dir = os.path.join(overlay_dir, "work")
+        os.makedirs(upper_dir, exist_ok=True)
+        os.makedirs(work_dir, exist_ok=True)
+        volume_name = create_overlay_volume(f"{ct_name}-workspace", host_path, upper_dir, work_dir)
+        if volume_name is not None:
+            metadata["overlay_volume"] = volume_name
+            metadata["overlay_upper_dir"] = upper_dir
+            return {volume_name: {"bind": container_path, "mode": "rw"}}
+        print("Warning: overlay workspace is not available on this Docker host. Falling back to copy mode.")
+        metadata["workspace_mode"] = "copy"
+    return None
+
+def remove_overlay_dirs(overlay_dir, image_tag):
+    """
+    Removes the overlay layers of a previous run.
+
+    The layers are written by the container's root user, so if the host user cannot
+    delete them a throwaway container is used instead.
+    """
+    if not os.path.exists(overlay_dir):
+        return
+    shutil.rmtree(overlay_dir, ignore_errors=True)
+    if os.path.exists(overlay_dir):
+        subprocess.run(['docker', 'run', '--rm', '-v', f'{os.path.abspath(overlay_dir)}:/overlay', image_tag, 'rm', '-rf', '/overlay/upper', '/overlay/work'],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(overlay_dir, ignore_errors=True)
+
+@span("docker.export_overlay")
+def export_overlay_upper(upper_dir, image_tag, dest_dir) -> int:
+    """
+    Applies the changes in an overlay upper layer onto `dest_dir`. See `export_overlay_changes`.
+
+    The layer is read by `tar` in a throwaway container, as root and with
+    CAP_SYS_ADMIN: the files were written by the container's root user, and
+    overlayfs marks opaque directories with trusted.* xattrs that only such a
+    process can read. Walking the layer on the host would silently keep the
+    old contents of opaque directories and fail on files created as 0600.
+
+    Raises:
+        RuntimeError: If the layer could not be read.
+    """
+    process = subprocess.Popen(
+        ['docker', 'run', '--rm', '--user', 'root', '--cap-add', 'SYS_ADMIN',
+         '-v', f'{os.path.abspath(upper_dir)}:/upper:ro', image_tag,
+         'tar', '--xattrs', '--xattrs-include=trusted.overlay.*', '--xattrs-include=user.overlay.*',
+         '-cf', '-', '-C', '/upper', '.'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    try:
+        with tarfile.open(fileobj=process.stdout, mode="r|") as upper:
+            changed = export_overlay_changes(upper, dest_dir)
+    except tarfile.TarError as e:
+        process.kill()
+        raise RuntimeError(f"could not read the overlay upper layer: {e}") from e
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read().decode("utf-8", errors="replace").strip()
+        process.wait()
+    if process.returncode != 0:
+        raise RuntimeError(f"reading the overlay upper layer failed: {stderr}")
+    return changed
+
+@span("locate_gradlew")
 def locate_or_import_gradlew(agent):
     """
     Finds the Gradle project root and imports the gradlew script if it doesn't exist.
     """
-    execute_command_in_container(agent.shell_socket, f"cd {agent.project_name}")
+    index = agent.file_index
+    execute_command_in_container(agent.shell_socket, f"cd {index.root}")
 
-    find_cmd = "find . -name gradlew"
-    gradlew_paths_str = execute_command_in_container(agent.shell_socket, find_cmd)
-    
-    if not gradlew_paths_str.strip():
+    gradlew_paths = index.find("gradlew")
+
+    if not gradlew_paths:
         print(f"gradlew not found in '{agent.project_name}'. Importing...")
-        cwd = execute_command_in_container(agent.shell_socket, "pwd")
-        with as_file(files("builDroid.files").joinpath("gradlew")) as gradlew_path:
-            try:
-                subprocess.run(['docker', 'cp', str(gradlew_path), f'{agent.container.id}:{cwd}/gradlew'], check=True)
-            except subprocess.CalledProcessError as e:
-                return f"Error copying gradlew: {e}"
-        chmod_cmd = f"chmod +x gradlew"
-        execute_command_in_container(agent.shell_socket, chmod_cmd)
+        gradlew_path = posixpath.join(index.root, "gradlew")
+        try:
+            index.write_files({gradlew_path: files("builDroid.files").joinpath("gradlew").read_bytes()})
+        except OSError as e:
+            return f"Error copying gradlew: {e}"
+        agent.channels.exec(["chmod", "+x", gradlew_path])
         return
-    
-    gradlew_paths = gradlew_paths_str.strip().split('\r\n')
-    root_gradlew_path = os.path.dirname(sorted(gradlew_paths, key=lambda p: p.count(os.path.sep))[0])
+
+    # The shallowest gradlew is the root of the Gradle build.
+    root_gradlew_path = posixpath.dirname(gradlew_paths[0])
+    index.project_root = root_gradlew_path
 
     execute_command_in_container(agent.shell_socket, f"cd {root_gradlew_path}")
-    execute_command_in_container(agent.shell_socket, "chmod +x gradlew")
+    agent.channels.exec(["chmod", "+x", gradlew_paths[0]])
     return
     
 
@@ -255,6 +423,170 @@ def _clean_output(raw_output: str, sent_command_strip: str, prompt_marker: str)
 
     return final_result
 
+def exec_in_container(container, cmd: list[str], workdir: str = None) -> tuple[int, bytes, bytes]:
+    """
+    Runs a command through a separate non-TTY exec, bypassing the persistent shell.
+
+    The output is not echoed or ANSI-formatted, and arguments are passed as a list,
+    so paths and file content never need shell quoting. Go through
+    `ContainerChannels.exec`, which limits the concurrent execs per container.
+
+    Returns:
+        tuple: (exit_code, stdout, stderr)
+    """
+    exit_code, (stdout, stderr) = container.exec_run(cmd, tty=False, demux=True, workdir=workdir)
+    return exit_code, stdout or b"", stderr or b""
+
+def get_shell_cwd(sock: socket.socket) -> str:
+    """Returns the current working directory of the persistent shell."""
+    return execute_command_in_container(sock, "pwd").strip()
+
+def resolve_container_path(agent, path: str) -> str:
+    """Resolves a path given by the agent against the persistent shell's working directory."""
+    if posixpath.isabs(path):
+        return posixpath.normpath(path)
+    return posixpath.normpath(posixpath.join(get_shell_cwd(agent.shell_socket), path))
+
+def read_file_from_container(channels: "ContainerChannels", path: str, max_bytes: int = MAX_FILE_READ_BYTES) -> bytes:
+    """
+    Reads a file from the container without going through the TTY shell.
+
+    Raises:
+        FileNotFoundError: If the file does not exist or cannot be read.
+        ValueError: If the file is larger than `max_bytes`.
+    """
+    exit_code, stdout, stderr = channels.exec(["head", "-c", str(max_bytes + 1), "--", path])
+    if exit_code != 0:
+        raise FileNotFoundError(stderr.decode("utf-8", errors="replace").strip() or f"Cannot read '{path}'")
+    if len(stdout) > max_bytes:
+        raise ValueError(f"'{path}' is larger than {max_bytes} bytes")
+    return stdout
+
+def read_file_lines_from_container(channels: "ContainerChannels", path: str, start_line: int, end_line: int = None) -> bytes:
+    """
+    Reads an inclusive, 1-based line range of a file from the container.
+
+    Raises:
+        FileNotFoundError: If the file does not exist or cannot be read.
+    """
+    line_range = f"{start_line},{end_line}p" if end_line else f"{start_line},$p"
+    exit_code, stdout, stderr = channels.exec(["sed", "-n", line_range, "--", path])
+    if exit_code != 0:
+        raise FileNotFoundError(stderr.decode("utf-8", errors="replace").strip() or f"Cannot read '{path}'")
+    return stdout
+
+def read_files_from_container(channels: "ContainerChannels", paths: list[str]) -> dict[str, bytes]:
+    """
+    Reads several files from the container in one transfer.
+
+    The files are packed with `tar` through a side exec, so the cost is one round
+    trip regardless of the number of files. Files that cannot be read are skipped.
+
+    Returns:
+        dict: A mapping of the absolute paths that could be read to their content.
+    """
+    if not paths:
+        return {}
+    _, stdout, _ = channels.exec(["tar", "-cf", "-", "--ignore-failed-read", "--", *paths])
+    contents = {}
+    try:
+        with tarfile.open(fileobj=io.BytesIO(stdout), mode="r:") as tar:
+            for member in tar:
+                if member.isfile():
+                    contents["/" + member.name.lstrip("/")] = tar.extractfile(member).read()
+    except tarfile.TarError as e:
+        logger.warn(f"Could not unpack files read from the container: {e}")
+    return contents
+
+def write_files_to_container(channels: "ContainerChannels", contents: dict[str, bytes | str]) -> None:
+    """
+    Writes several files to the container in one archive transfer.
+
+    Existing files keep their permission bits (e.g. an executable `gradlew`),
+    new files are created with 0644 and missing parent directories are created.
+
+    Args:
+        channels: The channels of the container to write to.
+        contents: A mapping of absolute container paths to their new content.
+
+    Raises:
+        OSError: If the archive could not be uploaded.
+    """
+    if not contents:
+        return
+    paths = list(contents.keys())
+    _, stdout, _ = channels.exec(["stat", "-c", "%a %n", "--", *paths])
+    modes = {}
+    for line in stdout.decode("utf-8", errors="replace").splitlines():
+        mode, _, name = line.partition(" ")
+        modes[name] = int(mode, 8)
+
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for path, data in contents.items():
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            info = tarfile.TarInfo(name=path.lstrip("/"))
+            info.size = len(data)
+            info.mode = modes.get(path, 0o644)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(data))
+    if not channels.put_archive(buffer.getvalue()):
+        raise OSError(f"Failed to upload {', '.join(paths)} to the container")
+
+def write_file_to_container(channels: "ContainerChannels", path: str, data: bytes | str) -> None:
+    """Writes a single file to the container. See `write_files_to_container`."""
+    write_files_to_container(channels, {path: data})
+
+class ContainerChannels:
+    """
+    The side channels builDroid uses to talk to one container.
+
+    Agent commands keep going through the agent's persistent shell (see
+    `execute_command_in_container`), whose working directory and environment
+    persist between commands. Side queries (file reads, `find`, version probes)
+    and background jobs such as SDK downloads go through this class instead, on
+    short-lived non-TTY exec channels, so they do not queue behind a long Gradle
+    or `sdkmanager` run in the shell. At most MAX_SIDE_CHANNELS of them run at
+    once per container, and background jobs may only hold
+    MAX_BACKGROUND_CHANNELS of those.
+    """
+
+    def __init__(self, container):
+        self.container = container
+        self._slots = threading.BoundedSemaphore(MAX_SIDE_CHANNELS)
+        self._background = ThreadPoolExecutor(
+            max_workers=MAX_BACKGROUND_CHANNELS,
+            thread_name_prefix=f"builDroid-{container.name}",
+        )
+
+    def exec(self, cmd: list[str], workdir: str = None) -> tuple[int, bytes, bytes]:
+        """Runs a side query on its own exec channel. See `exec_in_container`."""
+        with self._slots:
+            return exec_in_container(self.container, cmd, workdir=workdir)
+
+    def put_archive(self, data: bytes) -> bool:
+        """Extracts a tar archive at the container's root, on a side channel."""
+        with self._slots:
+            return self.container.put_archive("/", data)
+
+    def submit(self, cmd: list[str], workdir: str = None) -> Future:
+        """
+        Starts a background job on its own exec channel.
+
+        Returns:
+            Future: Resolves to (exit_code, stdout, stderr).
+        """
+        def job():
+            with span("docker.background_exec", command=" ".join(cmd)[:200]):
+                return self.exec(cmd, workdir)
+        # Run in a copy of the caller's context, so the job's span nests under the caller's.
+        return self._background.submit(contextvars.copy_context().run, job)
+
+    def close(self) -> None:
+        """Drops queued background jobs. Jobs already running end with the container."""
+        self._background.shutdown(wait=False, cancel_futures=True)
+
 def stop_and_remove(container):
     container.stop()
     container.remove()
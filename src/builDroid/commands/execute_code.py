@@ -3,6 +3,7 @@
 COMMAND_CATEGORY = "execute_code"
 COMMAND_CATEGORY_TITLE = "Execute Code"
 
+from builDroid.commands.android_sdk import runs_sdkmanager_or_gradle
 from builDroid.commands.docker_helpers_static import execute_command_in_container
 from builDroid.agents.agent import Agent
 from builDroid.models.command_decorator import command
@@ -40,6 +41,12 @@ def execute_shell(command: str, agent: Agent) -> str:
     elif "ls -R" in command:
         return "This command usually returns too much output, hence, it is not allowed."
     
+    if agent.sdk_prefetcher is not None and runs_sdkmanager_or_gradle(command):
+        # Builds and SDK installs must not race the background SDK download.
+        agent.sdk_prefetcher.wait()
     print(f"Executing command '{command}' in container {agent.container.name}...")
     output = execute_command_in_container(agent.shell_socket, command)
+    if agent.file_index is not None:
+        # Shell commands may edit build files behind the index's back.
+        agent.file_index.invalidate()
     return output
@@ -7,29 +7,58 @@ COMMAND_CATEGORY_TITLE = "File Operations"
 
 from builDroid.agents.agent import Agent
 from builDroid.models.command_decorator import command
-from builDroid.commands.docker_helpers_static import execute_command_in_container
+from builDroid.commands.docker_helpers_static import (
+    read_file_from_container,
+    read_file_lines_from_container,
+    resolve_container_path,
+    write_file_to_container,
+)
 
 @command(
     "read_file",
-    "Read an existing file",
+    "Read an existing file, optionally only a range of lines",
     {
         "file_path": {
             "type": "string",
             "description": "The path of the file to read",
             "required": True,
-        }
+        },
+        "start_line": {
+            "type": "integer",
+            "description": "The first line to read (1-based). Use it for large files",
+            "required": False,
+        },
+        "end_line": {
+            "type": "integer",
+            "description": "The last line to read (inclusive)",
+            "required": False,
+        },
     },
 )
-def read_file(file_path: str, agent: Agent) -> str:
+def read_file(file_path: str, agent: Agent, start_line: int = None, end_line: int = None) -> str:
     """Read a file and return the contents
 
     Args:
-        filename (str): The name of the file to read
+        file_path (str): The path of the file to read
+        start_line (int): The first line to read (1-based), if only a range is needed
+        end_line (int): The last line to read (inclusive)
 
     Returns:
         str: The contents of the file
     """
-    return execute_command_in_container(agent.shell_socket, f'cat {file_path}')
+    path = resolve_container_path(agent, file_path)
+    try:
+        if start_line or end_line:
+            content = read_file_lines_from_container(
+                agent.channels, path, int(start_line or 1), int(end_line) if end_line else None
+            )
+        else:
+            content = read_file_from_container(agent.channels, path)
+    except FileNotFoundError as e:
+        return f"Error: {e}"
+    except ValueError as e:
+        return f"Error: {e}. Read it in parts using start_line and end_line."
+    return content.decode("utf-8", errors="replace")
 
 @command(
     "write_to_file",
@@ -60,11 +89,11 @@ def write_to_file(filename: str, text: str, agent: Agent) -> str:
     """
     print("Writing file in the container...")
     print("FILENAME:", filename)
-    delimiter = "---END_OF_FILE_CONTENT---"
-    command = f"cat <<'{delimiter}' > {filename}\n{text}\n{delimiter}"
-    write_result = execute_command_in_container(agent.shell_socket, command)
-    if delimiter in write_result:
-        return "File written successfully."
-    else:
-        return write_result
-    
\ No newline at end of file
+    path = resolve_container_path(agent, filename)
+    try:
+        write_file_to_container(agent.channels, path, text)
+    except Exception as e:
+        return f"Error: Failed to write {filename}: {e}"
+    if agent.file_index is not None:
+        agent.file_index.invalidate(path)
+    return "File written successfully."
@@ -5,11 +5,11 @@ COMMAND_CATEGORY_TITLE = "Gradle Build Error Solver"
 
 import os
 import re
-from importlib.resources import files, as_file
-import subprocess
+from importlib.resources import files
 
 from builDroid.commands.docker_helpers_static import execute_command_in_container
-from builDroid.commands.file_operations import write_to_file
+from builDroid.commands.android_sdk import sdkmanager_command
+from builDroid.commands.gradle_project import GradleProject
 from builDroid.agents.agent import Agent
 from builDroid.models.command_decorator import command
 
@@ -17,65 +17,20 @@ RES_DIR = "builDroid.files"
 GRADLE_RES_DIR = os.path.join(RES_DIR, "build", "gradle")
 GRADLE_WRAPPER_DIR = os.path.join(GRADLE_RES_DIR, "wrapper", "gradle")
 
-def _get_agp_version_from_project(agent: Agent) -> str | None:
-    """Scans common build files to find the declared AGP version."""
-    build_files_to_check = ["build.gradle.kts", "build.gradle"]
-    pattern = re.compile(
-        r"""(?:id|classpath)\s*\(?\s*["']com\.android\.(?:application|library|tools\.build:gradle)["']\s*\)?\s*(?:version\s*)?["']([^"']+)["']""",
-        re.VERBOSE
-    )
-    for file_path in build_files_to_check:
-        content = execute_command_in_container(agent.shell_socket, f"cat {file_path}")
-        if "No such file or directory" in content:
-            continue
-        match = pattern.search(content)
-        if match:
-            version = match.group(1)
-            print(f"  -> Found AGP version '{version}' in '{file_path}'.")
-            return version
-    return None
-
-def _update_agp_version_in_file(agent: Agent, file_path: str, target_version: str) -> bool:
-    """Safely updates the AGP version in a given Gradle build file."""
-    original_content = execute_command_in_container(agent.shell_socket, f"cat {file_path}")
-    if "No such file or directory" in original_content:
-        return False
-    
-    # This regex is designed to find the AGP dependency in various forms:
-    # 1. `plugins` block: id("com.android.application") version "..."
-    # 2. `buildscript` block: "com.android.tools.build:gradle:..."
-    # It captures the prefix (group 1) and the suffix (group 3) around the version number.
-    pattern = re.compile(
-        r"""
-        # This is group 1: the prefix before the version number.
-        (
-            (?: # A non-capturing group for the two alternatives (modern vs. legacy).
-                # Alternative 1: Modern plugins block, e.g., id("...") version "..."
-                # It looks for 'id(...) version "'
-                id\s*\(\s*["']com\.android\.(?:application|library)["']\s*\)\s*version\s*["']
-            | 
-                # Alternative 2: Legacy buildscript, e.g., classpath "...:gradle:..."
-                # It looks for 'classpath "...:gradle:'
-                (?:classpath)\s*\(?\s*["']com\.android\.tools\.build:gradle:
-            )
-        )
-        # This is group 2: the actual version string to be replaced.
-        ([^"']+)
-        # This is group 3: the closing quote that follows the version.
-        (["'])
-        """,
-        re.VERBOSE
-    )
+def _read_project_file(agent: Agent, file_path: str) -> str | None:
+    """Reads a file relative to the Gradle root through the file index, or returns None if it is missing."""
+    return agent.file_index.read(file_path)
 
-    # Replace the old version with the target version
-    new_content, count = pattern.subn(rf"\g<1>{target_version}\g<3>", original_content)
+def _write_project_file(agent: Agent, file_path: str, content: str) -> None:
+    """Writes a file relative to the Gradle root through the file index."""
+    agent.file_index.write_files({file_path: content})
 
-    if count > 0:
-        print(f"  -> Found and updated AGP version in '{file_path}'.")
-        # Safely write the modified content back to the file
-        write_to_file(file_path, new_content, agent)
-        return True
-    return False
+def _get_agp_version_from_project(agent: Agent) -> str | None:
+    """Scans every Gradle script of the project to find the declared AGP version."""
+    version = GradleProject.load(agent.file_index).agp_version()
+    if version:
+        print(f"  -> Found AGP version '{version}' in the project.")
+    return version
 
 @command(
     "fix_wrapper_mismatch",
@@ -120,25 +75,17 @@ def fix_wrapper_mismatch(agp_version: str, agent: Agent):
 )
 def import_gradle_wrapper(filename: str, agent: Agent):
     print("Importing Gradle Wrapper files into the project...")
-    # Ensure the 'gradle' directory exists
-    mkdir_cmd = f"mkdir -p gradle/wrapper"
-    execute_command_in_container(agent.shell_socket, mkdir_cmd)
-    cwd = execute_command_in_container(agent.shell_socket, "pwd")
-    # Copy the wrapper contents from resources
-    if "gradle-wrapper.jar" not in execute_command_in_container(agent.shell_socket, f"find . -name \"gradle-wrapper.jar\""):
-        with as_file(files("builDroid.files").joinpath("gradle-wrapper.jar")) as host_path_to_wrapper_jar:
-            # Copy the gradle wrapper jar file
-            try:
-                subprocess.run(['docker', 'cp', str(host_path_to_wrapper_jar), f'{agent.container.id}:{cwd}/gradle/wrapper/gradle-wrapper.jar'], check=True)
-            except subprocess.CalledProcessError as e:
-                return (f"Error copying gradle-wrapper.jar: {e}")
-    if "gradle-wrapper.properties" not in execute_command_in_container(agent.shell_socket, f"find . -name \"gradle-wrapper.properties\""):
-        with as_file(files("builDroid.files").joinpath("gradle-wrapper.properties")) as host_path_to_wrapper_properties:
-            # Copy the gradle wrapper properties file
-            try:
-                subprocess.run(['docker', 'cp', str(host_path_to_wrapper_properties), f'{agent.container.id}:{cwd}/gradle/wrapper/gradle-wrapper.properties'], check=True)
-            except subprocess.CalledProcessError as e:
-                return (f"Error copying gradle-wrapper.properties: {e}")
+    index = agent.file_index
+    # Copy the wrapper contents from resources in one transfer; the parent directories are created on upload.
+    wrapper_files = {}
+    if not index.find("gradle-wrapper.jar"):
+        wrapper_files["gradle/wrapper/gradle-wrapper.jar"] = files("builDroid.files").joinpath("gradle-wrapper.jar").read_bytes()
+    if not index.find("gradle-wrapper.properties"):
+        wrapper_files["gradle/wrapper/gradle-wrapper.properties"] = files("builDroid.files").joinpath("gradle-wrapper.properties").read_text(encoding="utf-8")
+    try:
+        index.write_files(wrapper_files)
+    except OSError as e:
+        return f"Error copying gradle wrapper files: {e}"
     return "Successfully copied gradle wrapper files to the project root."
 
 @command(
@@ -154,17 +101,16 @@ def import_gradle_wrapper(filename: str, agent: Agent):
 )
 def import_gradlew_exec(version: str, agent: Agent):
     print("Importing gradlew executable script...")
-    cwd = execute_command_in_container(agent.shell_socket, "pwd")
-    with as_file(files("builDroid.files").joinpath("gradlew")) as gradlew_path:
-        try:
-            subprocess.run(['docker', 'cp', str(gradlew_path), f'{agent.container.id}:{cwd}/gradlew'], check=True)
-        except subprocess.CalledProcessError as e:
-            return f"Error copying gradlew: {e}"
-    chmod_cmd = f"chmod +x gradlew"
-    output = execute_command_in_container(agent.shell_socket, chmod_cmd)
-    if output == "":
+    index = agent.file_index
+    gradlew_path = index.resolve("gradlew")
+    try:
+        index.write_files({gradlew_path: files("builDroid.files").joinpath("gradlew").read_bytes()})
+    except OSError as e:
+        return f"Error copying gradlew: {e}"
+    exit_code, stdout, stderr = agent.channels.exec(["chmod", "+x", gradlew_path])
+    if exit_code == 0:
         return "Successfully copied and made gradlew executable."
-    return f"Failed to make gradlew executable: {output}"
+    return f"Failed to make gradlew executable: {(stdout + stderr).decode('utf-8', errors='replace')}"
 
 @command(
     "download_sdk_platform",
@@ -178,8 +124,10 @@ def import_gradlew_exec(version: str, agent: Agent):
     },
 )
 def download_sdk_platform(version: str, agent: Agent):
+    if agent.sdk_prefetcher and agent.sdk_prefetcher.is_installed(f"platforms;android-{version}"):
+        return f"Android SDK platform {version} is already installed."
     print(f"Required platform version: {version}. Attempting download.")
-    download_cmd = f"yes | sdkmanager \"platforms;android-{version}\""
+    download_cmd = sdkmanager_command([f"platforms;android-{version}"])
     return execute_command_in_container(agent.shell_socket, download_cmd)
 
 @command(
@@ -194,8 +142,10 @@ def download_sdk_platform(version: str, agent: Agent):
     },
 )
 def download_sdk_build_tools(version: str, agent: Agent):
+    if agent.sdk_prefetcher and agent.sdk_prefetcher.is_installed(f"build-tools;{version}"):
+        return f"Android SDK Build Tools {version} are already installed."
     print(f"Required build-tools version: {version}. Attempting download.")
-    download_cmd = f"yes | sdkmanager \"build-tools;{version}\""
+    download_cmd = sdkmanager_command([f"build-tools;{version}"])
     return execute_command_in_container(agent.shell_socket, download_cmd)
 
 @command(
@@ -213,15 +163,15 @@ def upgrade_agp_version(command: str, agent: Agent):
     print("Upgrading AGP version to a compatible baseline...")
     min_agp_version = "3.6.3"  # Minimum AGP version that supports google() repository shortcut
     
-    # 1. Update the AGP version in all relevant build files.
+    # 1. Update the AGP version in all build scripts of the project.
     print(f"Setting AGP version to a compatible baseline: {min_agp_version}.")
-    agp_updated = False
-    for build_file in ["build.gradle.kts", "build.gradle"]:
-        if _update_agp_version_in_file(agent, build_file, min_agp_version):
-            agp_updated = True
-    
-    if not agp_updated:
+    project = GradleProject.load(agent.file_index)
+    updated_scripts = project.set_agp_version(min_agp_version)
+    if not updated_scripts:
         return f"Error: Could not find and update the AGP version to {min_agp_version} in any build file."
+    for script in updated_scripts:
+        print(f"  -> Found and updated AGP version in '{script.path}'.")
+    project.flush()
 
     # 2. Now that AGP is updated, call the synchronizer to fix the wrapper.
     # We pass the original command to the next function in the chain.
@@ -231,65 +181,6 @@ def upgrade_agp_version(command: str, agent: Agent):
         return "Successfully upgraded AGP and synchronized Gradle Wrapper."
     return "Successfully upgraded AGP, but failed to synchronize Gradle Wrapper."
 
-def _add_google_repo_to_file(agent: Agent, file_path: str) -> bool:
-    """
-    Reads a Gradle file, adds google() to repository blocks if missing,
-    and writes the content back.
-
-    Args:
-        agent: The agent instance for shell execution.
-        file_path: The path to the Gradle file (e.g., 'settings.gradle.kts').
-
-    Returns:
-        True if the file was modified, False otherwise.
-    """
-    # Read the file content from the container
-    cat_cmd = f"cat {file_path}"
-    original_content = execute_command_in_container(agent.shell_socket, cat_cmd)
-    if "No such file or directory" in original_content:
-        return False
-    
-    print(f"Checking for missing google() repo in '{file_path}'...")
-    
-
-    # This function is used with re.sub to replace repository blocks.
-    # It checks if 'google()' is present and adds it if not.
-    def replacer(match):
-        # The pattern captures three groups:
-        # 1. The opening part: `repositories {`
-        # 2. The content inside the braces.
-        # 3. The closing brace: `}`
-        opening, content, closing = match.groups()
-        
-        # Check if google() is already present in the block's content.
-        # \b ensures we match the whole word 'google'.
-        if re.search(r"\bgoogle\(\)", content):
-            return match.group(0)  # Return the original, unmodified block
-        else:
-            # Add google() right after the opening brace with standard indentation.
-            # This is much safer than appending to the end of the file.
-            print(f"  -> Adding google() to a repositories block in '{file_path}'.")
-            # Determine indentation from the line of the opening brace
-            start_index = match.start(1)
-            line_start_index = original_content.rfind('\n', 0, start_index) + 1
-            indentation = original_content[line_start_index:start_index]
-            
-            # For Kotlin DSL (.kts), a newline is often preferred. For Groovy, it's flexible.
-            # Adding it at the top of the block is a common and safe convention.
-            return f"{opening}\n{indentation}    google()\n{content.lstrip()}{closing}"
-
-    # The regex finds `repositories { ... }` blocks.
-    # It's non-greedy `([\s\S]*?)` to handle multiple repository blocks in one file correctly.
-    pattern = re.compile(r"(repositories\s*\{)([\s\S]*?)(\})")
-    new_content, num_substitutions = pattern.subn(replacer, original_content)
-
-    if num_substitutions > 0:
-        # If changes were made, write the new content back to the file.
-        write_to_file(file_path, new_content, agent)
-        return True
-
-    return False
-
 @command(
     "add_google_repo",
     "Adds the Google maven repository to the project",
@@ -304,24 +195,18 @@ def _add_google_repo_to_file(agent: Agent, file_path: str) -> bool:
 def add_google_repo(filename: str, agent: Agent):
     print("Adding google() repository to Gradle build files...")
 
-    # List of common Gradle files where repositories are defined.
-    # Modern Gradle prefers settings.gradle(.kts), so we check those first.
-    build_files = [
-        "settings.gradle.kts",
-        "settings.gradle",
-        "build.gradle.kts",
-        "build.gradle",
-    ]
-
-    was_modified = False
-    for file in build_files:
-        if _add_google_repo_to_file(agent, file):
-            was_modified = True
-
-    if was_modified:
+    # Every settings and build script of every module is checked, and all
+    # changed scripts are written back in one transfer.
+    project = GradleProject.load(agent.file_index)
+    modified_scripts = project.ensure_google_repo()
+    for script in modified_scripts:
+        print(f"  -> Adding google() to repositories blocks in '{script.path}'.")
+    project.flush()
+
+    if modified_scripts:
         return "Successfully added google() repository to project configuration."
     else:
-        return "No missing google() repository found in any standard Gradle build files; no changes made."
+        return "No missing google() repository found in any Gradle build files; no changes made."
 
 @command(
     "generate_local_properties",
@@ -337,17 +222,16 @@ def add_google_repo(filename: str, agent: Agent):
 def generate_local_properties(filename: str, agent: Agent):
     # 1. Command to find the SDK path.
     # It checks standard environment variables first, then falls back to common locations.
+    # The probes run through a separate exec, so their output is not mixed with the shell echo.
     find_sdk_cmd = (
-        "sh -c '"
         "if [ -n \"$ANDROID_SDK_ROOT\" ]; then echo \"$ANDROID_SDK_ROOT\"; "
         "elif [ -n \"$ANDROID_HOME\" ]; then echo \"$ANDROID_HOME\"; "
         "elif [ -d \"/opt/android-sdk\" ]; then echo \"/opt/android-sdk\"; "
         "elif [ -d \"/usr/lib/android-sdk\" ]; then echo \"/usr/lib/android-sdk\"; "
         "else echo \"SDK_NOT_FOUND\"; fi"
-        "'"
     )
-    sdk_path_out = execute_command_in_container(agent.shell_socket, find_sdk_cmd)
-    sdk_path = sdk_path_out.strip().split("fi\'\r\n\r")[1] 
+    _, sdk_path_out, _ = agent.channels.exec(["sh", "-c", find_sdk_cmd])
+    sdk_path = sdk_path_out.decode("utf-8", errors="replace").strip()
 
     if sdk_path == "SDK_NOT_FOUND" or not sdk_path:
         return f"Error: Could not determine Android SDK path inside the container."
@@ -357,26 +241,24 @@ def generate_local_properties(filename: str, agent: Agent):
     # 2. Command to find the latest NDK version directory within the SDK path.
     # `ls -1` lists one file per line. `2>/dev/null` suppresses errors if 'ndk' dir doesn't exist.
     # `tail -n 1` gets the last entry, which is often the latest version.
-    find_ndk_cmd = f"sh -c 'ls -1 {sdk_path}/ndk 2>/dev/null | tail -n 1'"
-    ndk_version_dir_out = execute_command_in_container(agent.shell_socket, find_ndk_cmd)
-    ndk_version_dir = ndk_version_dir_out.strip().split("tail -n 1'\r\n\r")[1]
+    find_ndk_cmd = f"ls -1 {sdk_path}/ndk 2>/dev/null | tail -n 1"
+    _, ndk_version_dir_out, _ = agent.channels.exec(["sh", "-c", find_ndk_cmd])
+    ndk_version_dir = ndk_version_dir_out.decode("utf-8", errors="replace").strip()
 
     # 3. Construct the properties file content
-    # Use double newlines for clarity in the echo command.
-    properties_content = f"sdk.dir={sdk_path}\\n" \
-                         f"sdk-location={sdk_path}\\n"
+    properties_content = f"sdk.dir={sdk_path}\n" \
+                         f"sdk-location={sdk_path}\n"
 
     if ndk_version_dir:
         ndk_path = f"{sdk_path}/ndk/{ndk_version_dir}"
         print(f"Discovered NDK path: {ndk_path}")
-        properties_content += f"ndk.dir={ndk_path}\\n" \
-                              f"ndk-location={ndk_path}\\n"
+        properties_content += f"ndk.dir={ndk_path}\n" \
+                              f"ndk-location={ndk_path}\n"
     else:
         print("Warning: NDK not found within SDK path. local.properties will not contain NDK paths.")
 
     # 4. Write the content to the local.properties file in the project root.
-    # The `echo -e` command interprets the \n characters as newlines.
-    write_to_file("local.properties", properties_content, agent)
+    _write_project_file(agent, "local.properties", properties_content)
 
     return "Successfully generated and wrote local.properties."
 
@@ -392,25 +274,21 @@ def generate_local_properties(filename: str, agent: Agent):
     },
 )
 def fix_build_tools_cpu_error(version: str, agent: Agent):
-    # 1. Download the new version
-    download_cmd = f"yes | sdkmanager \"build-tools;{version}\""
-    execute_command_in_container(agent.shell_socket, download_cmd)
-
-    # 2. Find all build.gradle files and replace the version string
-    find_cmd = "find . -name 'build.gradle'"
-    build_files_out = execute_command_in_container(agent.shell_socket, find_cmd)
-
-    for bld_file in build_files_out.strip().split('\n'):
-        if not bld_file: continue
-        print(f"Updating buildToolsVersion in {bld_file}...")
-        # This sed command finds `buildToolsVersion "x.y.z"` and replaces x.y.z
-        replace_cmd = (
-            f"sed -i -E \"s/(buildToolsVersion[[:space:]]*=?[[:space:]]*[\"'])[0-9.]+([\"'])/\\1{version}\\2/\" "
-            f"'{bld_file}'"
-        )
-        execute_command_in_container(agent.shell_socket, replace_cmd)
-
-    return f"Build Tools upgraded to {version} and updated in all build.gradle files."
+    # 1. Download the new version, unless the prefetch already did
+    if not (agent.sdk_prefetcher and agent.sdk_prefetcher.is_installed(f"build-tools;{version}")):
+        download_cmd = sdkmanager_command([f"build-tools;{version}"])
+        execute_command_in_container(agent.shell_socket, download_cmd)
+
+    # 2. Replace the version string in the build scripts of every module
+    project = GradleProject.load(agent.file_index)
+    changed = project.set_build_tools_version(version)
+    for script in changed:
+        print(f"Updating buildToolsVersion in {script.path}...")
+    project.flush()
+
+    if not changed:
+        return f"Build Tools {version} installed, but no build file declares a different buildToolsVersion; no build files changed."
+    return f"Build Tools upgraded to {version} and updated in: {', '.join(script.path for script in changed)}."
 
 @command(
     "update_gradle_wrapper",
@@ -427,8 +305,8 @@ def update_gradle_wrapper(version: str, agent: Agent):
     """Safely updates the Gradle version in gradle-wrapper.properties."""
     wrapper_properties_file = "gradle/wrapper/gradle-wrapper.properties"
 
-    original_content = execute_command_in_container(agent.shell_socket, f"cat {wrapper_properties_file}")
-    if "No such file or directory" in original_content:
+    original_content = _read_project_file(agent, wrapper_properties_file)
+    if original_content is None:
         return f"Error: Gradle Wrapper properties file not found."
     
     # Regex to find and replace the Gradle version in the distributionUrl
@@ -437,7 +315,7 @@ def update_gradle_wrapper(version: str, agent: Agent):
     
     if count > 0:
         print(f"  -> Updating Gradle Wrapper to version {version} in '{wrapper_properties_file}'.")
-        write_to_file(wrapper_properties_file, new_content, agent)
+        _write_project_file(agent, wrapper_properties_file, new_content)
         return f"Successfully updated Gradle Wrapper to version {version}."
 
     return f"Error: Gradle Wrapper is already up-to-date."
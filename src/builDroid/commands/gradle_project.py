@@ -0,0 +1,245 @@
+"""A model of all Gradle scripts in the project, with typed queries and batched edits"""
+
+from __future__ import annotations
+
+import posixpath
+import re
+from dataclasses import dataclass
+
+from builDroid.commands.project_index import ProjectFileIndex
+
+GRADLE_SCRIPT_NAMES = ("settings.gradle.kts", "settings.gradle", "build.gradle.kts", "build.gradle")
+
+# Matches the AGP declaration in a `plugins` block or a legacy `buildscript` classpath.
+AGP_VERSION_PATTERN = re.compile(
+    r"""id\s*\(?\s*["']com\.android\.(?:application|library)["']\s*\)?\s*version\s*\(?\s*["']([^"']+)["']"""
+    r"""|classpath\s*\(?\s*["']com\.android\.tools\.build:gradle:([^"']+)["']""",
+)
+# Same as above, but capturing the prefix (group 1) and the closing quote (group 3)
+# around the version (group 2), so the version can be replaced in place.
+AGP_VERSION_REPLACE_PATTERN = re.compile(
+    r"""
+    (
+        (?:
+            # Modern plugins block, e.g., id("com.android.application") version "..."
+            id\s*\(\s*["']com\.android\.(?:application|library)["']\s*\)\s*version\s*["']
+        |
+            # Legacy buildscript, e.g., classpath "com.android.tools.build:gradle:..."
+            (?:classpath)\s*\(?\s*["']com\.android\.tools\.build:gradle:
+        )
+    )
+    ([^"']+)
+    (["'])
+    """,
+    re.VERBOSE,
+)
+BUILD_TOOLS_VERSION_PATTERN = re.compile(r"""(buildToolsVersion\s*=?\s*\(?\s*["'])([0-9.]+)(["'])""")
+COMPILE_SDK_PATTERN = re.compile(r"""\bcompileSdk(?:Version)?\s*=?\s*\(?\s*["']?(?:android-)?(\d+)""")
+TARGET_SDK_PATTERN = re.compile(r"""\btargetSdk(?:Version)?\s*=?\s*\(?\s*["']?(\d+)""")
+NDK_VERSION_PATTERN = re.compile(r"""\bndkVersion\s*=?\s*\(?\s*["']([0-9.]+)["']""")
+
+
+@dataclass
+class GradleScript:
+    path: str
+    """The absolute path of the script inside the container."""
+    module: str
+    """The Gradle module path, e.g. `:` for the root project or `:app`."""
+    original: str
+    content: str
+
+    @property
+    def is_settings(self) -> bool:
+        return posixpath.basename(self.path).startswith("settings.gradle")
+
+    @property
+    def changed(self) -> bool:
+        return self.content != self.original
+
+
+def _find_blocks(content: str, name: str) -> list[tuple[int, int, int]]:
+    """
+    Finds `name { ... }` blocks, matching nested braces. Braces in strings and
+    comments are not counted.
+
+    Returns:
+        list: (start, open_brace, close_brace) offsets for each block.
+    """
+    blocks = []
+    for match in re.finditer(rf"\b{re.escape(name)}\s*\{{", content):
+        open_brace = match.end() - 1
+        depth = 0
+        quote = None
+        i = open_brace
+        while i < len(content):
+            char = content[i]
+            if quote:
+                if char == "\\":
+                    i += 1
+                elif char == quote:
+                    quote = None
+            elif char in "\"'":
+                quote = char
+            elif content.startswith("//", i):
+                newline = content.find("\n", i)
+                i = len(content) if newline == -1 else newline
+                continue
+            elif content.startswith("/*", i):
+                comment_end = content.find("*/", i + 2)
+                i = len(content) if comment_end == -1 else comment_end + 2
+                continue
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    blocks.append((match.start(), open_brace, i))
+                    break
+            i += 1
+    return blocks
+
+
+def update_agp_version(content: str, target_version: str) -> str:
+    """Replaces every AGP version declaration in a script."""
+    return AGP_VERSION_REPLACE_PATTERN.sub(rf"\g<1>{target_version}\g<3>", content)
+
+
+def add_google_repo(content: str) -> str:
+    """Adds `google()` to every repositories block that does not have it yet."""
+    # Work backwards so the offsets of earlier blocks stay valid.
+    for start, open_brace, close_brace in reversed(_find_blocks(content, "repositories")):
+        if re.search(r"\bgoogle\(\)", content[open_brace:close_brace]):
+            continue
+        line_start = content.rfind("\n", 0, start) + 1
+        indentation = content[line_start:start]
+        if not indentation.isspace():
+            indentation = ""
+        content = f"{content[:open_brace + 1]}\n{indentation}    google(){content[open_brace + 1:]}"
+    return content
+
+
+class GradleProject:
+    """
+    All Gradle scripts of a (multi-module) project, loaded once.
+
+    Queries run on the in-memory content. Edits are applied in memory as well,
+    and `flush` writes every changed script back to the container in one transfer.
+    """
+
+    def __init__(self, index: ProjectFileIndex, scripts: list[GradleScript]):
+        self.index = index
+        self.scripts = scripts
+
+    @classmethod
+    def load(cls, index: ProjectFileIndex) -> GradleProject:
+        """Loads every Gradle script under the Gradle root in one transfer."""
+        root = index.project_root
+        paths = [
+            path
+            for name in GRADLE_SCRIPT_NAMES
+            for path in index.find(name)
+            if path == root or path.startswith(root.rstrip("/") + "/")
+        ]
+        contents = index.read_many(paths)
+        scripts = []
+        for path in paths:
+            if path not in contents:
+                continue
+            relative_dir = posixpath.relpath(posixpath.dirname(path), root)
+            module = ":" if relative_dir == "." else ":" + relative_dir.replace("/", ":")
+            scripts.append(GradleScript(path=path, module=module, original=contents[path], content=contents[path]))
+        # Root scripts first, then modules in path order.
+        scripts.sort(key=lambda s: (s.module != ":", s.module, not s.is_settings))
+        return cls(index, scripts)
+
+    @property
+    def build_scripts(self) -> list[GradleScript]:
+        return [s for s in self.scripts if not s.is_settings]
+
+    # --- Queries ---
+
+    def agp_version(self) -> str | None:
+        """Returns the declared AGP version, looking at the root scripts first."""
+        for script in self.scripts:
+            match = AGP_VERSION_PATTERN.search(script.content)
+            if match:
+                return match.group(1) or match.group(2)
+        return None
+
+    def repositories_blocks(self) -> list[tuple[GradleScript, str]]:
+        """Returns every `repositories { ... }` block along with the script declaring it."""
+        return [
+            (script, script.content[start:close_brace + 1])
+            for script in self.scripts
+            for start, _, close_brace in _find_blocks(script.content, "repositories")
+        ]
+
+    def _module_values(self, pattern: re.Pattern, group: int) -> dict[str, str]:
+        """Returns the first match of `pattern` in each module's build script."""
+        values = {}
+        for script in self.build_scripts:
+            match = pattern.search(script.content)
+            if match:
+                values[script.module] = match.group(group)
+        return values
+
+    def build_tools_versions(self) -> dict[str, str]:
+        """Returns the `buildToolsVersion` of each module that declares one."""
+        return self._module_values(BUILD_TOOLS_VERSION_PATTERN, 2)
+
+    def compile_sdk_versions(self) -> dict[str, str]:
+        """Returns the compileSdk (API level) of each module that declares a literal one."""
+        return self._module_values(COMPILE_SDK_PATTERN, 1)
+
+    def target_sdk_versions(self) -> dict[str, str]:
+        """Returns the targetSdk (API level) of each module that declares a literal one."""
+        return self._module_values(TARGET_SDK_PATTERN, 1)
+
+    def ndk_versions(self) -> dict[str, str]:
+        """Returns the `ndkVersion` of each module that declares one."""
+        return self._module_values(NDK_VERSION_PATTERN, 1)
+
+    # --- Batched edits ---
+
+    def set_agp_version(self, version: str) -> list[GradleScript]:
+        """Sets the AGP version wherever it is declared. Returns the scripts that changed."""
+        changed = []
+        for script in self.scripts:
+            new_content = update_agp_version(script.content, version)
+            if new_content != script.content:
+                script.content = new_content
+                changed.append(script)
+        return changed
+
+    def ensure_google_repo(self) -> list[GradleScript]:
+        """Adds `google()` to every repositories block missing it. Returns the scripts that changed."""
+        changed = []
+        for script in self.scripts:
+            new_content = add_google_repo(script.content)
+            if new_content != script.content:
+                script.content = new_content
+                changed.append(script)
+        return changed
+
+    def set_build_tools_version(self, version: str) -> list[GradleScript]:
+        """Sets `buildToolsVersion` in every module declaring it. Returns the scripts that changed."""
+        changed = []
+        for script in self.build_scripts:
+            new_content = BUILD_TOOLS_VERSION_PATTERN.sub(rf"\g<1>{version}\g<3>", script.content)
+            if new_content != script.content:
+                script.content = new_content
+                changed.append(script)
+        return changed
+
+    def flush(self) -> list[str]:
+        """
+        Writes all changed scripts to the container in one transfer.
+
+        Returns:
+            list: The paths that were written.
+        """
+        changed = {script.path: script.content for script in self.scripts if script.changed}
+        self.index.write_files(changed)
+        for script in self.scripts:
+            script.original = script.content
+        return list(changed)
@@ -0,0 +1,169 @@
+"""An index of the project's build files inside the container"""
+
+from __future__ import annotations
+
+import posixpath
+
+from builDroid.commands.docker_helpers_static import (
+    ContainerChannels,
+    read_file_from_container,
+    read_files_from_container,
+    write_files_to_container,
+)
+from builDroid.logs import logger
+
+# Files the Gradle error solver needs to look at.
+INDEXED_FILE_NAMES = (
+    "build.gradle",
+    "build.gradle.kts",
+    "settings.gradle",
+    "settings.gradle.kts",
+    "gradle.properties",
+    "local.properties",
+    "gradle-wrapper.properties",
+    "gradle-wrapper.jar",
+    "gradlew",
+    "AndroidManifest.xml",
+)
+# Directories that never contain project build files but can be huge.
+PRUNED_DIR_NAMES = ("build", ".git", ".gradle", ".idea", "node_modules")
+
+
+class ProjectFileIndex:
+    """
+    Keeps the list of build files in the project and caches their content.
+
+    The index is built with a single `find` run through a side exec after the
+    workspace is uploaded. Writes made through builDroid's own commands update
+    it directly; anything else (e.g. a `sed` run by the agent) is picked up by
+    marking the index stale, which triggers one mtime rescan on the next query.
+    Cached content is only re-read for files whose mtime changed.
+    """
+
+    def __init__(self, channels: ContainerChannels, root: str):
+        self.channels = channels
+        self.root = root
+        """The project directory inside the container."""
+        self.project_root = root
+        """The Gradle root (the directory holding `gradlew`), set by `locate_or_import_gradlew`."""
+        self._mtimes: dict[str, float | None] = {}
+        self._contents: dict[str, tuple[float | None, str]] = {}
+        self._stale = True
+
+    def scan(self) -> None:
+        """Lists the indexed files and their mtimes in one exec."""
+        prune = []
+        for name in PRUNED_DIR_NAMES:
+            prune += ["-name", name, "-o"]
+        select = []
+        for name in INDEXED_FILE_NAMES:
+            select += ["-name", name, "-o"]
+        cmd = [
+            "find", self.root,
+            "(", "-type", "d", "(", *prune[:-1], ")", "-prune", ")", "-o",
+            "(", "-type", "f", "(", *select[:-1], ")", "-printf", "%T@ %p\\n", ")",
+        ]
+        exit_code, stdout, stderr = self.channels.exec(cmd)
+        if exit_code != 0 and not stdout:
+            logger.warn(f"Project file index scan failed: {stderr.decode('utf-8', errors='replace').strip()}")
+            return
+        mtimes = {}
+        for line in stdout.decode("utf-8", errors="replace").splitlines():
+            mtime, _, path = line.partition(" ")
+            if path:
+                mtimes[path] = float(mtime)
+        self._mtimes = mtimes
+        # Drop cached content of files that changed or disappeared since the last scan.
+        self._contents = {
+            path: cached for path, cached in self._contents.items()
+            if path in mtimes and cached[0] == mtimes[path]
+        }
+        self._stale = False
+
+    def invalidate(self, path: str | None = None) -> None:
+        """
+        Marks the index as out of date.
+
+        Args:
+            path: A single file that changed. If omitted, the next query rescans the project.
+        """
+        if path is None:
+            self._stale = True
+        else:
+            self._contents.pop(path, None)
+            if posixpath.basename(path) in INDEXED_FILE_NAMES:
+                self._mtimes[path] = None
+
+    def _ensure_fresh(self) -> None:
+        if self._stale:
+            self.scan()
+
+    def resolve(self, path: str) -> str:
+        """Resolves a path relative to the Gradle root."""
+        if posixpath.isabs(path):
+            return posixpath.normpath(path)
+        return posixpath.normpath(posixpath.join(self.project_root, path))
+
+    def find(self, name: str) -> list[str]:
+        """Returns the paths of the indexed files called `name`, shallowest first."""
+        self._ensure_fresh()
+        matches = [path for path in self._mtimes if posixpath.basename(path) == name]
+        return sorted(matches, key=lambda p: (p.count("/"), p))
+
+    def exists(self, path: str) -> bool:
+        self._ensure_fresh()
+        return self.resolve(path) in self._mtimes
+
+    def read(self, path: str) -> str | None:
+        """
+        Returns the content of a file, or None if it does not exist.
+
+        Indexed files are served from the cache while their mtime is unchanged.
+        """
+        self._ensure_fresh()
+        path = self.resolve(path)
+        indexed = posixpath.basename(path) in INDEXED_FILE_NAMES
+        if indexed and path not in self._mtimes:
+            return None
+        cached = self._contents.get(path)
+        if cached is not None and cached[0] == self._mtimes.get(path):
+            return cached[1]
+        try:
+            content = read_file_from_container(self.channels, path).decode("utf-8", errors="replace")
+        except (FileNotFoundError, ValueError):
+            return None
+        if indexed:
+            self._contents[path] = (self._mtimes.get(path), content)
+        return content
+
+    def read_many(self, paths: list[str]) -> dict[str, str]:
+        """
+        Returns the content of several files, fetching all uncached ones in one transfer.
+
+        Missing files are left out of the result.
+        """
+        self._ensure_fresh()
+        result = {}
+        to_fetch = []
+        for path in map(self.resolve, paths):
+            cached = self._contents.get(path)
+            if cached is not None and cached[0] == self._mtimes.get(path):
+                result[path] = cached[1]
+            elif path in self._mtimes or posixpath.basename(path) not in INDEXED_FILE_NAMES:
+                to_fetch.append(path)
+        for path, data in read_files_from_container(self.channels, to_fetch).items():
+            content = data.decode("utf-8", errors="replace")
+            if posixpath.basename(path) in INDEXED_FILE_NAMES:
+                self._contents[path] = (self._mtimes.get(path), content)
+            result[path] = content
+        return result
+
+    def write_files(self, contents: dict[str, str | bytes]) -> None:
+        """Writes files in one transfer and keeps the index in sync."""
+        resolved = {self.resolve(path): data for path, data in contents.items()}
+        write_files_to_container(self.channels, resolved)
+        for path, data in resolved.items():
+            self.invalidate(path)
+            if posixpath.basename(path) in INDEXED_FILE_NAMES and isinstance(data, str):
+                # Until the next rescan reports the real mtime, the written content is authoritative.
+                self._contents[path] = (None, data)
@@ -5,7 +5,6 @@ from __future__ import annotations
 COMMAND_CATEGORY = "system"
 COMMAND_CATEGORY_TITLE = "System"
 
-import docker
 from typing import NoReturn
 import os
 import subprocess
@@ -36,10 +35,9 @@ def goals_accomplished(reason: str, agent: Agent) -> NoReturn:
             improve the code.
     """
 
-    client = docker.from_env()
-    container = client.containers.get(agent.container.id)
-    
-    exit_code, output = container.exec_run(f"/bin/sh -c \"find {os.path.basename(agent.project_name)} -type f -name '*.apk'\"")
+    exit_code, output, _ = agent.channels.exec(
+        ["/bin/sh", "-c", f"find {os.path.basename(agent.project_name)} -type f -name '*.apk'"]
+    )
     apk_paths = output.decode().strip().split("\n")
     apk_paths = [path for path in apk_paths if path] 
     
@@ -23,6 +23,7 @@ class AIConfig:
         ai_role (str): The description of the AI's role.
         ai_goals (list): The list of objectives the AI is supposed to complete.
         api_budget (float): The maximum dollar value for API calls (0.0 means infinite)
+        model_cascade (dict): The model tiers of stateless cycles and when to escalate between them
     """
 
     def __init__(
@@ -31,6 +32,7 @@ class AIConfig:
         ai_role: str = "",
         ai_goals: list[str] = [],
         api_budget: float = 0.0,
+        model_cascade: dict | None = None,
     ) -> None:
         """
         Initialize a class instance
@@ -40,6 +42,7 @@ class AIConfig:
             ai_role (str): The description of the AI's role.
             ai_goals (list): The list of objectives the AI is supposed to complete.
             api_budget (float): The maximum dollar value for API calls (0.0 means infinite)
+            model_cascade (dict): The model tiers of stateless cycles and when to escalate between them
         Returns:
             None
         """
@@ -47,13 +50,14 @@ class AIConfig:
         self.ai_role = ai_role
         self.ai_goals = ai_goals
         self.api_budget = api_budget
+        self.model_cascade = model_cascade or {}
         self.prompt_generator: PromptGenerator | None = None
         self.command_registry: CommandRegistry | None = None
 
     @staticmethod
     def load(ai_settings_file: str | Path) -> "AIConfig":
         """
-        Returns class object with parameters (ai_name, ai_role, ai_goals, api_budget)
+        Returns class object with parameters (ai_name, ai_role, ai_goals, api_budget, model_cascade)
         loaded from yaml file if yaml file exists, else returns class with no parameters.
 
         Parameters:
@@ -83,8 +87,9 @@ class AIConfig:
             for goal in config_params.get("ai_goals", [])
         ]
         api_budget = config_params.get("api_budget", 0.0)
+        model_cascade = config_params.get("model_cascade") or {}
 
-        return AIConfig(ai_name, ai_role, ai_goals, api_budget)
+        return AIConfig(ai_name, ai_role, ai_goals, api_budget, model_cascade)
 
     def construct_full_prompt(
         self, config: Config
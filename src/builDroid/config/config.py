@@ -25,6 +25,7 @@ class Config():
     llm_model: str = None
     temperature: float = 1.0
     openai_functions: bool = False
+    """Whether to request replies in the command schema (structured output) instead of free text."""
     cycle_limit: int = 0
     conversation: bool = False
 
@@ -39,4 +40,5 @@ def set_api_token(config: Config) -> None:
     """Setup api tokens for agent."""
     config.openai_api_key = os.getenv("API_KEY", default="")
     config.openai_api_base = os.getenv("BASE_URL", default="")
-    config.llm_model = os.getenv("LLM_MODEL", default="")
\ No newline at end of file
+    config.llm_model = os.getenv("LLM_MODEL", default="")
+    config.openai_functions = os.getenv("LLM_STRUCTURED_OUTPUT", default="false").lower() == "true"
\ No newline at end of file
@@ -1,5 +1,11 @@
 from .formatters import builDroidFormatter, JsonFormatter, remove_color_codes
-from .handlers import ConsoleHandler, JsonFileHandler, TypingConsoleHandler
+from .handlers import (
+    CompressedRotatingFileHandler,
+    ConsoleHandler,
+    JsonRecordHandler,
+    ProjectLogRouter,
+    TypingConsoleHandler,
+)
 from .log_cycle import (
     CURRENT_CONTEXT_FILE_NAME,
     FULL_MESSAGE_HISTORY_FILE_NAME,
@@ -1,8 +1,15 @@
+import gzip
 import json
 import logging
+import logging.handlers
+import os
 import random
+import shutil
+import sys
+import threading
 import time
 from pathlib import Path
+from typing import Callable
 
 
 class ConsoleHandler(logging.StreamHandler):
@@ -15,7 +22,24 @@ class ConsoleHandler(logging.StreamHandler):
 
 
 class TypingConsoleHandler(logging.StreamHandler):
-    """Output stream to console using simulated typing"""
+    """
+    Output stream to console using simulated typing.
+
+    The effect is cosmetic: it is only used when `typing` is on and stdout is a
+    terminal, and a message is printed at once if `backlog()` reports more
+    records waiting behind it. Run it off the agent thread, e.g. behind a
+    QueueListener, so the delay never holds up the caller.
+    """
+
+    def __init__(self, backlog: Callable[[], int] | None = None):
+        super().__init__()
+        self.backlog = backlog
+        self.typing = True
+
+    def _should_type(self) -> bool:
+        if not self.typing or not sys.stdout.isatty():
+            return False
+        return self.backlog is None or self.backlog() == 0
 
     def emit(self, record: logging.LogRecord):
         min_typing_speed = 0.05
@@ -23,6 +47,9 @@ class TypingConsoleHandler(logging.StreamHandler):
 
         msg = self.format(record)
         try:
+            if not self._should_type():
+                print(msg)
+                return
             words = msg.split()
             for i, word in enumerate(words):
                 print(word, end="", flush=True)
@@ -38,11 +65,109 @@ class TypingConsoleHandler(logging.StreamHandler):
             self.handleError(record)
 
 
-class JsonFileHandler(logging.FileHandler):
-    def __init__(self, filename: str | Path, mode="a", encoding=None, delay=False):
-        super().__init__(filename, mode, encoding, delay)
+class JsonRecordHandler(logging.Handler):
+    """Writes records logged with a `json_file` extra to that file, as indented JSON."""
+
+    def emit(self, record: logging.LogRecord):
+        json_file = getattr(record, "json_file", None)
+        if json_file is None:
+            return
+        try:
+            json_data = json.loads(self.format(record))
+            with open(json_file, "w", encoding="utf-8") as f:
+                json.dump(json_data, f, ensure_ascii=False, indent=4)
+        except Exception:
+            self.handleError(record)
+
+
+def gzip_namer(name: str) -> str:
+    return name + ".gz"
+
+
+def gzip_rotator(source: str, dest: str) -> None:
+    """Compresses a rotated log file, for RotatingFileHandler.rotator."""
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class CompressedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler whose rotated files are gzip-compressed, e.g. raw_output.log.1.gz.
+
+    With `shared`, several processes may append to the file. Before each record
+    the handler reopens the file if another process rotated it away, so no
+    lines are written to a file that is being compressed and removed.
+    """
+
+    def __init__(self, filename: str | Path, max_bytes: int, backup_count: int, encoding="utf-8",
+                 shared: bool = False):
+        super().__init__(filename, "a", max_bytes, backup_count, encoding=encoding, delay=True)
+        self.namer = gzip_namer
+        self.rotator = gzip_rotator
+        self.shared = shared
+        self._file_id: tuple[int, int] | None = None
+
+    def _open(self):
+        stream = super()._open()
+        st = os.fstat(stream.fileno())
+        self._file_id = (st.st_dev, st.st_ino)
+        return stream
+
+    def emit(self, record: logging.LogRecord):
+        if self.shared and self.stream is not None:
+            try:
+                st = os.stat(self.baseFilename)
+                rotated = (st.st_dev, st.st_ino) != self._file_id
+            except FileNotFoundError:
+                rotated = True
+            if rotated:
+                self.stream.close()
+                self.stream = None
+        super().emit(record)
+
+
+class ProjectLogRouter(logging.Handler):
+    """
+    Routes records to the log files of the project they were logged for.
+
+    A record's project is its `project` attribute. The files of a project are
+    opened on its first record by `make_sinks(project)`; records without a
+    project, or with the `skip` placeholder, are dropped.
+    """
+
+    def __init__(self, make_sinks: Callable[[str], list[logging.Handler]], skip: str | None = None):
+        super().__init__()
+        self.make_sinks = make_sinks
+        self.skip = skip
+        self._sinks: dict[str, list[logging.Handler]] = {}
+        self._sinks_lock = threading.Lock()
 
     def emit(self, record: logging.LogRecord):
-        json_data = json.loads(self.format(record))
-        with open(self.baseFilename, "w", encoding="utf-8") as f:
-            json.dump(json_data, f, ensure_ascii=False, indent=4)
+        project = getattr(record, "project", None)
+        if not project or project == self.skip:
+            return
+        try:
+            with self._sinks_lock:
+                sinks = self._sinks.get(project)
+                if sinks is None:
+                    sinks = self._sinks[project] = self.make_sinks(project)
+                for sink in sinks:
+                    if record.levelno >= sink.level:
+                        sink.handle(record)
+        except Exception:
+            self.handleError(record)
+
+    def close_project(self, project: str) -> None:
+        """Closes a project's files. They are reopened if it logs again."""
+        with self._sinks_lock:
+            for sink in self._sinks.pop(project, []):
+                sink.close()
+
+    def close(self):
+        with self._sinks_lock:
+            for sinks in self._sinks.values():
+                for sink in sinks:
+                    sink.close()
+            self._sinks.clear()
+        super().close()
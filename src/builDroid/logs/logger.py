@@ -1,7 +1,13 @@
 """Logging module for builDroid."""
 from __future__ import annotations
+import atexit
+import contextvars
 import os
 import logging
+import queue
+import threading
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, Optional
 
@@ -11,7 +17,39 @@ if TYPE_CHECKING:
     from builDroid.config import Config
 
 from .formatters import builDroidFormatter, JsonFormatter
-from .handlers import ConsoleHandler, JsonFileHandler, TypingConsoleHandler
+from .handlers import (
+    CompressedRotatingFileHandler,
+    ConsoleHandler,
+    JsonRecordHandler,
+    ProjectLogRouter,
+    TypingConsoleHandler,
+)
+
+LOG_FILE = "activity.log"
+ERROR_FILE = "error.log"
+RAW_OUTPUT_FILE = "raw_output.log"
+SHARED_LOG_MAX_BYTES = 20 * 1024 * 1024
+PROJECT_LOG_MAX_BYTES = 10 * 1024 * 1024
+RAW_OUTPUT_MAX_BYTES = 20 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+NO_PROJECT = "-"
+
+_log_project: contextvars.ContextVar[str | None] = contextvars.ContextVar("buildroid_log_project", default=None)
+
+
+def _tag_project(record: logging.LogRecord) -> bool:
+    # Runs in the thread that logged the record, before it is queued, so the
+    # project context of that thread is the one seen here.
+    record.project = _log_project.get() or NO_PROJECT
+    return True
+
+
+def _is_raw_output(record: logging.LogRecord) -> bool:
+    return record.name == "RAW_OUTPUT"
+
+
+def _not_raw_output(record: logging.LogRecord) -> bool:
+    return record.name != "RAW_OUTPUT"
 
 
 class Logger():
@@ -19,66 +57,164 @@ class Logger():
     Logger that handle titles in different colors.
     Outputs logs in console, activity.log, and errors.log
     For console handler: simulates typing
+
+    Logging calls only put the record on a queue. A listener thread does the
+    console rendering (including the typing effect) and the file writes, so a
+    chatty model never slows down the agent loop.
+
+    Nothing is opened until the first record is logged. The shared logs in
+    builDroid_tests/logs are appended to and tagged with the process id and
+    project, so concurrent runs do not clobber each other. Records logged inside
+    `project(name)` also go to that project's own builDroid_tests/{name}/logs.
+    All of these files are rotated and compressed when they grow large.
     """
 
     def __init__(self):
-        # create log directory if it doesn't exist
-        self.log_dir = os.getcwd() + "/builDroid_tests/logs"
-        os.makedirs(self.log_dir, exist_ok=True)
-
-        log_file = "activity.log"
-        open(os.path.join(self.log_dir, log_file), "w")
-        error_file = "error.log"
-        open(os.path.join(self.log_dir, error_file), "w")
-
-        console_formatter = builDroidFormatter("%(title_color)s %(message)s")
-
-        # Create a handler for console which simulate typing
-        self.typing_console_handler = TypingConsoleHandler()
-        self.typing_console_handler.setLevel(logging.INFO)
-        self.typing_console_handler.setFormatter(console_formatter)
-
-        # Create a handler for console without typing simulation
-        self.console_handler = ConsoleHandler()
-        self.console_handler.setLevel(logging.DEBUG)
-        self.console_handler.setFormatter(console_formatter)
-
-        # Info handler in activity.log
-        self.file_handler = logging.FileHandler(os.path.join(self.log_dir, log_file), "a", "utf-8")
-        self.file_handler.setLevel(logging.DEBUG)
-        info_formatter = builDroidFormatter(
-            "%(asctime)s %(levelname)s %(title)s %(message_no_color)s"
-        )
-        self.file_handler.setFormatter(info_formatter)
+        self._config: Optional[Config] = None
+        self.chat_plugins = []
 
-        # Error handler error.log
-        error_handler = logging.FileHandler(os.path.join(self.log_dir, error_file), "a", "utf-8")
-        error_handler.setLevel(logging.ERROR)
-        error_formatter = builDroidFormatter(
-            "%(asctime)s %(levelname)s %(module)s:%(funcName)s:%(lineno)d %(title)s"
-            " %(message_no_color)s"
-        )
-        error_handler.setFormatter(error_formatter)
+        self._log_dir: Path | None = None
+        self._queue = queue.Queue(-1)
+        self._start_lock = threading.Lock()
+        self._listening = False
+        self._typing = True
 
-        self.typing_logger = logging.getLogger("TYPER")
-        self.typing_logger.addHandler(self.typing_console_handler)
-        self.typing_logger.addHandler(self.file_handler)
-        self.typing_logger.addHandler(error_handler)
-        self.typing_logger.setLevel(logging.DEBUG)
+        self.typing_console_handler: TypingConsoleHandler | None = None
+        self.console_handler: ConsoleHandler | None = None
+        self.file_handler: logging.Handler | None = None
+        self._project_router: ProjectLogRouter | None = None
 
+        self.typing_logger = logging.getLogger("TYPER")
         self.logger = logging.getLogger("LOGGER")
-        self.logger.addHandler(self.console_handler)
-        self.logger.addHandler(self.file_handler)
-        self.logger.addHandler(error_handler)
-        self.logger.setLevel(logging.DEBUG)
-
         self.json_logger = logging.getLogger("JSON_LOGGER")
-        self.json_logger.addHandler(self.file_handler)
-        self.json_logger.addHandler(error_handler)
-        self.json_logger.setLevel(logging.DEBUG)
+        self.raw_output_logger = logging.getLogger("RAW_OUTPUT")
+        for log in (self.typing_logger, self.logger, self.json_logger, self.raw_output_logger):
+            log.setLevel(logging.DEBUG)
 
-        self._config: Optional[Config] = None
-        self.chat_plugins = []
+    @property
+    def log_dir(self) -> Path:
+        """builDroid_tests/logs under the working directory of the first log call."""
+        if self._log_dir is None:
+            self._log_dir = Path(os.getcwd()) / "builDroid_tests" / "logs"
+        return self._log_dir
+
+    def _start(self) -> None:
+        """Opens the shared logs and starts the listener thread, once."""
+        if self._listening:
+            return
+        with self._start_lock:
+            if self._listening:
+                return
+            os.makedirs(self.log_dir, exist_ok=True)
+
+            console_formatter = builDroidFormatter("%(title_color)s %(message)s")
+
+            # Create a handler for console which simulate typing
+            self.typing_console_handler = TypingConsoleHandler(backlog=self._queue.qsize)
+            self.typing_console_handler.typing = self._typing
+            self.typing_console_handler.setLevel(logging.INFO)
+            self.typing_console_handler.setFormatter(console_formatter)
+            self.typing_console_handler.addFilter(lambda record: record.name == "TYPER")
+
+            # Create a handler for console without typing simulation
+            self.console_handler = ConsoleHandler()
+            self.console_handler.setLevel(logging.DEBUG)
+            self.console_handler.setFormatter(console_formatter)
+            self.console_handler.addFilter(lambda record: record.name == "LOGGER")
+
+            # Info handler in activity.log
+            self.file_handler = CompressedRotatingFileHandler(
+                self.log_dir / LOG_FILE, SHARED_LOG_MAX_BYTES, LOG_BACKUP_COUNT, shared=True
+            )
+            self.file_handler.setLevel(logging.DEBUG)
+            self.file_handler.setFormatter(self._info_formatter(shared=True))
+            self.file_handler.addFilter(_not_raw_output)
+
+            # Error handler error.log
+            error_handler = CompressedRotatingFileHandler(
+                self.log_dir / ERROR_FILE, SHARED_LOG_MAX_BYTES, LOG_BACKUP_COUNT, shared=True
+            )
+            error_handler.setLevel(logging.ERROR)
+            error_handler.setFormatter(self._error_formatter(shared=True))
+            error_handler.addFilter(_not_raw_output)
+
+            # JSON data logged with log_json
+            json_data_handler = JsonRecordHandler()
+            json_data_handler.setFormatter(JsonFormatter())
+
+            # Per-project logs
+            self._project_router = ProjectLogRouter(self._project_sinks, skip=NO_PROJECT)
+
+            self._listener = QueueListener(
+                self._queue,
+                self.typing_console_handler,
+                self.console_handler,
+                self.file_handler,
+                error_handler,
+                json_data_handler,
+                self._project_router,
+                respect_handler_level=True,
+            )
+            self._listener.start()
+            atexit.register(self.stop)
+
+            queue_handler = QueueHandler(self._queue)
+            queue_handler.addFilter(_tag_project)
+            for log in (self.typing_logger, self.logger, self.json_logger, self.raw_output_logger):
+                log.addHandler(queue_handler)
+            self._listening = True
+
+    @staticmethod
+    def _info_formatter(shared: bool) -> logging.Formatter:
+        source = "%(process)d %(project)s " if shared else ""
+        return builDroidFormatter(
+            "%(asctime)s " + source + "%(levelname)s %(title)s %(message_no_color)s"
+        )
+
+    @staticmethod
+    def _error_formatter(shared: bool) -> logging.Formatter:
+        source = "%(process)d %(project)s " if shared else ""
+        return builDroidFormatter(
+            "%(asctime)s " + source + "%(levelname)s %(module)s:%(funcName)s:%(lineno)d %(title)s"
+            " %(message_no_color)s"
+        )
+
+    def _project_sinks(self, project: str) -> list[logging.Handler]:
+        """Creates the log files of a project. Runs in the listener thread."""
+        project_log_dir = self.log_dir.parent / project / "logs"
+        os.makedirs(project_log_dir, exist_ok=True)
+
+        activity = CompressedRotatingFileHandler(project_log_dir / LOG_FILE, PROJECT_LOG_MAX_BYTES, LOG_BACKUP_COUNT)
+        activity.setLevel(logging.DEBUG)
+        activity.setFormatter(self._info_formatter(shared=False))
+        activity.addFilter(_not_raw_output)
+
+        errors = CompressedRotatingFileHandler(project_log_dir / ERROR_FILE, PROJECT_LOG_MAX_BYTES, LOG_BACKUP_COUNT)
+        errors.setLevel(logging.ERROR)
+        errors.setFormatter(self._error_formatter(shared=False))
+        errors.addFilter(_not_raw_output)
+
+        raw_output = CompressedRotatingFileHandler(project_log_dir / RAW_OUTPUT_FILE, RAW_OUTPUT_MAX_BYTES, LOG_BACKUP_COUNT)
+        raw_output.setLevel(logging.DEBUG)
+        raw_output.setFormatter(builDroidFormatter("%(asctime)s %(title)s\n%(message)s"))
+        raw_output.addFilter(_is_raw_output)
+        return [activity, errors, raw_output]
+
+    @contextmanager
+    def project(self, project_name: str):
+        """
+        Sends the records logged in this context, and in contexts copied from it,
+        to the project's own logs as well. The project's files are closed when
+        the block exits.
+        """
+        token = _log_project.set(project_name)
+        try:
+            yield
+        finally:
+            _log_project.reset(token)
+            if self._listening:
+                self.flush()
+                self._project_router.close_project(project_name)
 
     @property
     def config(self) -> Config | None:
@@ -88,8 +224,30 @@ class Logger():
     def config(self, config: Config):
         self._config = config
         if config.plain_output:
-            self.typing_logger.removeHandler(self.typing_console_handler)
-            self.typing_logger.addHandler(self.console_handler)
+            self.typing = False
+
+    @property
+    def typing(self) -> bool:
+        """Whether typewriter_log simulates typing. It never does when stdout is not a terminal."""
+        return self._typing
+
+    @typing.setter
+    def typing(self, enabled: bool):
+        self._typing = enabled
+        if self.typing_console_handler is not None:
+            self.typing_console_handler.typing = enabled
+
+    def flush(self) -> None:
+        """Waits until every record logged so far has been written."""
+        if self._listening:
+            self._queue.join()
+
+    def stop(self) -> None:
+        """Writes the remaining records and stops the listener thread."""
+        if self._listening:
+            self._listening = False
+            self._listener.stop()
+            self._project_router.close()
 
     def typewriter_log(
         self,
@@ -109,6 +267,7 @@ class Logger():
         else:
             content = ""
 
+        self._start()
         self.typing_logger.log(
             level, content, extra={"title": title, "color": title_color}
         )
@@ -150,10 +309,18 @@ class Logger():
         if message:
             if isinstance(message, list):
                 message = " ".join(message)
+        self._start()
         self.logger.log(
             level, message, extra={"title": str(title), "color": str(title_color)}
         )
 
+    def raw_output(self, title: str, output: str) -> None:
+        """Logs the full output of a command to the current project's raw_output.log."""
+        if _log_project.get() is None:
+            return
+        self._start()
+        self.raw_output_logger.debug(output, extra={"title": str(title)})
+
     def set_level(self, level: logging._Level) -> None:
         self.logger.setLevel(level)
         self.typing_logger.setLevel(level)
@@ -170,15 +337,9 @@ class Logger():
         self.typewriter_log("DOUBLE CHECK CONFIGURATION", Fore.YELLOW, additionalText)
 
     def log_json(self, data: Any, file_name: str | Path) -> None:
-        # Create a handler for JSON files
         json_file_path = self.log_dir / file_name
-        json_data_handler = JsonFileHandler(json_file_path)
-        json_data_handler.setFormatter(JsonFormatter())
-
-        # Log the JSON data using the custom file handler
-        self.json_logger.addHandler(json_data_handler)
-        self.json_logger.debug(data)
-        self.json_logger.removeHandler(json_data_handler)
+        self._start()
+        self.json_logger.debug(data, extra={"json_file": str(json_file_path)})
 
 
 logger = Logger()
@@ -44,6 +44,22 @@ class Command:
             return f"Command '{self.name}' is disabled"
         return self.method(*args, **kwargs)
 
+    def to_json_schema(self) -> dict:
+        """The JSON schema of a `command` object in the agent's reply that calls this command."""
+        return {
+            "type": "object",
+            "description": self.description,
+            "properties": {
+                "name": {"type": "string", "enum": [self.name]},
+                "args": {
+                    "type": "object",
+                    "properties": {param.name: param.to_json_schema() for param in self.parameters},
+                    "required": [param.name for param in self.parameters if param.required],
+                },
+            },
+            "required": ["name", "args"],
+        }
+
     def __str__(self) -> str:
         params = [
             f"{param.name}: {param.type if param.required else f'Optional[{param.type}]'}"
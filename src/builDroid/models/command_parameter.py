@@ -8,5 +8,8 @@ class CommandParameter:
     description: str
     required: bool
 
+    def to_json_schema(self) -> dict:
+        return {"type": self.type, "description": self.description}
+
     def __repr__(self):
         return f"CommandParameter('{self.name}', '{self.type}', '{self.description}', {self.required})"
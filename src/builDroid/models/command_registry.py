@@ -106,6 +106,26 @@ class CommandRegistry:
         ]
         return "\n".join(commands_list)
 
+    def reply_schema(self) -> dict:
+        """
+        Returns the JSON schema of the agent's reply, `{"thoughts": ..., "command": ...}`,
+        with one `command` alternative per enabled command, for providers'
+        structured output.
+        """
+        return {
+            "type": "object",
+            "properties": {
+                "thoughts": {
+                    "type": "string",
+                    "description": "Your analysis of the last result, your hypothesis and why you chose the command.",
+                },
+                "command": {
+                    "anyOf": [cmd.to_json_schema() for cmd in self.commands.values() if cmd.enabled],
+                },
+            },
+            "required": ["thoughts", "command"],
+        }
+
     @staticmethod
     def with_command_modules(modules: list[str], config: Config) -> CommandRegistry:
         new_registry = CommandRegistry()
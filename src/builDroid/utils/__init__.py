@@ -1,5 +1,27 @@
-from .api_token_env import api_token_setup, api_token_reset
-from .git_utils import clone_and_set_metadata
-from .increment_experiment import new_experiment
-from .results_sheet import create_results_sheet
-from .post_process import run_post_process
\ No newline at end of file
+import importlib
+
+# Submodules are imported on first access, so `import builDroid` does not load
+# pandas (results_sheet) or the LLM provider SDKs (post_process).
+_LAZY_EXPORTS = {
+    "api_token_setup": "api_token_env",
+    "api_token_reset": "api_token_env",
+    "clone_and_set_metadata": "git_utils",
+    "new_experiment": "increment_experiment",
+    "create_results_sheet": "results_sheet",
+    "run_post_process": "post_process",
+    "PostProcessPool": "post_process",
+}
+
+__all__ = list(_LAZY_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _LAZY_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_LAZY_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
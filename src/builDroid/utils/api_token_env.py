@@ -46,13 +46,19 @@ def api_token_setup():
         os.environ["LLM_MODEL"] = llm_model
         print(f"Model: Not specified, default: {llm_model}")
 
+    if os.getenv("HEDGE_LLM_MODEL"):
+        print(f"Hedging stalled requests with: {os.getenv('HEDGE_BASE_URL') or 'OpenAI default'} ({os.getenv('HEDGE_LLM_MODEL')})")
+
 def api_token_reset():
     """
-    Resets api key, base url, and llm model environment variables.
+    Resets api key, base url, and llm model environment variables, and those of the hedge endpoint.
     """
     if "API_KEY" in os.environ:
         del os.environ["API_KEY"]
     if "BASE_URL" in os.environ:
         del os.environ["BASE_URL"]
     if "LLM_MODEL" in os.environ:
-        del os.environ["LLM_MODEL"]
\ No newline at end of file
+        del os.environ["LLM_MODEL"]
+    for name in ("HEDGE_API_KEY", "HEDGE_BASE_URL", "HEDGE_LLM_MODEL"):
+        if name in os.environ:
+            del os.environ[name]
\ No newline at end of file
@@ -5,12 +5,23 @@ from pathlib import Path
 # List of directories to be completely removed and recreated by --clean.
 DIRECTORIES_TO_CLEAN = ["builDroid_tests", "builDroid_workspace"]
 
-def clean_workspace(no_docker: bool = False):
+def clean_workspace(no_docker: bool = False, remove_knowledge: bool = False):
     """
     Handles the --clean operation.
     Completely removes and recreates the specified directories.
+    The fix knowledge base is kept unless `remove_knowledge` is set.
     """
+    from builDroid.utils.fix_knowledge import knowledge_path
+
     print("--- Cleaning workspace ---")
+    knowledge = Path(knowledge_path()) if knowledge_path() else None
+    kept_knowledge = None
+    if knowledge is not None and knowledge.exists():
+        if remove_knowledge:
+            print(f"Removing fix knowledge base: {knowledge}")
+            knowledge.unlink()
+        else:
+            kept_knowledge = knowledge.read_bytes()
     for dir_name in DIRECTORIES_TO_CLEAN:
         dir_path = Path(dir_name)
         if dir_path.exists():
@@ -19,6 +30,10 @@ def clean_workspace(no_docker: bool = False):
             shutil.rmtree(dir_path, ignore_errors=True)
         else:
             print(f"Directory '{dir_path}' not found, skipping removal.")
+    if kept_knowledge is not None and not knowledge.exists():
+        knowledge.parent.mkdir(parents=True, exist_ok=True)
+        knowledge.write_bytes(kept_knowledge)
+        print(f"Kept fix knowledge base: {knowledge} (remove it with `buildroid clean --knowledge`)")
     print("--- Workspace cleaned successfully. ---")
     if not no_docker:
         add = input("\nADDITIONAL PROMPT: Clean Docker resources? (Yes/No): ").strip()
@@ -66,8 +81,9 @@ def clean_docker_resources():
         if action == "containers":
             print("Removing all stopped containers and volumes...")
             subprocess.run(["docker", "container", "prune", "-f"], check=True)
-            subprocess.run(["docker", "system", "prune", "--volumes", "-f"], check=True)
-            print("Removed all containers and volumes.")
+            from builDroid.commands.docker_helpers_static import SDK_CACHE_LABEL
+            subprocess.run(["docker", "system", "prune", "--volumes", "-f", "--filter", f"label!={SDK_CACHE_LABEL}"], check=True)
+            print("Removed all containers and volumes (kept the shared SDK cache).")
 
         elif action == "all":
             print("Pruning all Docker system resources (containers, images, volumes, networks)...")
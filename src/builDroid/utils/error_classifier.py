@@ -0,0 +1,325 @@
+import importlib.resources
+import itertools
+import json
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+import yaml
+
+from builDroid.logs import logger
+
+# The rule catalogue. A file with this name in the working directory overrides
+# the one packaged in builDroid/files.
+RULES_FILE_NAME = "error_rules.yaml"
+RULE_HITS_FILE = os.path.join("builDroid_tests", "logs", "error_rule_hits.json")
+
+
+def rules_file_path():
+    """Returns the rule catalogue in use: the working directory's, else the packaged one."""
+    if os.path.exists(RULES_FILE_NAME):
+        return Path(RULES_FILE_NAME).resolve()
+    return importlib.resources.files("builDroid").joinpath("files", RULES_FILE_NAME)
+
+
+def load_rules(path: Path) -> dict[str, dict[str, list[re.Pattern]]]:
+    """
+    Loads and compiles a rule catalogue.
+
+    Returns:
+        dict: category -> specific issue -> compiled patterns, in file order.
+
+    Raises:
+        ValueError: If the catalogue is malformed or a pattern does not compile.
+    """
+    with path.open("r", encoding="utf-8") as f:
+        raw = yaml.safe_load(f) or {}
+    if not isinstance(raw, dict):
+        raise ValueError("expected a mapping of categories")
+    rules = {}
+    for category, issues in raw.items():
+        if not isinstance(issues, dict):
+            raise ValueError(f"category '{category}' must map issues to pattern lists")
+        rules[category] = {}
+        for specific_issue, patterns in issues.items():
+            if isinstance(patterns, str):
+                patterns = [patterns]
+            try:
+                rules[category][specific_issue] = [re.compile(str(pattern)) for pattern in patterns or []]
+            except re.error as e:
+                raise ValueError(f"invalid pattern for {specific_issue}: {e}") from e
+    return rules
+
+
+# Shortest literal worth prefiltering on; rules without one always run their regex.
+MIN_LITERAL_LENGTH = 4
+# Matches kept per rule and text, so a log repeating one error thousands of
+# times does not make thousands of matches.
+MAX_MATCHES_PER_RULE = 20
+_QUANTIFIERS = "*+?{"
+
+
+def required_literal(pattern: str) -> str:
+    """
+    Returns the longest run of literal characters every match of `pattern` contains.
+
+    Only the top level of the pattern is considered. Returns "" if the pattern has
+    a top-level alternation or no literal run.
+    """
+    runs, run = [], ""
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        literal = None
+        if char == "\\" and i + 1 < len(pattern):
+            escaped = pattern[i + 1]
+            i += 2
+            if depth == 0 and not escaped.isalnum():
+                literal = escaped
+        elif char == "[":
+            # Skip the character class, including a leading "]" or "^]".
+            end = i + 1
+            if end < len(pattern) and pattern[end] == "^":
+                end += 1
+            if end < len(pattern) and pattern[end] == "]":
+                end += 1
+            while end < len(pattern) and pattern[end] != "]":
+                end += 2 if pattern[end] == "\\" else 1
+            i = end + 1
+        elif char == "{":
+            # A {m,n} quantifier. The literal before it was already left out.
+            end = pattern.find("}", i)
+            i = len(pattern) if end == -1 else end + 1
+        else:
+            i += 1
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+            elif char == "|" and depth == 0:
+                return ""
+            elif depth == 0 and char not in ".^$" + _QUANTIFIERS:
+                literal = char
+        if literal is not None and not (i < len(pattern) and pattern[i] in _QUANTIFIERS):
+            run += literal
+        else:
+            runs.append(run)
+            run = ""
+    runs.append(run)
+    return max(runs, key=len)
+
+
+# Applied in order to an error excerpt or match, so the same error in different
+# projects or builds gets the same signature.
+SIGNATURE_SUBSTITUTIONS = [
+    (re.compile(r"(?:[A-Za-z]:)?(?:/[\w.@+-]+)+/?"), "<path>"),
+    (re.compile(r"\b\d+(?:\.\d+)+[\w.-]*"), "<version>"),
+    (re.compile(r"\b(?:0x)?[0-9a-f]{7,}\b"), "<hash>"),
+    (re.compile(r"\d+"), "<n>"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+def error_signature(excerpt: str) -> str:
+    """Normalizes paths, versions, hashes and numbers out of an error excerpt."""
+    for pattern, replacement in SIGNATURE_SUBSTITUTIONS:
+        excerpt = pattern.sub(replacement, excerpt)
+    return excerpt.strip()
+
+
+@dataclass(frozen=True)
+class ErrorMatch:
+    category: str
+    issue: str
+    start: int
+    """Offset of the match in the classified text."""
+    end: int
+    text: str
+    versions: tuple[str | None, ...]
+    """The groups captured by the rule, e.g. the required Java version."""
+    rule: int
+    """The rule's position in the rule order; lower wins."""
+
+
+@dataclass(frozen=True)
+class _CompiledRule:
+    category: str
+    issue: str
+    pattern: re.Pattern
+    literal: str
+    """A literal every match contains (lowercased for case-insensitive rules), or ""."""
+
+
+class PatternClassifier:
+    """
+    Classifies build errors in a log using the rules of the catalogue.
+
+    Each rule is precompiled along with a literal that every match must contain.
+    Classifying a log runs one substring search per rule, and only the rules
+    whose literal occurs in the log run their regex.
+
+    The literals are not merged into one pass: `str.__contains__` is fast enough
+    that the ~30 searches take about a third of the time of a single `re` scan
+    for all literals (36 ms against 113 ms on a 4 MB Gradle log), and a pure
+    Python Aho-Corasick automaton is slower still.
+    """
+
+    def __init__(self, rules: dict, hits: Counter | None = None):
+        self.rules = rules
+        self.hits: Counter = hits if hits is not None else Counter()
+        """How often each (category, issue, pattern) rule decided a classification."""
+        self._hits_lock = threading.Lock()
+        self._compiled: list[_CompiledRule] = []
+        for category, issues in rules.items():
+            for specific_issue, patterns in issues.items():
+                for pattern in patterns:
+                    literal = required_literal(pattern.pattern)
+                    if pattern.flags & re.IGNORECASE:
+                        literal = literal.lower()
+                    self._compiled.append(_CompiledRule(
+                        category=category,
+                        issue=specific_issue,
+                        pattern=pattern,
+                        literal=literal if len(literal) >= MIN_LITERAL_LENGTH else "",
+                    ))
+        self._has_ignorecase = any(rule.pattern.flags & re.IGNORECASE for rule in self._compiled)
+
+    def finditer(self, log_output: str, offset: int = 0) -> Iterator[ErrorMatch]:
+        """
+        Yields the rule matches in the log, in order of appearance. Only the
+        first MAX_MATCHES_PER_RULE matches of each rule are kept.
+
+        Args:
+            log_output: The text to classify.
+            offset: Added to the match offsets, for text that is part of a longer log.
+        """
+        lowered = log_output.lower() if self._has_ignorecase else None
+        matches = []
+        for index, rule in enumerate(self._compiled):
+            if rule.literal:
+                haystack = lowered if rule.pattern.flags & re.IGNORECASE else log_output
+                if rule.literal not in haystack:
+                    continue
+            for match in itertools.islice(rule.pattern.finditer(log_output), MAX_MATCHES_PER_RULE):
+                matches.append(ErrorMatch(
+                    category=rule.category,
+                    issue=rule.issue,
+                    start=offset + match.start(),
+                    end=offset + match.end(),
+                    text=match.group(),
+                    versions=match.groups(),
+                    rule=index,
+                ))
+        matches.sort(key=lambda m: (m.start, m.rule))
+        yield from matches
+
+    def find_all(self, log_output: str) -> list[ErrorMatch]:
+        return list(self.finditer(log_output))
+
+    def classify(self, log_output: str) -> tuple[str, str] | None:
+        """
+        Classifies the error in a log using predefined regex rules.
+
+        Returns:
+            A tuple (category, specific_issue) if a match is found, otherwise None.
+        """
+        lowered = log_output.lower() if self._has_ignorecase else None
+        for rule in self._compiled:
+            if rule.literal:
+                haystack = lowered if rule.pattern.flags & re.IGNORECASE else log_output
+                if rule.literal not in haystack:
+                    continue
+            if rule.pattern.search(log_output):
+                with self._hits_lock:
+                    self.hits[(rule.category, rule.issue, rule.pattern.pattern)] += 1
+                return (rule.category, rule.issue)
+        return None
+
+    def save_hits(self, path: str = RULE_HITS_FILE) -> None:
+        """Writes the hit counters as category -> issue -> pattern -> count."""
+        counts = {}
+        with self._hits_lock:
+            for (category, specific_issue, pattern), count in self.hits.items():
+                counts.setdefault(category, {}).setdefault(specific_issue, {})[pattern] = count
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(counts, f, indent=4)
+
+    def stream(self) -> "ClassifierStream":
+        return ClassifierStream(self)
+
+
+class ClassifierStream:
+    """
+    Classifies output incrementally as it arrives.
+
+    Only complete lines are classified; the current partial line is buffered
+    until its newline (or `close`) arrives.
+    """
+
+    def __init__(self, classifier: PatternClassifier):
+        self.classifier = classifier
+        self.matches: list[ErrorMatch] = []
+        self._partial = ""
+        self._offset = 0
+
+    def feed(self, chunk: str) -> list[ErrorMatch]:
+        """Classifies the complete lines of a chunk. Returns the new matches."""
+        text = self._partial + chunk
+        cut = text.rfind("\n") + 1
+        complete, self._partial = text[:cut], text[cut:]
+        new_matches = list(self.classifier.finditer(complete, self._offset))
+        self._offset += len(complete)
+        self.matches += new_matches
+        return new_matches
+
+    def close(self) -> list[ErrorMatch]:
+        """Classifies the last, unterminated line. Returns the new matches."""
+        new_matches = list(self.classifier.finditer(self._partial, self._offset))
+        self._offset += len(self._partial)
+        self._partial = ""
+        self.matches += new_matches
+        return new_matches
+
+
+_classifier: PatternClassifier | None = None
+_classifier_source: tuple[str, float | None] | None = None
+_classifier_lock = threading.Lock()
+
+def _mtime(path) -> float | None:
+    try:
+        return os.path.getmtime(str(path))
+    except OSError:
+        return None
+
+def get_classifier() -> PatternClassifier:
+    """
+    Returns the shared classifier.
+
+    The catalogue is compiled on first use and recompiled whenever the file in
+    use changes, so a running batch picks up edited rules. Hit counters carry
+    over. If an edited catalogue is invalid, the previous rules stay in use.
+    """
+    global _classifier, _classifier_source
+    path = rules_file_path()
+    source = (str(path), _mtime(path))
+    with _classifier_lock:
+        if _classifier is not None and source == _classifier_source:
+            return _classifier
+        try:
+            rules = load_rules(path)
+        except (OSError, yaml.YAMLError, ValueError) as e:
+            if _classifier is None:
+                raise
+            logger.warn(f"Could not reload error rules from {path}: {e}. Keeping the previous rules.")
+        else:
+            if _classifier is not None:
+                logger.info(f"Reloaded error rules from {path}.")
+            _classifier = PatternClassifier(rules, hits=_classifier.hits if _classifier else None)
+        _classifier_source = source
+        return _classifier
@@ -0,0 +1,185 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from builDroid.utils.error_classifier import error_signature
+
+# Shared by all projects. `buildroid clean` keeps it unless asked to remove it.
+# FIX_KNOWLEDGE_DB overrides the path; "" turns it off.
+FIX_KNOWLEDGE_DB = os.path.join("builDroid_tests", "fix_knowledge.sqlite3")
+FIX_TRACE_FILE_NAME = "fix_trace.jsonl"
+MAX_FIX_COMMANDS = 5 # Commands kept per fix, after the last output with the error
+MAX_HINT_FIXES = 3
+MAX_HINT_COMMAND_CHARS = 300
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fixes (
+    signature TEXT NOT NULL,
+    category TEXT NOT NULL,
+    issue TEXT NOT NULL,
+    project TEXT NOT NULL,
+    commands TEXT NOT NULL,
+    indexed_at REAL NOT NULL,
+    PRIMARY KEY (signature, project)
+);
+CREATE INDEX IF NOT EXISTS fixes_by_issue ON fixes (category, issue);
+"""
+
+
+def knowledge_path() -> str:
+    return os.getenv("FIX_KNOWLEDGE_DB", default=FIX_KNOWLEDGE_DB)
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path, timeout=30)
+    db.executescript(_SCHEMA)
+    return db
+
+
+def trace_path(project_name: str) -> str:
+    return os.path.join("builDroid_tests", project_name, FIX_TRACE_FILE_NAME)
+
+
+def _errors(error_matches: list) -> list[list[str]]:
+    """(category, issue, signature) of each detected error, without repeats."""
+    errors = []
+    for match in error_matches:
+        error = [match.category, match.issue, error_signature(match.text)]
+        if error not in errors:
+            errors.append(error)
+    return errors
+
+
+def record_fix_trace(project_name: str, cycle: int, command_name: str,
+                     command_args: dict | None, error_matches: list) -> None:
+    """Appends an executed command and the errors detected in its output to the project's fix trace."""
+    record = {"cycle": cycle, "command": command_name, "args": command_args or {}, "errors": _errors(error_matches)}
+    path = trace_path(project_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def reset_fix_trace(project_name: str) -> None:
+    """Empties the fix trace of a project, so it only holds the attempt that is starting."""
+    path = trace_path(project_name)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def load_fix_trace(project_name: str) -> list[dict]:
+    """Reads the fix trace of a project. Returns [] if there is none."""
+    path = trace_path(project_name)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def extract_fixes(trace: list[dict]) -> list[dict]:
+    """
+    Pairs each error of a successful run with the commands that resolved it.
+
+    An error is taken as resolved by the commands run after the last output it
+    appears in, up to the command that failed with it running again without
+    errors (the build that verified the fix). Without such a run within
+    MAX_FIX_COMMANDS commands, up to the first command whose output has no
+    errors. Errors followed by neither are left out: what fixed them is unclear.
+    """
+    last_seen = {}
+    for i, record in enumerate(trace):
+        for category, issue, signature in record["errors"]:
+            last_seen[signature] = (i, category, issue)
+    fixes = []
+    for signature, (i, category, issue) in last_seen.items():
+        failed = (trace[i]["command"], trace[i]["args"])
+        following = trace[i + 1:i + 2 + MAX_FIX_COMMANDS]
+        rerun = next((j for j, record in enumerate(following)
+                      if not record["errors"] and (record["command"], record["args"]) == failed), None)
+        if rerun is not None and 0 < rerun <= MAX_FIX_COMMANDS:
+            end = rerun
+        else:
+            end = next((j + 1 for j, record in enumerate(following[:MAX_FIX_COMMANDS]) if not record["errors"]), None)
+        if end is None:
+            continue
+        commands = [{"command": record["command"], "args": record["args"]} for record in following[:end]]
+        fixes.append({"signature": signature, "category": category, "issue": issue, "commands": commands})
+    return fixes
+
+
+def index_successful_run(project_name: str) -> int:
+    """
+    Adds the fixes of a successful run to the knowledge base, replacing those
+    indexed from an earlier run of the same project.
+
+    Returns:
+        The number of fixes added.
+    """
+    path = knowledge_path()
+    if not path:
+        return 0
+    fixes = extract_fixes(load_fix_trace(project_name))
+    if not fixes:
+        return 0
+    now = time.time()
+    with closing(_connect(path)) as db, db:
+        db.executemany(
+            "INSERT OR REPLACE INTO fixes VALUES (?, ?, ?, ?, ?, ?)",
+            [(fix["signature"], fix["category"], fix["issue"], project_name, json.dumps(fix["commands"]), now)
+             for fix in fixes],
+        )
+    return len(fixes)
+
+
+def find_fixes(error_matches: list, project_name: str, limit: int = MAX_HINT_FIXES,
+               exclude: set[tuple[str, str]] = frozenset()) -> list[dict]:
+    """
+    Looks up the fixes other projects used for the errors of a command output.
+
+    For each error, in order, fixes of the same signature come first, then
+    fixes of the same classified issue; the most recently indexed first.
+
+    Args:
+        error_matches: The errors detected in the output.
+        project_name: The project asking; its own fixes are left out.
+        limit: The most fixes to return.
+        exclude: (signature, project) of fixes not to return again.
+    """
+    path = knowledge_path()
+    if not path or not os.path.exists(path):
+        return []
+    fixes = []
+    seen = set(exclude)
+    with closing(_connect(path)) as db:
+        for category, issue, signature in _errors(error_matches):
+            rows = db.execute(
+                "SELECT signature, category, issue, project, commands FROM fixes "
+                "WHERE project != ? AND (signature = ? OR (category = ? AND issue = ?)) "
+                "ORDER BY signature = ? DESC, indexed_at DESC LIMIT ?",
+                (project_name, signature, category, issue, signature, limit + len(seen)),
+            ).fetchall()
+            for row_signature, row_category, row_issue, project, commands in rows:
+                if (row_signature, project) in seen:
+                    continue
+                seen.add((row_signature, project))
+                fixes.append({"signature": row_signature, "category": row_category, "issue": row_issue,
+                              "project": project, "commands": json.loads(commands)})
+                if len(fixes) >= limit:
+                    return fixes
+    return fixes
+
+
+def format_fix_hint(fixes: list[dict]) -> str:
+    lines = ["Fixes that resolved a similar error in other projects (they may not apply as-is to this project):"]
+    for fix in fixes:
+        lines.append(f"- {fix['category']} / {fix['issue']} in {fix['project']}: {fix['signature']}")
+        for command in fix["commands"]:
+            text = f"{command['command']} {json.dumps(command['args'])}"
+            if len(text) > MAX_HINT_COMMAND_CHARS:
+                text = text[:MAX_HINT_COMMAND_CHARS] + " ..."
+            lines.append(f"    {text}")
+    return "\n".join(lines)
@@ -0,0 +1,156 @@
+import re
+
+# Gradle build output shorter than this is passed to the LLM as is.
+DIGEST_MIN_CHARS = 2000
+MAX_COMPILER_ERRORS = 20
+MAX_SECTION_LINES = 40
+TAIL_LINES = 10
+
+TASK_FAILED_PATTERN = re.compile(r"^> Task (\S+) FAILED")
+BUILD_RESULT_PATTERN = re.compile(r"^BUILD (SUCCESSFUL|FAILED) in \S+")
+SECTION_PATTERN = re.compile(r"^\* (What went wrong|Where|Try|Exception is|Get more help at)\b:?")
+COMPILER_ERROR_PATTERNS = [
+    # javac: /app/src/main/java/Foo.java:12: error: cannot find symbol
+    re.compile(r"^(?P<file>/\S+\.java):(?P<line>\d+): error: (?P<message>.*)$"),
+    # kotlinc: e: file:///app/src/main/kotlin/Foo.kt:10:5 Unresolved reference: x
+    re.compile(r"^e: (?:file://)?(?P<file>\S+\.kts?):(?P<line>\d+):(?P<column>\d+) (?P<message>.*)$"),
+    # kotlinc (older): e: /app/src/main/kotlin/Foo.kt: (10, 5): Unresolved reference: x
+    re.compile(r"^e: (?P<file>\S+\.kts?): \((?P<line>\d+), (?P<column>\d+)\): (?P<message>.*)$"),
+    # aapt2: ERROR: /app/src/main/res/layout/main.xml:7: AAPT: error: attribute not found.
+    re.compile(r"^ERROR:\s*(?P<file>\S+\.xml):(?P<line>\d+): (?:AAPT: )?(?:error: )?(?P<message>.*)$"),
+]
+
+
+class GradleLogParser:
+    """
+    Incrementally parses Gradle console output into the parts that explain a failure.
+
+    Output can be fed in arbitrary chunks as it arrives; only the current partial
+    line is buffered. The parser keeps the failed tasks, the `* Where:` and
+    `* What went wrong:` sections of each failure, their causes, compiler error
+    locations and the final `BUILD ...` line.
+    """
+
+    def __init__(self):
+        self.failed_tasks: list[str] = []
+        self.failure_headers: list[str] = []
+        """`FAILURE: Build ...` lines."""
+        self.sections: list[tuple[str, list[str]]] = []
+        """(section name, lines) for each `Where` / `What went wrong` section."""
+        self.causes: list[str] = []
+        self.compiler_errors: list[str] = []
+        self.build_result: str | None = None
+        self.line_count = 0
+        self._tail: list[str] = []
+        self._section: list[str] | None = None
+        self._partial = ""
+
+    def feed(self, chunk: str) -> None:
+        """Parses the complete lines of a chunk of output."""
+        lines = (self._partial + chunk).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._feed_line(line.rstrip("\r"))
+
+    def close(self) -> None:
+        """Parses the last, unterminated line."""
+        if self._partial:
+            self._feed_line(self._partial.rstrip("\r"))
+            self._partial = ""
+
+    def _feed_line(self, line: str) -> None:
+        self.line_count += 1
+        self._tail = (self._tail + [line])[-TAIL_LINES:]
+        stripped = line.strip()
+
+        section = SECTION_PATTERN.match(stripped)
+        if section:
+            name = section.group(1)
+            if name in ("What went wrong", "Where"):
+                self._section = []
+                self.sections.append((name, self._section))
+            else:
+                self._section = None
+            return
+        if stripped.startswith("FAILURE: Build"):
+            self.failure_headers.append(stripped)
+            self._section = None
+            return
+        result = BUILD_RESULT_PATTERN.match(stripped)
+        if result:
+            self.build_result = stripped
+            self._section = None
+            return
+
+        if self._section is not None:
+            if stripped and len(self._section) < MAX_SECTION_LINES:
+                self._section.append(line)
+            if stripped.startswith("> ") and stripped[2:] not in self.causes:
+                self.causes.append(stripped[2:])
+            return
+
+        task = TASK_FAILED_PATTERN.match(stripped)
+        if task:
+            self.failed_tasks.append(task.group(1))
+            return
+        if stripped.startswith("Caused by: ") and stripped not in self.causes:
+            self.causes.append(stripped)
+            return
+        if len(self.compiler_errors) < MAX_COMPILER_ERRORS:
+            for pattern in COMPILER_ERROR_PATTERNS:
+                match = pattern.match(stripped)
+                if match:
+                    column = match.groupdict().get("column")
+                    location = f"{match.group('file')}:{match.group('line')}" + (f":{column}" if column else "")
+                    self.compiler_errors.append(f"{location}: {match.group('message')}")
+                    break
+
+    @property
+    def is_gradle_build(self) -> bool:
+        """Whether the output contained the end of a Gradle build."""
+        return self.build_result is not None or bool(self.failure_headers)
+
+    def digest(self, full_log_path: str | None = None) -> str:
+        """
+        Returns a compact summary of the build.
+
+        The `FAILURE: Build` and `BUILD FAILED in` lines are kept, in that order,
+        so the post-process step still recognizes the build attempt.
+        """
+        out = [f"Gradle output ({self.line_count} lines) summarized."]
+        if full_log_path:
+            out[0] += f" Full log: {full_log_path} (read it with read_file and start_line/end_line)."
+        if self.failed_tasks:
+            out.append("Failed tasks: " + ", ".join(self.failed_tasks))
+        out += self.failure_headers
+        for name, lines in self.sections:
+            out.append(f"* {name}:")
+            out += lines
+        extra_causes = [c for c in self.causes if c.startswith("Caused by: ")]
+        if extra_causes:
+            out.append("Causes:")
+            out += [f"  {cause}" for cause in extra_causes]
+        if self.compiler_errors:
+            out.append(f"Compiler errors (first {len(self.compiler_errors)}):")
+            out += [f"  {error}" for error in self.compiler_errors]
+        if not self.failure_headers:
+            out.append("Last lines:")
+            out += [line for line in self._tail if line.strip() and line.strip() != self.build_result]
+        if self.build_result:
+            out.append(self.build_result)
+        return "\n".join(out)
+
+
+def summarize_gradle_output(output: str, full_log_path: str | None = None) -> str | None:
+    """
+    Returns a digest of Gradle build output, or None if `output` is not the
+    output of a Gradle build or is short enough to be passed on as is.
+    """
+    if len(output) < DIGEST_MIN_CHARS:
+        return None
+    parser = GradleLogParser()
+    parser.feed(output)
+    parser.close()
+    if not parser.is_gradle_build:
+        return None
+    return parser.digest(full_log_path)
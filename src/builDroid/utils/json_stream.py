@@ -0,0 +1,93 @@
+import json
+
+MAX_PREAMBLE_CHARS = 200
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class MalformedResponseError(ValueError):
+    """A streamed response cannot become the JSON reply the agent expects."""
+
+
+class CommandStreamParser:
+    """
+    Parses the agent's JSON reply while it is being streamed.
+
+    `feed` returns the reply as soon as the top-level `command` object is
+    complete, closing the top-level object right after it, so the keys before
+    `command` (the thoughts, in the prompted schema) are included and the keys
+    after it are not waited for. It raises MalformedResponseError as soon as the
+    text cannot be such a reply: no `{` within MAX_PREAMBLE_CHARS, mismatched
+    brackets, a `command` that is not an object, or a top-level object that
+    closes without a `command`.
+    """
+
+    def __init__(self, max_preamble: int = MAX_PREAMBLE_CHARS):
+        self.max_preamble = max_preamble
+        self.text = ""
+        self._pos = 0
+        self._stack: list[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_string: str | None = None
+        self._key: str | None = None
+        self._object_start: int | None = None
+        self._command_start: int | None = None
+        self.reply: dict | None = None
+
+    def feed(self, chunk: str) -> dict | None:
+        """Adds streamed text. Returns the reply once its command is complete."""
+        self.text += chunk
+        if self.reply is not None:
+            return self.reply
+        text = self.text
+        while self._pos < len(text):
+            i = self._pos
+            self._pos += 1
+            c = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif c == "\\":
+                    self._escaped = True
+                elif c == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_string = text[self._string_start + 1:i]
+                continue
+            if self._object_start is None:
+                if c == "{":
+                    self._object_start = i
+                    self._stack.append("}")
+                elif i >= self.max_preamble:
+                    raise MalformedResponseError(f"no JSON object in the first {self.max_preamble} characters")
+                continue
+            if c == '"':
+                if len(self._stack) == 1 and self._key == "command":
+                    raise MalformedResponseError("'command' is not an object")
+                self._in_string = True
+                self._string_start = i
+            elif c == ":" and len(self._stack) == 1:
+                self._key = self._last_string
+            elif c == "," and len(self._stack) == 1:
+                self._key = None
+            elif c in _CLOSERS:
+                if len(self._stack) == 1 and self._key == "command":
+                    if c != "{":
+                        raise MalformedResponseError("'command' is not an object")
+                    self._command_start = i
+                self._stack.append(_CLOSERS[c])
+            elif c in "}]":
+                if not self._stack or self._stack.pop() != c:
+                    raise MalformedResponseError(f"unexpected '{c}' at character {i}")
+                if not self._stack:
+                    raise MalformedResponseError("the response has no 'command'")
+                if len(self._stack) == 1 and self._command_start is not None:
+                    try:
+                        self.reply = json.loads(text[self._object_start:i + 1] + "}")
+                    except json.JSONDecodeError as e:
+                        raise MalformedResponseError(f"invalid JSON: {e}") from e
+                    return self.reply
+            elif len(self._stack) == 1 and self._key == "command" and not c.isspace():
+                raise MalformedResponseError("'command' is not an object")
+        return None
@@ -0,0 +1,243 @@
+import contextvars
+import json
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from builDroid.utils.metrics import add_llm_metrics, current_cycle, separate_cycle
+
+HEDGE_STATS_FILE = os.path.join("builDroid_tests", "logs", "llm_hedging.json")
+
+_cancelled: contextvars.ContextVar[threading.Event | None] = contextvars.ContextVar(
+    "buildroid_llm_request_cancelled", default=None
+)
+
+
+def request_cancelled() -> bool:
+    """Whether the hedged request running in this context lost and should not be retried."""
+    event = _cancelled.get()
+    return event is not None and event.is_set()
+
+
+def close_client(client) -> None:
+    """Closes a provider client, which aborts its in-flight request."""
+    close = getattr(client, "close", None)
+    if close is None:
+        return
+    try:
+        close()
+    except Exception:
+        pass
+
+
+class HedgePolicy:
+    """
+    Sends a stalled LLM request to a second endpoint as well.
+
+    If the primary request has not returned within the `percentile` of its
+    recent latencies (`initial_delay` until `min_samples` are known), or if it
+    fails, the same prompt is sent to the secondary endpoint. The first response
+    that `is_valid` accepts wins; the other request is cancelled by closing its
+    client. A request that lost is recorded with the time it had run so far, so
+    stalls keep the deadline up.
+
+    Each request is measured on its own: only the one whose text is returned
+    counts in the cycle metrics (both, if neither returned), and the calls and
+    tokens of the other go to the `losing_*` statistics.
+
+    Configure with the HEDGE_API_KEY, HEDGE_BASE_URL and HEDGE_LLM_MODEL
+    environment variables, and optionally HEDGE_PERCENTILE, HEDGE_INITIAL_DELAY
+    and HEDGE_MIN_SAMPLES.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        model: str,
+        percentile: float = 95.0,
+        initial_delay: float = 30.0,
+        min_samples: int = 5,
+        window: int = 100,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0, "hedged": 0, "primary_wins": 0, "secondary_wins": 0, "no_valid_response": 0,
+            "losing_llm_calls": 0, "losing_prompt_tokens": 0, "losing_completion_tokens": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "HedgePolicy | None":
+        """Returns the policy configured in the environment, or None if no secondary endpoint is set."""
+        model = os.getenv("HEDGE_LLM_MODEL", default="")
+        api_key = os.getenv("HEDGE_API_KEY", default="") or os.getenv("API_KEY", default="")
+        if not model or not api_key:
+            return None
+        return cls(
+            api_key=api_key,
+            base_url=os.getenv("HEDGE_BASE_URL", default=""),
+            model=model,
+            percentile=float(os.getenv("HEDGE_PERCENTILE", default="95")),
+            initial_delay=float(os.getenv("HEDGE_INITIAL_DELAY", default="30")),
+            min_samples=int(os.getenv("HEDGE_MIN_SAMPLES", default="5")),
+        )
+
+    def deadline(self) -> float:
+        """Seconds to wait for the primary endpoint before hedging."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.initial_delay
+            latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, math.ceil(self.percentile / 100 * len(latencies)) - 1)
+        return latencies[max(index, 0)]
+
+    def _observe(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def run(self, primary: tuple, secondary, is_valid):
+        """
+        Sends a request to the primary endpoint, hedged with the secondary one.
+
+        Args:
+            primary: (client, call); `call(client)` sends the request and returns the text.
+            secondary: Returns the (client, call) of the secondary endpoint, when it is needed.
+            is_valid: Whether a returned text is usable.
+
+        Returns:
+            The first valid text. If neither is valid, the primary's text if it
+            returned one, else the secondary's.
+
+        Raises:
+            The last error, if neither endpoint returned.
+        """
+        results = queue.Queue()
+        attempts = {}
+        measured = {}
+
+        def start(name, client, call):
+            event = threading.Event()
+            context = contextvars.copy_context()
+            measured[name] = context.run(separate_cycle)
+
+            def target():
+                _cancelled.set(event)
+                try:
+                    results.put((name, call(client), None))
+                except Exception as e:
+                    results.put((name, None, e))
+
+            attempts[name] = (client, event)
+            threading.Thread(target=context.run, args=(target,), daemon=True, name=f"llm-hedge-{name}").start()
+
+        started = time.monotonic()
+        deadline = self.deadline()
+        start("primary", *primary)
+        pending = 1
+        finished = set()
+        texts = {}
+        error = None
+        winner = None
+        while pending:
+            timeout = None if "secondary" in attempts else max(0.0, deadline - (time.monotonic() - started))
+            try:
+                name, text, failure = results.get(timeout=timeout)
+            except queue.Empty:
+                start("secondary", *secondary())
+                pending += 1
+                continue
+            pending -= 1
+            finished.add(name)
+            if name == "primary" and failure is None:
+                self._observe(time.monotonic() - started)
+            if failure is None and is_valid(text):
+                winner = name
+                break
+            if failure is None:
+                texts[name] = text
+            else:
+                error = failure
+            if "secondary" not in attempts:
+                # The primary failed before the deadline: no point waiting for it.
+                start("secondary", *secondary())
+                pending += 1
+
+        for name, (client, event) in attempts.items():
+            if name != winner and name not in finished:
+                event.set()
+                close_client(client)
+                if name == "primary":
+                    self._observe(time.monotonic() - started)
+
+        if winner is not None:
+            used = {winner}
+        elif texts:
+            used = {"primary" if "primary" in texts else "secondary"}
+        else:
+            used = set(attempts)
+        cycle = current_cycle()
+        with self._lock:
+            self.stats["requests"] += 1
+            if "secondary" in attempts:
+                self.stats["hedged"] += 1
+            if winner is None:
+                self.stats["no_valid_response"] += 1
+            else:
+                self.stats[f"{winner}_wins"] += 1
+            for name, metrics in measured.items():
+                if metrics is None:
+                    continue
+                if name in used:
+                    add_llm_metrics(cycle, metrics)
+                else:
+                    self.stats["losing_llm_calls"] += metrics.llm_calls + metrics.retries
+                    self.stats["losing_prompt_tokens"] += metrics.prompt_tokens
+                    self.stats["losing_completion_tokens"] += metrics.completion_tokens
+        if winner is not None:
+            return text
+        if texts:
+            return texts.get("primary", texts.get("secondary"))
+        raise error
+
+    def save_stats(self, path: str = HEDGE_STATS_FILE) -> None:
+        deadline = self.deadline()
+        with self._lock:
+            report = {
+                "model": self.model,
+                "base_url": self.base_url,
+                "percentile": self.percentile,
+                "deadline_seconds": round(deadline, 3),
+                **self.stats,
+            }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+
+_policy: HedgePolicy | None = None
+_policy_loaded = False
+_policy_lock = threading.Lock()
+
+def get_hedge_policy() -> HedgePolicy | None:
+    """Returns the process-wide hedge policy, or None if hedging is not configured."""
+    global _policy, _policy_loaded
+    with _policy_lock:
+        if not _policy_loaded:
+            _policy = HedgePolicy.from_env()
+            _policy_loaded = True
+        return _policy
+
+def save_hedge_stats() -> None:
+    """Writes the hedging statistics, if any request was hedged."""
+    if _policy is not None and _policy.stats["requests"]:
+        _policy.save_stats()
@@ -0,0 +1,265 @@
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+from builDroid.utils.metrics import record_llm_call, record_queue_wait, usage_tokens
+
+# Lower runs first: an agent waiting on the model holds up a build, a summary does not.
+PRIORITY_AGENT = 0
+PRIORITY_POST_PROCESS = 1
+PRIORITY_NAMES = {PRIORITY_AGENT: "agent", PRIORITY_POST_PROCESS: "post_process"}
+
+CHARS_PER_TOKEN = 4 # Rough estimate used to reserve tokens before the provider reports usage
+SCHEDULER_STATS_FILE = os.path.join("builDroid_tests", "logs", "llm_scheduler.json")
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("buildroid_llm_priority", default=PRIORITY_AGENT)
+
+
+@contextmanager
+def llm_priority(priority: int):
+    """Runs the LLM requests made in the block at `priority`."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def retry_after_seconds(error: Exception) -> float | None:
+    """
+    Reads the Retry-After (or retry-after-ms) header of a failed provider request.
+
+    Returns:
+        The number of seconds to wait, or None if the error carries no such header.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_bad_request(error: Exception) -> bool:
+    """
+    Whether a provider rejected the request itself (HTTP 400, 404, 405 or 422),
+    e.g. for an unsupported parameter or API, so sending it again cannot help.
+    So is a request the provider SDK did not accept: its pydantic validation
+    fails before anything is sent.
+    """
+    if isinstance(error, ValueError) and type(error).__module__.startswith("pydantic"):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return status in (400, 404, 405, 422)
+
+
+class TokenBucket:
+    """
+    Refills continuously at `per_minute` / 60 per second, up to `per_minute`.
+
+    The level may go below zero when a request turns out to use more than it
+    reserved; later requests then wait until the debt is refilled.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken. Amounts above the capacity wait for a full bucket."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+    def give_back(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class LLMScheduler:
+    """
+    Admits the LLM requests of the whole process.
+
+    Requests queue in priority order, then arrival order, and only the head of
+    the queue is admitted, once the requests-per-minute and tokens-per-minute
+    buckets allow it and no Retry-After pause is in effect. Token use is
+    reserved from an estimate of the prompt and corrected with the usage the
+    provider reports. A limit of 0 disables that bucket.
+
+    Configure with the LLM_REQUESTS_PER_MINUTE and LLM_TOKENS_PER_MINUTE
+    environment variables.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self._cond = threading.Condition()
+        self._queue: list[tuple[int, int]] = []
+        self._arrivals = itertools.count()
+        self._paused_until = 0.0
+        self.retry_after_pauses = 0
+        self.stats = {
+            name: {"requests": 0, "queue_wait_seconds": 0.0, "max_queue_wait_seconds": 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+
+    @classmethod
+    def from_env(cls) -> "LLMScheduler":
+        return cls(
+            requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", default="0")),
+            tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", default="0")),
+        )
+
+    def _wait_time(self, estimated_tokens: int, now: float) -> float:
+        wait = self._paused_until - now
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(estimated_tokens, now))
+        return wait
+
+    def acquire(self, estimated_tokens: int, priority: int | None = None) -> float:
+        """
+        Blocks until the request may be sent.
+
+        Returns:
+            float: The seconds spent in the queue.
+        """
+        if priority is None:
+            priority = _priority.get()
+        entry = (priority, next(self._arrivals))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            # The new entry may have become the head.
+            self._cond.notify_all()
+            try:
+                while True:
+                    if self._queue[0] != entry:
+                        self._cond.wait()
+                        continue
+                    wait = self._wait_time(estimated_tokens, time.monotonic())
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                if self.requests is not None:
+                    self.requests.take(1)
+                if self.tokens is not None:
+                    self.tokens.take(estimated_tokens)
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+            waited = time.monotonic() - started
+            stats = self.stats.setdefault(
+                PRIORITY_NAMES.get(priority, str(priority)),
+                {"requests": 0, "queue_wait_seconds": 0.0, "max_queue_wait_seconds": 0.0},
+            )
+            stats["requests"] += 1
+            stats["queue_wait_seconds"] += waited
+            stats["max_queue_wait_seconds"] = max(stats["max_queue_wait_seconds"], waited)
+        return waited
+
+    def complete(self, estimated_tokens: int, response) -> None:
+        """Corrects the token bucket with the usage the provider reported for a request."""
+        if self.tokens is None:
+            return
+        prompt, completion = usage_tokens(response)
+        if not prompt and not completion:
+            return
+        with self._cond:
+            difference = prompt + completion - estimated_tokens
+            if difference > 0:
+                self.tokens.take(difference)
+            else:
+                self.tokens.give_back(-difference)
+                self._cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """Holds every queued and future request for `seconds`, e.g. for a Retry-After header."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.retry_after_pauses += 1
+            self._cond.notify_all()
+
+    def save_stats(self, path: str = SCHEDULER_STATS_FILE) -> None:
+        """Writes the queue-wait statistics per priority as JSON."""
+        with self._cond:
+            report = {
+                "requests_per_minute": int(self.requests.capacity) if self.requests else 0,
+                "tokens_per_minute": int(self.tokens.capacity) if self.tokens else 0,
+                "retry_after_pauses": self.retry_after_pauses,
+                "priorities": {
+                    name: {**stats, "queue_wait_seconds": round(stats["queue_wait_seconds"], 3),
+                           "max_queue_wait_seconds": round(stats["max_queue_wait_seconds"], 3)}
+                    for name, stats in self.stats.items()
+                },
+            }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+
+_scheduler: LLMScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> LLMScheduler:
+    """Returns the process-wide scheduler, created from the environment on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler.from_env()
+        return _scheduler
+
+def save_scheduler_stats() -> None:
+    """Writes the scheduler statistics, if any LLM request was made."""
+    if _scheduler is not None:
+        _scheduler.save_stats()
+
+def scheduled_call(prompt: str, call):
+    """
+    Sends an LLM request through the scheduler and records it in the cycle metrics.
+
+    Args:
+        prompt: The prompt, to estimate the tokens the request uses.
+        call: Sends the request and returns the provider's response.
+
+    Returns:
+        The provider's response.
+    """
+    scheduler = get_scheduler()
+    estimated_tokens = estimate_tokens(prompt)
+    record_queue_wait(scheduler.acquire(estimated_tokens))
+    started = time.monotonic()
+    response = call()
+    record_llm_call(response, time.monotonic() - started)
+    scheduler.complete(estimated_tokens, response)
+    return response
@@ -0,0 +1,193 @@
+import contextvars
+import json
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+
+METRICS_FILE_NAME = "metrics.jsonl"
+
+
+@dataclass
+class CycleMetrics:
+    """What one agent cycle cost, split between the model and the container."""
+    cycle: int
+    timestamp: float
+    model: str | None = None
+    """The model whose response was executed, with a model cascade the tier it escalated to."""
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    llm_seconds: float = 0.0
+    """Time spent in successful LLM requests."""
+    retries: int = 0
+    backoff_seconds: float = 0.0
+    """Time spent in failed LLM requests and waiting before retrying them."""
+    queue_wait_seconds: float = 0.0
+    """Time LLM requests waited for the rate limits of the LLM scheduler."""
+    command: str | None = None
+    command_seconds: float = 0.0
+    output_bytes: int = 0
+
+
+_current_cycle: contextvars.ContextVar[CycleMetrics | None] = contextvars.ContextVar(
+    "buildroid_cycle_metrics", default=None
+)
+
+
+def current_cycle() -> CycleMetrics | None:
+    """Returns the metrics of the cycle running in this context, if any."""
+    return _current_cycle.get()
+
+
+# The CycleMetrics fields LLM requests add to.
+LLM_FIELDS = ("llm_calls", "prompt_tokens", "completion_tokens", "llm_seconds",
+              "retries", "backoff_seconds", "queue_wait_seconds")
+
+
+def separate_cycle() -> CycleMetrics | None:
+    """
+    Adds the LLM requests made from now on in this context to new metrics
+    instead of the current cycle's, e.g. for a request that may be cancelled.
+    Merge them into the cycle with `add_llm_metrics` if they count.
+
+    Returns:
+        The new metrics, or None if no cycle is being measured.
+    """
+    cycle = _current_cycle.get()
+    if cycle is None:
+        return None
+    separate = CycleMetrics(cycle=cycle.cycle, timestamp=cycle.timestamp, model=cycle.model)
+    _current_cycle.set(separate)
+    return separate
+
+
+def add_llm_metrics(cycle: CycleMetrics, other: CycleMetrics) -> None:
+    """Adds the LLM requests of `other` to `cycle`."""
+    for field in LLM_FIELDS:
+        setattr(cycle, field, getattr(cycle, field) + getattr(other, field))
+
+
+def usage_tokens(response) -> tuple[int, int]:
+    """
+    Reads (prompt tokens, completion tokens) from a provider response.
+
+    Handles OpenAI chat completions (`usage.prompt_tokens`), the OpenAI
+    responses API (`usage.input_tokens`) and Gemini (`usage_metadata`).
+    Returns (0, 0) if the response carries no usage.
+    """
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        prompt = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", None) or 0
+        completion = getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", None) or 0
+        return int(prompt), int(completion)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        prompt = getattr(usage, "prompt_token_count", None) or 0
+        completion = getattr(usage, "candidates_token_count", None) or 0
+        return int(prompt), int(completion)
+    return 0, 0
+
+
+def record_llm_call(response, seconds: float) -> None:
+    """Adds a successful LLM request to the current cycle, if one is being measured."""
+    cycle = _current_cycle.get()
+    if cycle is None:
+        return
+    prompt, completion = usage_tokens(response)
+    cycle.llm_calls += 1
+    cycle.prompt_tokens += prompt
+    cycle.completion_tokens += completion
+    cycle.llm_seconds += seconds
+
+
+def record_retry(seconds: float) -> None:
+    """Adds a failed LLM request and its backoff to the current cycle."""
+    cycle = _current_cycle.get()
+    if cycle is None:
+        return
+    cycle.retries += 1
+    cycle.backoff_seconds += seconds
+
+
+def record_queue_wait(seconds: float) -> None:
+    """Adds the time an LLM request waited in the scheduler to the current cycle."""
+    cycle = _current_cycle.get()
+    if cycle is None:
+        return
+    cycle.queue_wait_seconds += seconds
+
+
+def record_command(command_name: str | None, seconds: float, output: str) -> None:
+    """Adds an executed command to the current cycle."""
+    cycle = _current_cycle.get()
+    if cycle is None:
+        return
+    cycle.command = command_name
+    cycle.command_seconds += seconds
+    cycle.output_bytes += len(output.encode("utf-8", errors="replace"))
+
+
+class MetricsRecorder:
+    """Writes the metrics of each cycle of a project to builDroid_tests/{project}/metrics.jsonl."""
+
+    def __init__(self, project_name: str):
+        self.path = os.path.join("builDroid_tests", project_name, METRICS_FILE_NAME)
+
+    @contextmanager
+    def cycle(self, number: int):
+        """
+        Measures one cycle. LLM requests and commands made in the block, in this
+        context, are added to the yielded `CycleMetrics`, which is written out
+        when the block exits.
+        """
+        metrics = CycleMetrics(cycle=number, timestamp=time.time())
+        token = _current_cycle.set(metrics)
+        try:
+            yield metrics
+        finally:
+            _current_cycle.reset(token)
+            self.write(metrics)
+
+    def write(self, metrics: CycleMetrics) -> None:
+        record = asdict(metrics)
+        for key in ("llm_seconds", "backoff_seconds", "queue_wait_seconds", "command_seconds"):
+            record[key] = round(record[key], 3)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def load_metrics(project_name: str) -> list[dict]:
+    """Reads the cycle metrics of a project. Returns [] if there are none."""
+    path = os.path.join("builDroid_tests", project_name, METRICS_FILE_NAME)
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # A line cut short by an interrupted run
+    return records
+
+
+def summarize_metrics(records: list[dict]) -> dict:
+    """Totals cycle metrics into the columns of the results sheet."""
+    def total(key):
+        return sum(record.get(key, 0) for record in records)
+
+    return {
+        "LLM Calls": total("llm_calls"),
+        "Prompt Tokens": total("prompt_tokens"),
+        "Completion Tokens": total("completion_tokens"),
+        "LLM Time": round(total("llm_seconds"), 2),
+        "Backoff Time": round(total("backoff_seconds"), 2),
+        "Queue Wait": round(total("queue_wait_seconds"), 2),
+        "Command Time": round(total("command_seconds"), 2),
+        "Output Bytes": total("output_bytes"),
+    }
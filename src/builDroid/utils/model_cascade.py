@@ -0,0 +1,173 @@
+import json
+import os
+from dataclasses import dataclass
+
+MODEL_TIERS_FILE_NAME = "model_tiers.json"
+DEFAULT_ESCALATE_AFTER = 2
+DEFAULT_DEESCALATE_AFTER = 3
+
+
+@dataclass
+class ModelTier:
+    model: str
+    input_cost: float = 0.0
+    """USD per million prompt tokens."""
+    output_cost: float = 0.0
+    """USD per million completion tokens."""
+
+    @classmethod
+    def from_setting(cls, setting) -> "ModelTier":
+        """Reads a tier of ai_settings.yaml: a model name, or a mapping with `model` and the costs."""
+        if isinstance(setting, str):
+            return cls(model=setting)
+        if not isinstance(setting, dict) or not setting.get("model"):
+            raise ValueError(f"model_cascade tier must be a model name or have a 'model' key: {setting!r}")
+        return cls(
+            model=str(setting["model"]),
+            input_cost=float(setting.get("input_cost", 0.0)),
+            output_cost=float(setting.get("output_cost", 0.0)),
+        )
+
+
+class ModelCascade:
+    """
+    Picks the model of each stateless agent cycle.
+
+    Cycles start on the first (cheapest) tier. The cascade moves one tier up
+    when the same error class (category and issue of the first detected error)
+    is seen `escalate_after` cycles in a row, or when the model's response
+    could not be parsed. It moves one tier back down after a cycle whose
+    build succeeds, or after `deescalate_after` cycles in a row whose command
+    output has no detected errors. A single clean output is not enough: after
+    an escalation, the next commands are often reads without errors, and the
+    error the stronger model was brought in for is not solved yet.
+
+    Each tier's cycles, requests, tokens, latency and cost are kept in `stats`,
+    by tier, and written to builDroid_tests/{project}/model_tiers.json.
+    """
+
+    def __init__(self, tiers: list[ModelTier], escalate_after: int = DEFAULT_ESCALATE_AFTER,
+                 deescalate_after: int = DEFAULT_DEESCALATE_AFTER):
+        if not tiers:
+            raise ValueError("model_cascade needs at least one tier")
+        self.tiers = tiers
+        self.escalate_after = max(1, escalate_after)
+        self.deescalate_after = max(1, deescalate_after)
+        self.level = 0
+        self._last_error: tuple[str, str] | None = None
+        self._repeats = 0
+        self._clean_cycles = 0
+        self.stats = [
+            {
+                "cycles": 0, "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "llm_seconds": 0.0, "cost": 0.0, "escalations": 0, "parse_failures": 0,
+            }
+            for _ in tiers
+        ]
+
+    @classmethod
+    def from_settings(cls, settings: dict | None, default_model: str) -> "ModelCascade":
+        """
+        Builds the cascade from the `model_cascade` section of ai_settings.yaml.
+        Without tiers, every cycle uses `default_model`.
+        """
+        settings = settings or {}
+        tiers = [ModelTier.from_setting(tier) for tier in settings.get("tiers") or []]
+        return cls(
+            tiers or [ModelTier(model=default_model)],
+            escalate_after=int(settings.get("escalate_after", DEFAULT_ESCALATE_AFTER)),
+            deescalate_after=int(settings.get("deescalate_after", DEFAULT_DEESCALATE_AFTER)),
+        )
+
+    @property
+    def model(self) -> str:
+        return self.tiers[self.level].model
+
+    @property
+    def can_escalate(self) -> bool:
+        return self.level < len(self.tiers) - 1
+
+    def escalate(self) -> bool:
+        """Moves to the next tier. Returns False if already on the last one."""
+        if not self.can_escalate:
+            return False
+        self.level += 1
+        self.stats[self.level]["escalations"] += 1
+        self._repeats = 0
+        self._clean_cycles = 0
+        return True
+
+    def observe_errors(self, error_matches: list, build_succeeded: bool = False) -> str | None:
+        """
+        Updates the cascade with the errors detected in the last command output.
+
+        Args:
+            error_matches: The errors detected in the output.
+            build_succeeded: Whether the command was a successful build.
+
+        Returns:
+            The reason the cascade escalated, or None if it did not.
+        """
+        if build_succeeded or not error_matches:
+            self._last_error = None
+            self._repeats = 0
+            self._clean_cycles += 1
+            if self.level > 0 and (build_succeeded or self._clean_cycles >= self.deescalate_after):
+                self.level -= 1
+                self._clean_cycles = 0
+            return None
+        self._clean_cycles = 0
+        error_class = (error_matches[0].category, error_matches[0].issue)
+        if error_class == self._last_error:
+            self._repeats += 1
+        else:
+            self._last_error = error_class
+            self._repeats = 1
+        if self._repeats >= self.escalate_after:
+            reason = f"{error_class[0]} / {error_class[1]} repeated {self._repeats} times"
+            if self.escalate():
+                return reason
+        return None
+
+    def record_completion(self, level: int, seconds: float, llm_calls: int,
+                          prompt_tokens: int, completion_tokens: int) -> None:
+        """Adds one chat completion of tier `level`, including its retries, to the tier's statistics."""
+        tier = self.tiers[level]
+        stats = self.stats[level]
+        stats["llm_calls"] += llm_calls
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        stats["llm_seconds"] += seconds
+        stats["cost"] += (prompt_tokens * tier.input_cost + completion_tokens * tier.output_cost) / 1_000_000
+
+    def record_parse_failure(self, level: int) -> None:
+        self.stats[level]["parse_failures"] += 1
+
+    def record_cycle(self, level: int) -> None:
+        """Counts a cycle whose command came from tier `level`."""
+        self.stats[level]["cycles"] += 1
+
+    def save_stats(self, project_name: str) -> None:
+        path = os.path.join("builDroid_tests", project_name, MODEL_TIERS_FILE_NAME)
+        report = {
+            "escalate_after": self.escalate_after,
+            "deescalate_after": self.deescalate_after,
+            "tiers": [
+                {"tier": i, "model": tier.model, **self.stats[i],
+                 "llm_seconds": round(self.stats[i]["llm_seconds"], 3),
+                 "cost": round(self.stats[i]["cost"], 6)}
+                for i, tier in enumerate(self.tiers)
+            ],
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+
+def load_model_tiers(project_name: str) -> list[dict]:
+    """Reads the per-tier statistics of a project. Returns [] if there are none."""
+    path = os.path.join("builDroid_tests", project_name, MODEL_TIERS_FILE_NAME)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("tiers", [])
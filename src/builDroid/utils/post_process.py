@@ -1,17 +1,37 @@
+import contextvars
 import os
 import re
+import sqlite3
 
 import warnings
 warnings.filterwarnings("ignore")
 
 import glob
-from openai import OpenAI
-from google import genai
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
 from builDroid.agents.base import create_chat_completion
 from builDroid.utils.api_token_env import api_token_setup, api_token_reset
+from builDroid.utils.error_classifier import error_signature, get_classifier
+from builDroid.utils.fix_knowledge import index_successful_run
+from builDroid.utils.gradle_log import GradleLogParser
+from builDroid.utils.llm_scheduler import PRIORITY_POST_PROCESS, llm_priority
+from builDroid.utils.tracing import span
 from importlib.resources import files
 import json
 
+# Unclassified errors of a project, waiting for `summarize_unclassified_errors`.
+UNCLASSIFIED_ERRORS_FILE = "unclassified_errors.json"
+UNCLASSIFIED_BATCH_SIZE = 20 # Unique errors per LLM request
+MAX_EXCERPT_CHARS = 3000
+
+# Prompt histories longer than this are condensed map-reduce style before the final summary.
+CHARS_PER_TOKEN = 4 # Rough estimate; good enough to size requests
+HISTORY_SINGLE_PASS_TOKENS = 60_000
+HISTORY_CHUNK_TOKENS = 20_000
+HISTORY_MAP_CONCURRENCY = 4
+CYCLE_MARKER = re.compile(r"^==================(?:Command|PROMPT) (\d+)==================$", re.MULTILINE)
+
+
 def ask_chatgpt(prompt):
     """
     Asks a question to either OpenAI's ChatGPT or Google's Gemini models.
@@ -30,10 +50,14 @@ def ask_chatgpt(prompt):
     base_url = os.getenv("BASE_URL", default="")
     llm_model = os.getenv("LLM_MODEL", default="")
     if "google" in base_url: # Gemini version
+        from google import genai
         client = genai.Client(api_key=api_key)
     else:
+        from openai import OpenAI
         client = OpenAI(api_key=api_key)
-    return create_chat_completion(client=client, model=llm_model, prompt=prompt)
+    # Summaries yield to the requests of agents that are still building.
+    with llm_priority(PRIORITY_POST_PROCESS):
+        return create_chat_completion(client=client, model=llm_model, prompt=prompt)
     
         
 def extract_agent_log(project_name):
@@ -43,49 +67,6 @@ def extract_agent_log(project_name):
     return extracted_data
 
 
-class PatternClassifier:
-    def __init__(self):
-        # Define rules mapping specific issues to regex patterns
-        # The order can matter if logs contain multiple errors.
-        self.rules = {
-            "Process Issue": {
-                "MISSING_LOCAL_PROPERTIES": [re.compile(r"SDK location not found"), re.compile(r"assert localPropertiesFile"), re.compile(r"local\.properties file not found")],
-                "MISSING_KEYSTORE": [re.compile(r"Keystore file '.*' not found for signing config"), re.compile(r"(keystore|signing)\.properties \(No such file or directory\)")],
-                "MISSING_GRADLE_WRAPPER": [re.compile(r"Could not find or load main class org\.gradle\.wrapper\.GradleWrapperMain")],
-                "NON_DEFAULT_BUILD_COMMAND": [re.compile(r"Task '.*' not found")],
-            },
-            "Environment Issue": {
-                "GRADLE_BUILD_SYSTEM": [re.compile(r"Failed to create Jar file"), ],
-                "GRADLE_VERSION": [re.compile(r"Failed to notify project evaluation listener")],
-                "GRADLE_JDK_MISMATCH": [re.compile(r"Gradle requires JVM (\d+)"), re.compile(r"compiler does not export"), re.compile(r"Could not initialize class org\.codehaus\.groovy")],
-                "JAVA_KOTLIN_MISMATCH": [re.compile(r"Inconsistent JVM Target Compatibility Between Java and Kotlin Tasks")],
-                "JDK_VERSION": [re.compile(r"unrecognized JVM option"), re.compile(r"Cannot find a Java installation on your machine"), re.compile(r"invalid source release: (\d+)"), re.compile(r" Run this build using a Java (\d+) or newer JVM"), re.compile(r"Unsupported class file major version (\d+)"),
-                    re.compile(r"Android Gradle plugin requires Java (\d+)"), re.compile(r"compiled by a more recent version of the Java Runtime"), re.compile(r"Could not determine java version from")],
-                "ANDROID_SDK_VERSION": [re.compile(r"Failed to find Build Tools revision")],
-                "MISSING_NDK": [re.compile(r"No version of NDK matched")],
-                "NO_DISK_SPACE": [re.compile(r"No space left on device")],
-                "MISSING_DEPENDENCY": [re.compile(r"Could not resolve all (?:artifacts|files|task dependencies|dependencies) for configuration")],
-            },
-            "Project Issue": {
-                "CONFIG_VERSION_CONFLICT": [re.compile(r"try editing the distributionUrl")],
-                "COMPILATION_ERROR": [re.compile(r"Compilation failed")],
-            }
-        }
-
-    def classify(self, log_output: str) -> tuple[str, str] | None:
-        """
-        Classifies the error in a log using predefined regex rules.
-
-        Returns:
-            A tuple (category, specific_issue) if a match is found, otherwise None.
-        """
-        for category, issues in self.rules.items():
-            for specific_issue, patterns in issues.items():
-                for pattern in patterns:
-                    if pattern.search(log_output):
-                        return (category, specific_issue)
-        return None
-    
 def extract_build_attempts(extracted_content: str) -> list[dict[str, str]]:
     """
     Extracts build attempts from the provided content.
@@ -116,22 +97,127 @@ def extract_build_attempts(extracted_content: str) -> list[dict[str, str]]:
 
     return build_attempts
 
-def run_post_process(project_name):
+def split_prompt_history(content: str) -> tuple[str, list[str]]:
+    """
+    Splits a prompt history into the initial prompt and one entry per cycle.
+
+    Works for both the stateless (`Command N`) and conversation (`PROMPT N`) layouts.
+    """
+    starts = [match.start() for match in CYCLE_MARKER.finditer(content)]
+    if not starts:
+        return content, []
+    cycles = [content[start:end] for start, end in zip(starts, starts[1:] + [len(content)])]
+    return content[:starts[0]], cycles
+
+def condense_prompt_history(content: str, project_name: str) -> str:
+    """
+    Returns the prompt history, condensed to fit a single summary request.
+
+    Short histories are returned as is. Longer ones are split into chunks of
+    whole cycles, the chunks are summarized concurrently, and the summaries are
+    returned in order. At most POST_PROCESS_HISTORY_MAX_TOKENS (environment
+    variable, default 400000) estimated tokens are summarized; beyond that the
+    oldest cycles after the first chunk are left out.
+    """
+    if len(content) <= HISTORY_SINGLE_PASS_TOKENS * CHARS_PER_TOKEN:
+        return content
+    _, cycles = split_prompt_history(content)
+    if not cycles:
+        return content[-HISTORY_SINGLE_PASS_TOKENS * CHARS_PER_TOKEN:]
+
+    chunk_chars = HISTORY_CHUNK_TOKENS * CHARS_PER_TOKEN
+    chunks: list[tuple[int, int, str]] = []  # (first cycle, last cycle, text)
+    for index, cycle in enumerate(cycles, start=1):
+        cycle = cycle[:chunk_chars]
+        if chunks and len(chunks[-1][2]) + len(cycle) <= chunk_chars:
+            first, _, text = chunks[-1]
+            chunks[-1] = (first, index, text + cycle)
+        else:
+            chunks.append((index, index, cycle))
+
+    max_chunks = max(2, int(os.getenv("POST_PROCESS_HISTORY_MAX_TOKENS", default="400000")) // HISTORY_CHUNK_TOKENS)
+    omitted = None
+    if len(chunks) > max_chunks:
+        omitted = (chunks[1][0], chunks[-(max_chunks - 1)][0] - 1)
+        chunks = chunks[:1] + chunks[-(max_chunks - 1):]
+
+    def summarize_chunk(chunk: tuple[int, int, str]) -> str:
+        first, last, text = chunk
+        return ask_chatgpt(
+            f"You are summarizing part of the log of an automated agent building the Android project '{project_name}'. "
+            f"Below are cycles {first} to {last} out of {len(cycles)}; each shows the command the agent ran and its result.\n"
+            "Summarize them in at most 200 words: the errors encountered (quote the key error lines), the commands tried and whether they worked. "
+            "Ignore the JSON response format used in the log. Answer in plain text."
+            f"\n\n==================Log Start==================\n{text}\n==================Log End=================="
+        )
+
+    print(f"Prompt history has {len(cycles)} cycles; summarizing it in {len(chunks)} chunks...")
+    with ThreadPoolExecutor(max_workers=HISTORY_MAP_CONCURRENCY) as executor:
+        summaries = list(executor.map(summarize_chunk, chunks))
+    condensed = ["The prompt history was too long and is given as summaries of consecutive cycles, in order."]
+    for (first, last, _), summary in zip(chunks, summaries):
+        condensed.append(f"### Cycles {first}-{last}\n{summary.strip()}")
+        if omitted and first == 1:
+            condensed.append(f"### Cycles {omitted[0]}-{omitted[1]}\n(Omitted to bound the summary size.)")
+    return "\n\n".join(condensed)
+
+def error_excerpt(log: str) -> str:
+    """Returns the part of a failed build log that explains the failure."""
+    parser = GradleLogParser()
+    parser.feed(log)
+    parser.close()
+    sections = [f"* {name}:\n" + "\n".join(lines) for name, lines in parser.sections if name == "What went wrong"]
+    excerpt = "\n".join(sections) if sections else "\n".join(log.strip().splitlines()[-30:])
+    return excerpt[:MAX_EXCERPT_CHARS]
+
+def parse_llm_json_array(response: str) -> list:
+    """Parses a JSON array from an LLM response, tolerating text around it."""
+    try:
+        parsed = json.loads(response)
+    except json.JSONDecodeError:
+        start_index = response.find('[')
+        end_index = response.rfind(']')
+        try:
+            json_string = response[start_index:end_index + 1]
+            parsed = json.loads(json_string)
+        except json.JSONDecodeError:
+            print("LLM response is not in JSON format. Please check the response.")
+            return []
+    return parsed if isinstance(parsed, list) else []
+
+def add_llm_taxonomy(error_summary: dict, taxonomy: str) -> None:
+    if isinstance(error_summary.get(taxonomy), dict):
+        error_summary[taxonomy]["General"] += 1
+    else:
+        error_summary["Unknown"] += 1
+
+@span("post_process")
+def run_post_process(project_name, defer_unclassified: bool = False):
+    """
+    Classifies the build attempts of a project and summarizes the run with the LLM.
+
+    Args:
+        project_name: The project to post-process.
+        defer_unclassified: Save the errors no rule classified for
+            `summarize_unclassified_errors` instead of asking the LLM about them now.
+
+    Returns:
+        bool: True if the build succeeded.
+    """
     print(f"Running post-process for {project_name}...")
     # Extract agent log
     try:
         extracted_content = extract_agent_log(project_name)
     except:
         return False
-    p = PatternClassifier()
+    classifier = get_classifier()
     error_summary = {"Unknown": 0}
-    for k, v in p.rules.items():
+    for k, v in classifier.rules.items():
         error_summary[k] = {"General": 0}
         for kv in v.keys():
             error_summary[k][kv] = 0
 
     unique_errors_identified = set()
-    classifier = PatternClassifier()
     
     build_attempts = extract_build_attempts(extracted_content)
     unclassified_logs = []
@@ -146,8 +232,16 @@ def run_post_process(project_name):
             # This log contains a failure but couldn't be classified by rules
             unclassified_logs.append(attempt)
 
+    if unclassified_logs and defer_unclassified:
+        # Deduplicated here and across projects later, in one batch.
+        unclassified_errors = {}
+        for log in unclassified_logs:
+            excerpt = error_excerpt(log)
+            unclassified_errors.setdefault(error_signature(excerpt), excerpt)
+        with open(f"builDroid_tests/{project_name}/output/{UNCLASSIFIED_ERRORS_FILE}", "w") as f:
+            json.dump([{"signature": s, "excerpt": e} for s, e in unclassified_errors.items()], f, indent=4)
     # LLM Fallback for Unclassified Errors 
-    if unclassified_logs:
+    elif unclassified_logs:
         print(f"Found {len(unclassified_logs)} unclassified error(s). Falling back to LLM for summary.")
         # We only call the LLM if there's something it needs to do.
         # We pass only the unclassified logs to save tokens and focus the LLM.
@@ -158,28 +252,15 @@ def run_post_process(project_name):
         response = ask_chatgpt(prompt)
         with open(f"builDroid_tests/{project_name}/output/unknown_error_llm_summary.txt", "w") as f:
             f.write(response)
-        # Parse the LLM response
-        try:
-            llm_summary = json.loads(response)
-        except json.JSONDecodeError:
-            start_index = response.find('[')
-            end_index = response.rfind(']')
-            try:
-                json_string = response[start_index:end_index + 1]
-                llm_summary = json.loads(json_string)
-            except json.JSONDecodeError:
-                print("LLM response is not in JSON format. Please check the response.")
-                llm_summary = []
-        # Merge LLM results into our main summary
-        for entry in llm_summary:
-            if entry["taxonomy"] == "Unknown":
-                error_summary["Unknown"] += 1
-            else:
-                error_summary[entry["taxonomy"]]["General"] += 1
+        # Parse the LLM response and merge the results into our main summary
+        for entry in parse_llm_json_array(response):
+            add_llm_taxonomy(error_summary, entry.get("taxonomy") if isinstance(entry, dict) else None)
     
     with open(f"builDroid_tests/{project_name}/output/error_summary.json", "w") as f:
         json.dump(error_summary, f, indent=4)
+    classifier.save_hits()
 
+    extracted_content = condense_prompt_history(extracted_content, project_name)
     if glob.glob(f"builDroid_tests/{project_name}/output/*.apk"):   
         summarize_attempt_prompt = (
             f"You are an expert software engineering assistant. The following log details the successful, automated build process for the '{project_name}' project. "
@@ -191,6 +272,13 @@ def run_post_process(project_name):
         attempt_summary = f"builDroid_tests/{project_name}/output/SUCCESS"
         with open(attempt_summary, 'w') as f:
             f.write(response)
+        try:
+            indexed = index_successful_run(project_name)
+        except sqlite3.Error as e:
+            print(f"Warning: could not add the fixes of {project_name} to the fix knowledge base: {e}")
+        else:
+            if indexed:
+                print(f"Added {indexed} fix(es) of {project_name} to the fix knowledge base.")
         return True
 
     # Prepare the query for ask_chatgpt
@@ -213,6 +301,150 @@ def run_post_process(project_name):
     print(f"Post-process for {project_name} completed. Summary saved to {problems_memory}.")
     return False
     
+def summarize_unclassified_errors(project_names: list[str], max_workers: int = 2) -> int:
+    """
+    Asks the LLM about the unclassified errors saved by `run_post_process(defer_unclassified=True)`.
+
+    Errors are deduplicated by signature across all projects, each unique error
+    is sent once, in requests of UNCLASSIFIED_BATCH_SIZE errors, and the results
+    are merged into every affected project's error_summary.json.
+
+    If a request fails, the projects with errors in it keep their
+    unclassified_errors.json and are left out; the other projects are merged.
+
+    Returns:
+        int: The number of unique errors sent to the LLM.
+    """
+    excerpts: dict[str, str] = {}
+    project_signatures: dict[str, list[str]] = {}
+    for project_name in project_names:
+        path = f"builDroid_tests/{project_name}/output/{UNCLASSIFIED_ERRORS_FILE}"
+        if not os.path.exists(path):
+            continue
+        with open(path, "r") as f:
+            entries = json.load(f)
+        project_signatures[project_name] = [entry["signature"] for entry in entries]
+        for entry in entries:
+            excerpts.setdefault(entry["signature"], entry["excerpt"])
+    if not excerpts:
+        return 0
+
+    signatures = list(excerpts)
+    print(f"Summarizing {len(signatures)} unique unclassified error(s) from {len(project_signatures)} project(s) with the LLM...")
+    files_path = files("builDroid.prompts.prompt_files").joinpath("post_process_batch_prompt")
+    with files_path.open("r", encoding="utf-8") as prompt_file:
+        prompt = prompt_file.read()
+
+    def classify_batch(start: int) -> tuple[dict[str, dict], list[str]]:
+        """Returns the classified errors of a batch, and the errors of the batch if the request failed."""
+        batch = {str(i): excerpts[signatures[i]] for i in range(start, min(start + UNCLASSIFIED_BATCH_SIZE, len(signatures)))}
+        try:
+            response = ask_chatgpt(prompt + json.dumps(batch, indent=2))
+        except Exception as e:
+            print(f"Summarizing unclassified errors {start + 1}-{start + len(batch)} failed: {e}")
+            return {}, [signatures[int(i)] for i in batch]
+        results = {}
+        for entry in parse_llm_json_array(response):
+            if isinstance(entry, dict) and str(entry.get("id")) in batch:
+                results[signatures[int(entry["id"])]] = entry
+        return results, []
+
+    llm_results: dict[str, dict] = {}
+    failed: set[str] = set()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for results, failed_signatures in executor.map(classify_batch, range(0, len(signatures), UNCLASSIFIED_BATCH_SIZE)):
+            llm_results.update(results)
+            failed.update(failed_signatures)
+
+    for project_name, project_errors in project_signatures.items():
+        if failed.intersection(project_errors):
+            # Left for a later call, which sends these errors again.
+            print(f"Unclassified errors of {project_name} were not summarized; "
+                  f"they stay in builDroid_tests/{project_name}/output/{UNCLASSIFIED_ERRORS_FILE}.")
+            continue
+        output_dir = f"builDroid_tests/{project_name}/output"
+        with open(f"{output_dir}/error_summary.json", "r") as f:
+            error_summary = json.load(f)
+        llm_summary = []
+        for signature in project_errors:
+            entry = llm_results.get(signature, {"thoughts": "The LLM returned no classification for this error.", "taxonomy": "Unknown"})
+            add_llm_taxonomy(error_summary, entry.get("taxonomy"))
+            llm_summary.append({"thoughts": entry.get("thoughts", ""), "taxonomy": entry.get("taxonomy", "Unknown"), "excerpt": excerpts[signature]})
+        with open(f"{output_dir}/unknown_error_llm_summary.txt", "w") as f:
+            json.dump(llm_summary, f, indent=4)
+        with open(f"{output_dir}/error_summary.json", "w") as f:
+            json.dump(error_summary, f, indent=4)
+        # Merged; make sure a later batch does not count these errors again.
+        os.remove(f"{output_dir}/{UNCLASSIFIED_ERRORS_FILE}")
+    return len(signatures)
+
+
+class PostProcessPool:
+    """
+    Runs `run_post_process` for finished projects on a pool of worker threads.
+
+    Finished projects queue up in the pool while the next project's build starts.
+    The number of workers bounds how many projects are summarized by the LLM at
+    once; set it with the POST_PROCESS_CONCURRENCY environment variable.
+
+    With `batch_unclassified`, errors no rule classified are collected from all
+    projects and sent to the LLM in deduplicated batches when the pool is joined.
+    """
+
+    def __init__(self, max_workers: int | None = None, batch_unclassified: bool = False):
+        if max_workers is None:
+            max_workers = int(os.getenv("POST_PROCESS_CONCURRENCY", default="2"))
+        self.max_workers = max(1, max_workers)
+        self.batch_unclassified = batch_unclassified
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="builDroid-post-process")
+        self._futures: dict[str, Future] = {}
+
+    def submit(self, project_name: str, then: Callable[[], None] | None = None) -> Future:
+        """
+        Queues a project for post-processing.
+
+        Args:
+            project_name: The project to post-process.
+            then: Called in the worker once post-processing is over, e.g. to update the project cache.
+
+        Returns:
+            Future: Resolves to the result of `run_post_process`.
+        """
+        def task() -> bool:
+            try:
+                succeeded = run_post_process(project_name, defer_unclassified=self.batch_unclassified)
+                if succeeded:
+                    print(f"Post-process succeeded. The extracted .apk file is in the "
+                          f"builDroid_tests/{project_name}/output folder.")
+                return succeeded
+            finally:
+                if then is not None:
+                    then()
+
+        # A copy of the submitting context keeps the project's trace active in the worker.
+        future = self._executor.submit(contextvars.copy_context().run, task)
+        self._futures[project_name] = future
+        return future
+
+    def join(self) -> dict[str, bool]:
+        """
+        Waits for all queued projects.
+
+        Returns:
+            dict: The post-process result of each project. Failed runs count as False.
+        """
+        self._executor.shutdown(wait=True)
+        results = {}
+        for project_name, future in self._futures.items():
+            try:
+                results[project_name] = future.result()
+            except Exception as e:
+                print(f"Post-process for {project_name} failed: {e}")
+                results[project_name] = False
+        if self.batch_unclassified:
+            summarize_unclassified_errors(list(self._futures), max_workers=self.max_workers)
+        return results
+
 
 if __name__ == "__main__":
     api_token_setup()
@@ -1,13 +1,18 @@
 import os
-import pandas as pd
 import json
 
+from builDroid.utils.error_classifier import get_classifier
+from builDroid.utils.metrics import load_metrics, summarize_metrics
+from builDroid.utils.model_cascade import load_model_tiers
+from builDroid.utils.tracing import load_trace, waterfall_rows
+
 def create_results_sheet():
+    import pandas as pd
+
     # --- 1. Define the error structure and create unique internal column names ---
+    # Categories and issues come from the error rule catalogue, plus a "General" bucket per category.
     error_structure = {
-        "Process Issue": ["MISSING_LOCAL_PROPERTIES", "MISSING_KEYSTORE", "MISSING_GRADLE_WRAPPER", "NON_DEFAULT_BUILD_COMMAND", "General"],
-        "Environment Issue": ["GRADLE_BUILD_SYSTEM", "GRADLE_VERSION", "GRADLE_JDK_MISMATCH", "JAVA_KOTLIN_MISMATCH", "JDK_VERSION", "ANDROID_SDK_VERSION", "MISSING_NDK", "NO_DISK_SPACE", "MISSING_DEPENDENCY", "General"],
-        "Project Issue": ["CONFIG_VERSION_CONFLICT", "COMPILATION_ERROR", "General"]
+        category: [*issues, "General"] for category, issues in get_classifier().rules.items()
     }
 
     # Create a list of unique internal column names for specific issues
@@ -26,6 +31,10 @@ def create_results_sheet():
 
     # Final list to store data for each project row
     data = []
+    # Phase timings of each project, for the "Waterfall" sheet
+    waterfall = []
+    # Latency and cost of each model tier, for the "Model Tiers" sheet
+    model_tiers = []
 
     # --- 2. Loop through each project folder ---
     for project_name in os.listdir("builDroid_tests"):
@@ -49,6 +58,13 @@ def create_results_sheet():
             "Elapsed Time": elapsed_time
         }
 
+        # Where the time went: model-bound projects have high LLM/Backoff Time,
+        # container-bound ones high Command Time.
+        metric_totals = summarize_metrics(load_metrics(project_name))
+        project_data_row.update(metric_totals)
+        waterfall += [{"Project Name": project_name, **row} for row in waterfall_rows(load_trace(project_name))]
+        model_tiers += [{"Project Name": project_name, **tier} for tier in load_model_tiers(project_name)]
+
         # Load the error summary JSON
         error_summary_path = os.path.join(project_folder, "output", "error_summary.json")
         if os.path.exists(error_summary_path):
@@ -96,7 +112,8 @@ def create_results_sheet():
     total_row["Status"] = ""
 
     # Sum all numeric columns for the total row using the unique internal names
-    numeric_cols = ["CMD Count", "Elapsed Time"] + flat_specific_issue_columns + category_columns + ["Unknown", "Total Errors"]
+    metric_cols = list(summarize_metrics([]))
+    numeric_cols = ["CMD Count", "Elapsed Time"] + metric_cols + flat_specific_issue_columns + category_columns + ["Unknown", "Total Errors"]
     for col in numeric_cols:
         if col in df.columns:
             total_row[col] = df[col].sum()
@@ -104,15 +121,19 @@ def create_results_sheet():
     df = pd.concat([df, total_row.to_frame().T], ignore_index=False)
 
     # --- 5. Rename columns to the desired display names before exporting ---
-    rename_map = {
-        "Process Issue_General": "General",
-        "Environment Issue_General": "General",
-        "Project Issue_General": "General",
-    }
+    rename_map = {f"{category}_General": "General" for category in error_structure}
     df.rename(columns=rename_map, inplace=True)
 
     # --- 6. Export to Excel ---
-    df.to_excel("experiment_results.xlsx", index=False)
+    with pd.ExcelWriter("experiment_results.xlsx") as writer:
+        df.to_excel(writer, sheet_name="Results", index=False)
+        if waterfall:
+            pd.DataFrame(waterfall).to_excel(writer, sheet_name="Waterfall", index=False)
+        if model_tiers:
+            tiers_df = pd.DataFrame(model_tiers)
+            totals = tiers_df.drop(columns=["Project Name"]).groupby(["tier", "model"], as_index=False).sum()
+            totals.insert(0, "Project Name", "Total")
+            pd.concat([tiers_df, totals], ignore_index=True).to_excel(writer, sheet_name="Model Tiers", index=False)
     print("Spreadsheet 'experiment_results.xlsx' created.")
 
 # To run the function
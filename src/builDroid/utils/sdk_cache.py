@@ -0,0 +1,52 @@
+import docker
+
+from builDroid.commands.android_sdk import LIST_SDK_PACKAGES_SCRIPT, parse_sdk_package_list, sdkmanager_command
+from builDroid.commands.docker_helpers_static import SDK_CACHE_VOLUME, check_image_exists, ensure_sdk_cache_volume
+
+IMAGE_TAG = "buildroid:1.3.2"
+
+def _run_in_sdk_cache(script: str) -> bytes:
+    """Runs a shell script in a throwaway container with the SDK cache mounted."""
+    client = docker.from_env()
+    return client.containers.run(
+        IMAGE_TAG,
+        ["sh", "-c", script],
+        volumes=ensure_sdk_cache_volume(),
+        remove=True,
+        stdout=True,
+        stderr=True,
+    )
+
+def _check_image() -> bool:
+    if check_image_exists(IMAGE_TAG):
+        return True
+    print(f"Docker image {IMAGE_TAG} not found. Run `buildroid build` once to build it.")
+    return False
+
+def list_sdk_cache():
+    """Prints the SDK packages stored in the shared SDK cache volume."""
+    if not _check_image():
+        return 1
+    packages = sorted(parse_sdk_package_list(_run_in_sdk_cache(LIST_SDK_PACKAGES_SCRIPT)))
+    print(f"SDK cache volume '{SDK_CACHE_VOLUME}' ({len(packages)} packages):")
+    for package in packages:
+        print(f"  {package}")
+    return 0
+
+def seed_sdk_cache(packages: list[str]):
+    """
+    Installs SDK packages into the shared SDK cache volume.
+
+    Args:
+        packages: sdkmanager package names, e.g. `platforms;android-34`.
+    """
+    if not _check_image():
+        return 1
+    print(f"Installing into SDK cache volume '{SDK_CACHE_VOLUME}': {', '.join(packages)}")
+    try:
+        _run_in_sdk_cache(sdkmanager_command(packages))
+    except docker.errors.ContainerError as e:
+        print(f"sdkmanager failed: {e}")
+        return 1
+    print("Done.")
+    return 0
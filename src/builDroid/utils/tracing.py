@@ -0,0 +1,245 @@
+import contextvars
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+TRACE_FILE_NAME = "trace.jsonl"
+OTLP_FILE_NAME = "trace.otlp.json"
+SERVICE_NAME = "builDroid"
+WATERFALL_WIDTH = 60
+
+# OTLP status codes
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    start_ns: int
+    end_ns: int | None = None
+    attributes: dict = field(default_factory=dict)
+    status: int = STATUS_UNSET
+    status_message: str = ""
+
+    @property
+    def duration(self) -> float:
+        """Seconds between start and end, or until now if the span is open."""
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e9
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def to_otlp(self) -> dict:
+        """Returns the span in the OTLP/JSON span encoding."""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns if self.end_ns is not None else self.start_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": self.status, "message": self.status_message},
+        }
+
+    @classmethod
+    def from_otlp(cls, record: dict) -> "Span":
+        return cls(
+            name=record["name"],
+            trace_id=record["traceId"],
+            span_id=record["spanId"],
+            parent_id=record.get("parentSpanId") or None,
+            start_ns=int(record["startTimeUnixNano"]),
+            end_ns=int(record["endTimeUnixNano"]),
+            attributes={a["key"]: next(iter(a["value"].values()), None) for a in record.get("attributes", [])},
+            status=record.get("status", {}).get("code", STATUS_UNSET),
+            status_message=record.get("status", {}).get("message", ""),
+        )
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Tracer:
+    """
+    Collects the spans of one project's pipeline.
+
+    Spans are kept in memory until an output project is set and the root span
+    ends, because the project's test directory is recreated at the start of each
+    run. Spans that end later, e.g. deferred post-processing, rewrite the files.
+    """
+
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.spans: list[Span] = []
+        self.project_name: str | None = None
+        """The project whose test directory the trace is written to; None to not write it."""
+        self._lock = threading.Lock()
+        self._root_ended = False
+
+    def finish(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+            if span.parent_id is None:
+                self._root_ended = True
+            if self._root_ended:
+                self._write()
+
+    def _write(self) -> None:
+        if self.project_name is None:
+            return
+        project_dir = os.path.join("builDroid_tests", self.project_name)
+        if not os.path.isdir(project_dir):
+            return
+        spans = sorted(self.spans, key=lambda s: s.start_ns)
+        with open(os.path.join(project_dir, TRACE_FILE_NAME), "w", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_otlp()) + "\n")
+        if os.getenv("BUILDROID_TRACE_OTLP", "false").lower() == "true":
+            document = {"resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+                    {"key": "buildroid.project", "value": {"stringValue": self.project_name}},
+                ]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": [s.to_otlp() for s in spans]}],
+            }]}
+            with open(os.path.join(project_dir, OTLP_FILE_NAME), "w", encoding="utf-8") as f:
+                json.dump(document, f)
+
+
+_current_tracer: contextvars.ContextVar[Tracer | None] = contextvars.ContextVar("buildroid_tracer", default=None)
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar("buildroid_span", default=None)
+
+
+def current_tracer() -> Tracer | None:
+    return _current_tracer.get()
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Records the block as a span, nested under the current span.
+
+    Does nothing outside a traced pipeline. Can also decorate a function:
+    `@span("docker.start_container")`. Worker threads only see the span of the
+    thread that submitted them if they run in a copied context
+    (`contextvars.copy_context().run`).
+
+    Yields:
+        Span | None: The span, to add attributes to, or None if not tracing.
+    """
+    tracer = _current_tracer.get()
+    if tracer is None:
+        yield None
+        return
+    parent = _current_span.get()
+    current = Span(
+        name=name,
+        trace_id=tracer.trace_id,
+        span_id=secrets.token_hex(8),
+        parent_id=parent.span_id if parent else None,
+        start_ns=time.time_ns(),
+        attributes=dict(attributes),
+    )
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = STATUS_ERROR
+        current.status_message = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end_ns = time.time_ns()
+        tracer.finish(current)
+
+
+def trace_pipeline(name: str):
+    """
+    Decorates a pipeline entry point: each call gets a new Tracer whose root span
+    covers the call. Calls made while a pipeline is already traced nest instead.
+    Set `current_tracer().project_name` in the call to write the trace out.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_tracer.get() is not None:
+                with span(name):
+                    return func(*args, **kwargs)
+            token = _current_tracer.set(Tracer())
+            try:
+                with span(name):
+                    return func(*args, **kwargs)
+            finally:
+                _current_tracer.reset(token)
+        return wrapper
+    return decorator
+
+
+def load_trace(project_name: str) -> list[Span]:
+    """Reads the spans of a project's trace. Returns [] if there is none."""
+    path = os.path.join("builDroid_tests", project_name, TRACE_FILE_NAME)
+    if not os.path.exists(path):
+        return []
+    spans = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                spans.append(Span.from_otlp(json.loads(line)))
+    return spans
+
+
+def waterfall_rows(spans: list[Span], width: int = WATERFALL_WIDTH) -> list[dict]:
+    """
+    Lays spans out as a waterfall: depth-first, children in start order, each
+    with its offset from the first span and a text bar scaled to `width`.
+    """
+    if not spans:
+        return []
+    children: dict[str | None, list[Span]] = {}
+    ids = {s.span_id for s in spans}
+    for s in spans:
+        parent = s.parent_id if s.parent_id in ids else None
+        children.setdefault(parent, []).append(s)
+    start = min(s.start_ns for s in spans)
+    end = max(s.end_ns or s.start_ns for s in spans)
+    scale = width / max(end - start, 1)
+
+    rows = []
+    def visit(parent_id, depth):
+        for s in sorted(children.get(parent_id, []), key=lambda s: s.start_ns):
+            offset = int((s.start_ns - start) * scale)
+            length = max(1, int(((s.end_ns or s.start_ns) - s.start_ns) * scale))
+            rows.append({
+                "Phase": "  " * depth + s.name,
+                "Start (s)": round((s.start_ns - start) / 1e9, 2),
+                "Duration (s)": round(s.duration, 2),
+                "Status": "error" if s.status == STATUS_ERROR else "",
+                "Timeline": " " * offset + "#" * min(length, width - offset or 1),
+            })
+            visit(s.span_id, depth + 1)
+    visit(None, 0)
+    return rows
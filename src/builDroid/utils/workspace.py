@@ -0,0 +1,78 @@
+import os
+import shutil
+import stat
+import tarfile
+
+# copy: `docker cp` the checkout into the container (default).
+# bind: bind-mount the checkout, so the container edits it in place.
+# overlay: mount the checkout as the lower layer of an overlay, so only changed files are written.
+WORKSPACE_MODES = ("copy", "bind", "overlay")
+
+# Overlayfs marks a directory whose lower contents are hidden with this xattr.
+OVERLAY_OPAQUE_XATTRS = ("trusted.overlay.opaque", "user.overlay.opaque")
+# GNU tar stores extended attributes as pax headers with this prefix.
+PAX_XATTR_PREFIX = "SCHILY.xattr."
+
+def _is_whiteout(member: tarfile.TarInfo) -> bool:
+    """Overlayfs records deleted files as 0/0 character devices in the upper layer."""
+    return member.ischr() and member.devmajor == 0 and member.devminor == 0
+
+def _is_opaque(member: tarfile.TarInfo) -> bool:
+    return any(member.pax_headers.get(PAX_XATTR_PREFIX + attr) == "y" for attr in OVERLAY_OPAQUE_XATTRS)
+
+def _remove(path: str):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+def export_overlay_changes(upper: tarfile.TarFile, dest_dir: str) -> int:
+    """
+    Applies the changes recorded in an overlay upper layer onto a directory tree.
+
+    The upper layer is read as a tar archive made by root inside a container
+    (see `docker_helpers_static.export_overlay_upper`): the container's root
+    user owns the layer, and only root can read the xattrs marking opaque
+    directories. The archive must carry those xattrs (`tar --xattrs`).
+
+    Args:
+        upper: The upper layer, opened for reading; a stream (`r|`) is fine.
+        dest_dir: The tree to update, usually the lower layer or a copy of it.
+
+    Returns:
+        int: The number of changed paths (files written or removed).
+    """
+    changed = 0
+    for member in upper:
+        name = os.path.normpath(member.name)
+        if name == "." or os.path.isabs(name) or name.split(os.sep)[0] == "..":
+            continue
+        dest = os.path.join(dest_dir, name)
+
+        if member.isdir():
+            if _is_opaque(member) or os.path.islink(dest) or (os.path.lexists(dest) and not os.path.isdir(dest)):
+                # An opaque directory was removed and recreated in the container,
+                # so its lower contents must not survive the export.
+                _remove(dest)
+            os.makedirs(dest, exist_ok=True)
+            continue
+
+        # Remove first rather than write through: the destination may be a
+        # directory, a symlink, or a file hard-linked elsewhere.
+        _remove(dest)
+        if not _is_whiteout(member):
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            if member.issym():
+                os.symlink(member.linkname, dest)
+            elif member.islnk():
+                shutil.copy2(os.path.join(dest_dir, os.path.normpath(member.linkname)), dest)
+            elif member.isfile():
+                with upper.extractfile(member) as src, open(dest, "wb") as out:
+                    shutil.copyfileobj(src, out)
+                # Files root created as 0600 stay readable to the user running builDroid.
+                os.chmod(dest, (member.mode & 0o777) | stat.S_IRUSR | stat.S_IWUSR)
+                os.utime(dest, (member.mtime, member.mtime))
+            else:
+                continue
+        changed += 1
+    return changed
@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def working_directory(tmp_path, monkeypatch):
+    """Runs each test in its own directory, so builDroid_tests/ and the logs stay out of the checkout."""
+    monkeypatch.chdir(tmp_path)
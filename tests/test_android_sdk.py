@@ -0,0 +1,64 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from builDroid.commands.android_sdk import (
+    SdkPrefetcher,
+    parse_sdk_package_list,
+    required_sdk_packages,
+    runs_sdkmanager_or_gradle,
+)
+from builDroid.commands.gradle_project import GradleProject, GradleScript
+
+
+@pytest.mark.parametrize("command", [
+    "./gradlew assembleDebug",
+    "cd /app && ./gradlew assembleDebug --stacktrace",
+    "gradle build",
+    "sdkmanager 'platforms;android-34'",
+    "yes | sdkmanager --licenses",
+    "JAVA_HOME=/opt/jdk17 ./gradlew build",
+    "sudo sdkmanager --update",
+    "timeout 600 ./gradlew assembleDebug",
+    "sh gradlew assembleDebug",
+    "/opt/android-sdk/cmdline-tools/latest/bin/sdkmanager --list",
+    "echo start; (./gradlew clean)",
+    "gradlew.bat assembleDebug",
+])
+def test_runs_sdkmanager_or_gradle(command):
+    assert runs_sdkmanager_or_gradle(command)
+
+
+@pytest.mark.parametrize("command", [
+    "cat app/build.gradle",
+    "ls gradle/wrapper",
+    "sed -i 's/foo/bar/' build.gradle.kts",
+    "cat gradle.properties",
+    "grep -r sdkmanager.log .",
+    "echo gradlew",
+    "chmod +x gradlew",
+])
+def test_does_not_match_file_names_and_arguments(command):
+    assert not runs_sdkmanager_or_gradle(command)
+
+
+def test_parse_sdk_package_list():
+    output = b"platforms/android-34\nbuild-tools/34.0.0\nndk/25.1.8937393\n\nnoise\n"
+    assert parse_sdk_package_list(output) == {"platforms;android-34", "build-tools;34.0.0", "ndk;25.1.8937393"}
+
+
+def test_required_sdk_packages():
+    content = "android {\n    compileSdkVersion 33\n    buildToolsVersion '33.0.2'\n    defaultConfig { targetSdkVersion 31 }\n}\n"
+    project = GradleProject(index=None, scripts=[GradleScript("/p/app/build.gradle", ":app", content, content)])
+    assert required_sdk_packages(project) == {"platforms;android-33", "platforms;android-31", "build-tools;33.0.2"}
+
+
+def test_wait_gives_up_after_timeout():
+    prefetcher = SdkPrefetcher(channels=None)
+    prefetcher._future = Future()
+    assert prefetcher.wait(timeout=0.01) is False
+    assert prefetcher.pending
+    threading.Timer(0.01, prefetcher._future.set_result, [(0, b"", b"")]).start()
+    assert prefetcher.wait(timeout=5) is True
+    assert not prefetcher.pending
@@ -0,0 +1,150 @@
+import os
+import re
+from pathlib import Path
+
+import pytest
+
+from builDroid.utils.error_classifier import PatternClassifier, load_rules, required_literal
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+RULES_FILE = Path(__file__).resolve().parent.parent / "src" / "builDroid" / "files" / "error_rules.yaml"
+
+_CATEGORY_CHARS = {
+    sre_constants.CATEGORY_DIGIT: "7",
+    sre_constants.CATEGORY_WORD: "w",
+    sre_constants.CATEGORY_SPACE: " ",
+    sre_constants.CATEGORY_NOT_DIGIT: "x",
+    sre_constants.CATEGORY_NOT_WORD: "-",
+    sre_constants.CATEGORY_NOT_SPACE: "s",
+}
+
+
+def _example(parsed, repeat: int, branch: int) -> str:
+    """Builds a string the parsed pattern matches, taking `repeat` iterations of repeats where allowed."""
+    out = []
+    for op, arg in parsed:
+        if op == sre_constants.LITERAL:
+            out.append(chr(arg))
+        elif op == sre_constants.ANY:
+            out.append("x")
+        elif op == sre_constants.IN:
+            kind, value = arg[0]
+            if kind == sre_constants.NEGATE:
+                excluded = {chr(v) for k, v in arg[1:] if k == sre_constants.LITERAL}
+                out.append(next(c for c in "xyz#" if c not in excluded))
+            elif kind == sre_constants.LITERAL:
+                out.append(chr(value))
+            elif kind == sre_constants.RANGE:
+                out.append(chr(value[0]))
+            else:
+                out.append(_CATEGORY_CHARS[value])
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            low, high, item = arg
+            count = max(low, min(high, repeat))
+            out.append(_example(item, repeat, branch) * count)
+        elif op == sre_constants.SUBPATTERN:
+            out.append(_example(arg[-1], repeat, branch))
+        elif op == sre_constants.BRANCH:
+            alternatives = arg[1]
+            out.append(_example(alternatives[branch % len(alternatives)], repeat, branch))
+        elif op == sre_constants.AT:
+            pass
+        else:
+            raise NotImplementedError(op)
+    return "".join(out)
+
+
+def examples(pattern: re.Pattern) -> list[str]:
+    """Strings matching the pattern, with the fewest and several repeats and each alternative."""
+    parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    texts = {_example(parsed, repeat, branch) for repeat in (0, 1, 3) for branch in range(4)}
+    if pattern.flags & re.IGNORECASE:
+        texts |= {text.upper() for text in texts} | {text.lower() for text in texts}
+    return sorted(text for text in texts if pattern.search(text))
+
+
+@pytest.mark.parametrize("pattern, literal", [
+    ("SDK location not found", "SDK location not found"),
+    (r"local\.properties file not found", "local.properties file not found"),
+    (r"Gradle requires JVM (\d+)", "Gradle requires JVM "),
+    ("Task '.*' not found", "' not found"),
+    ("a{2}b", "b"),
+    ("abc{1,3}", "ab"),
+    (r"error: \d{3} found", "error: "),
+    ("abcd?ef", "abc"),
+    ("[abc]defg", "defg"),
+    ("(keystore|signing)hello", "hello"),
+    ("foo|bar", ""),
+])
+def test_required_literal(pattern, literal):
+    assert required_literal(pattern) == literal
+
+
+def test_brace_quantifier_rule_still_matches():
+    classifier = PatternClassifier({"cat": {"iss": [re.compile(r"error: \d{3} found")]}})
+    assert classifier.classify("error: 404 found") == ("cat", "iss")
+
+
+def test_prefilter_never_drops_a_regex_match():
+    rules = load_rules(RULES_FILE)
+    classifier = PatternClassifier(rules)
+    for index, rule in enumerate(classifier._compiled):
+        texts = examples(rule.pattern)
+        assert texts, f"no example generated for {rule.pattern.pattern!r}"
+        for text in texts:
+            line = f"> Task :app:compileDebugJavaWithJavac\n{text}\n"
+            assert rule.literal in (line.lower() if rule.pattern.flags & re.IGNORECASE else line)
+            assert index in {match.rule for match in classifier.finditer(line)}, (rule.pattern.pattern, text)
+
+
+def test_finditer_offsets_and_versions():
+    classifier = PatternClassifier({"Environment Issue": {"JDK_VERSION": [re.compile(r"invalid source release: (\d+)")]}})
+    log = "ok\nerror: invalid source release: 17\n"
+    [match] = classifier.finditer(log, offset=100)
+    assert (match.start, match.end) == (110, 110 + len("invalid source release: 17"))
+    assert match.versions == ("17",)
+
+
+def test_finditer_caps_matches_per_rule():
+    classifier = PatternClassifier({"cat": {"iss": [re.compile("No space left on device")]}})
+    matches = classifier.find_all("No space left on device\n" * 1000)
+    assert 0 < len(matches) < 1000
+
+
+def test_stream_matches_like_whole_text():
+    classifier = PatternClassifier(load_rules(RULES_FILE))
+    log = "Starting\nSDK location not found. Define\nUnsupported class file major version 65\n"
+    stream = classifier.stream()
+    for i in range(0, len(log), 7):
+        stream.feed(log[i:i + 7])
+    stream.close()
+    assert stream.matches == classifier.find_all(log)
+
+
+def test_edited_rules_are_reloaded(tmp_path, monkeypatch):
+    from builDroid.utils import error_classifier
+
+    monkeypatch.setattr(error_classifier, "_classifier", None)
+    monkeypatch.setattr(error_classifier, "_classifier_source", None)
+    warnings = []
+    monkeypatch.setattr(error_classifier.logger, "warn", lambda message, *args, **kwargs: warnings.append(message))
+    rules = tmp_path / "error_rules.yaml"
+    rules.write_text("Cat:\n  ONE:\n    - 'first error'\n")
+    first = error_classifier.get_classifier()
+    assert first.classify("first error") == ("Cat", "ONE")
+
+    rules.write_text("Cat:\n  TWO:\n    - 'second error'\n")
+    os.utime(rules, (1, 1))
+    second = error_classifier.get_classifier()
+    assert second.classify("second error") == ("Cat", "TWO")
+    assert second.hits is first.hits
+
+    rules.write_text("Cat:\n  BAD:\n    - '(unclosed'\n")
+    os.utime(rules, (2, 2))
+    assert error_classifier.get_classifier() is second
+    assert warnings and "Keeping the previous rules" in warnings[0]
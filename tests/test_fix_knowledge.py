@@ -0,0 +1,123 @@
+import json
+import os
+
+import pytest
+
+from builDroid.utils import cleaner
+from builDroid.utils.error_classifier import ErrorMatch
+from builDroid.utils.fix_knowledge import (
+    MAX_FIX_COMMANDS,
+    extract_fixes,
+    find_fixes,
+    format_fix_hint,
+    index_successful_run,
+    knowledge_path,
+    load_fix_trace,
+    record_fix_trace,
+    reset_fix_trace,
+)
+
+
+@pytest.fixture(autouse=True)
+def default_knowledge_path(monkeypatch):
+    monkeypatch.delenv("FIX_KNOWLEDGE_DB", raising=False)
+
+
+def match(text: str, category: str = "Environment Issue", issue: str = "JDK_VERSION") -> ErrorMatch:
+    return ErrorMatch(category=category, issue=issue, start=0, end=len(text), text=text, versions=(), rule=0)
+
+
+def record(command: str, args: dict | None = None, errors: list | None = None) -> dict:
+    return {"cycle": 0, "command": command, "args": args or {}, "errors": errors or []}
+
+
+JDK_ERROR = ["Environment Issue", "JDK_VERSION", "invalid source release: <n>"]
+BUILD = {"command": "./gradlew assembleDebug"}
+
+
+def test_fix_ends_at_rerun_of_the_failed_command():
+    trace = [
+        record("linux_terminal", BUILD, [JDK_ERROR]),
+        record("linux_terminal", {"command": "ls"}),
+        record("linux_terminal", {"command": "update-java 17"}),
+        record("linux_terminal", BUILD),
+        record("linux_terminal", {"command": "cat out.txt"}),
+    ]
+    [fix] = extract_fixes(trace)
+    assert fix["signature"] == JDK_ERROR[2]
+    assert [c["args"]["command"] for c in fix["commands"]] == ["ls", "update-java 17"]
+
+
+def test_fix_without_rerun_ends_at_first_clean_output():
+    trace = [
+        record("linux_terminal", BUILD, [JDK_ERROR]),
+        record("linux_terminal", {"command": "update-java 17"}),
+        record("linux_terminal", {"command": "ls"}),
+    ]
+    [fix] = extract_fixes(trace)
+    assert [c["args"]["command"] for c in fix["commands"]] == ["update-java 17"]
+
+
+def test_error_seen_again_uses_its_last_occurrence():
+    trace = [
+        record("linux_terminal", BUILD, [JDK_ERROR]),
+        record("linux_terminal", {"command": "wrong fix"}, [JDK_ERROR]),
+        record("linux_terminal", {"command": "right fix"}),
+    ]
+    [fix] = extract_fixes(trace)
+    assert [c["args"]["command"] for c in fix["commands"]] == ["right fix"]
+
+
+def test_unresolved_error_is_left_out():
+    trace = [record("linux_terminal", BUILD, [JDK_ERROR])]
+    trace += [record("linux_terminal", {"command": f"try {i}"}, [["Project Issue", "OTHER", f"other {i}"]])
+              for i in range(MAX_FIX_COMMANDS + 1)]
+    assert JDK_ERROR[2] not in {fix["signature"] for fix in extract_fixes(trace)}
+
+
+def test_trace_round_trip_and_reset():
+    record_fix_trace("app", 1, "linux_terminal", BUILD, [match("invalid source release: 17"), match("invalid source release: 11")])
+    record_fix_trace("app", 2, "linux_terminal", None, [])
+    trace = load_fix_trace("app")
+    assert [r["cycle"] for r in trace] == [1, 2]
+    assert trace[0]["errors"] == [JDK_ERROR]
+    reset_fix_trace("app")
+    assert load_fix_trace("app") == []
+
+
+def index(project: str, trace: list[dict]) -> int:
+    os.makedirs(os.path.join("builDroid_tests", project), exist_ok=True)
+    with open(os.path.join("builDroid_tests", project, "fix_trace.jsonl"), "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(r) + "\n" for r in trace)
+    return index_successful_run(project)
+
+
+def test_find_fixes_prefers_same_signature_and_skips_own_project():
+    same_issue = ["Environment Issue", "JDK_VERSION", "Unsupported class file major version <n>"]
+    assert index("a", [record("linux_terminal", BUILD, [same_issue]), record("linux_terminal", {"command": "fix a"})]) == 1
+    assert index("b", [record("linux_terminal", BUILD, [JDK_ERROR]), record("linux_terminal", {"command": "fix b"})]) == 1
+    assert os.path.exists(knowledge_path())
+    assert knowledge_path().startswith("builDroid_tests")
+
+    fixes = find_fixes([match("invalid source release: 17")], "c")
+    assert [fix["project"] for fix in fixes] == ["b", "a"]
+    assert find_fixes([match("invalid source release: 17")], "b")[0]["project"] == "a"
+    assert find_fixes([match("invalid source release: 17")], "c", exclude={(JDK_ERROR[2], "b")})[0]["project"] == "a"
+    assert find_fixes([match("x", issue="MISSING_NDK")], "c") == []
+    assert "fix b" in format_fix_hint(fixes)
+
+
+def test_knowledge_base_can_be_turned_off(monkeypatch):
+    monkeypatch.setenv("FIX_KNOWLEDGE_DB", "")
+    assert index("a", [record("linux_terminal", BUILD, [JDK_ERROR]), record("linux_terminal", {"command": "fix"})]) == 0
+    assert find_fixes([match("invalid source release: 17")], "b") == []
+
+
+def test_clean_keeps_knowledge_base_unless_asked():
+    index("a", [record("linux_terminal", BUILD, [JDK_ERROR]), record("linux_terminal", {"command": "fix"})])
+    cleaner.clean_workspace(no_docker=True)
+    assert os.path.exists(knowledge_path())
+    assert not os.path.exists(os.path.join("builDroid_tests", "a"))
+    assert find_fixes([match("invalid source release: 17")], "b")
+    cleaner.clean_workspace(no_docker=True, remove_knowledge=True)
+    assert not os.path.exists(knowledge_path())
@@ -0,0 +1,76 @@
+from builDroid.utils.gradle_log import DIGEST_MIN_CHARS, GradleLogParser, summarize_gradle_output
+from builDroid.utils.post_process import extract_build_attempts
+
+DOWNLOADS = "".join(f"Download https://repo.maven.apache.org/maven2/lib{i}/1.0/lib{i}-1.0.pom\n" for i in range(60))
+
+FAILED_BUILD = DOWNLOADS + """\
+> Task :app:preBuild UP-TO-DATE
+> Task :app:compileDebugJavaWithJavac FAILED
+/app/src/main/java/com/example/Main.java:12: error: cannot find symbol
+e: file:///app/src/main/kotlin/Foo.kt:10:5 Unresolved reference: x
+
+FAILURE: Build failed with an exception.
+
+* What went wrong:
+Execution failed for task ':app:compileDebugJavaWithJavac'.
+> Compilation failed; see the compiler error output for details.
+
+* Try:
+> Run with --stacktrace option to get the stack trace.
+
+* Get more help at https://help.gradle.org
+
+BUILD FAILED in 12s
+3 actionable tasks: 1 executed, 2 up-to-date
+"""
+
+
+def parse(output: str, chunk_size: int | None = None) -> GradleLogParser:
+    parser = GradleLogParser()
+    chunk_size = chunk_size or len(output)
+    for i in range(0, len(output), chunk_size):
+        parser.feed(output[i:i + chunk_size])
+    parser.close()
+    return parser
+
+
+def test_parser_collects_failure_parts():
+    parser = parse(FAILED_BUILD)
+    assert parser.failed_tasks == [":app:compileDebugJavaWithJavac"]
+    assert parser.failure_headers == ["FAILURE: Build failed with an exception."]
+    assert parser.causes == ["Compilation failed; see the compiler error output for details."]
+    assert parser.compiler_errors == [
+        "/app/src/main/java/com/example/Main.java:12: cannot find symbol",
+        "/app/src/main/kotlin/Foo.kt:10:5: Unresolved reference: x",
+    ]
+    assert parser.build_result == "BUILD FAILED in 12s"
+
+
+def test_parser_is_independent_of_chunking():
+    whole = parse(FAILED_BUILD)
+    chunked = parse(FAILED_BUILD, chunk_size=13)
+    assert chunked.digest() == whole.digest()
+
+
+def test_digest_keeps_post_process_markers_in_order():
+    digest = summarize_gradle_output(FAILED_BUILD, "/app/build_log_1.txt")
+    assert digest is not None
+    assert "Download https" not in digest
+    assert "/app/build_log_1.txt" in digest
+    assert digest.index("FAILURE: Build failed") < digest.index("BUILD FAILED in 12s")
+    attempts = extract_build_attempts(digest)
+    assert len(attempts) == 1
+    assert "Execution failed for task ':app:compileDebugJavaWithJavac'." in attempts[0]
+
+
+def test_successful_build_digest_keeps_last_lines():
+    output = DOWNLOADS + "> Task :app:assembleDebug\n\nBUILD SUCCESSFUL in 40s\n42 actionable tasks: 42 executed\n"
+    digest = summarize_gradle_output(output)
+    assert digest.endswith("BUILD SUCCESSFUL in 40s")
+    assert "42 actionable tasks: 42 executed" in digest
+    assert digest.count("BUILD SUCCESSFUL") == 1
+
+
+def test_short_or_non_gradle_output_is_not_summarized():
+    assert summarize_gradle_output("BUILD FAILED in 1s\n") is None
+    assert summarize_gradle_output("x" * (DIGEST_MIN_CHARS + 1)) is None
@@ -0,0 +1,81 @@
+from builDroid.commands.gradle_project import (
+    GradleProject,
+    GradleScript,
+    _find_blocks,
+    add_google_repo,
+    update_agp_version,
+)
+
+
+def blocks(content: str, name: str) -> list[str]:
+    return [content[start:close_brace + 1] for start, _, close_brace in _find_blocks(content, name)]
+
+
+def script(path: str, module: str, content: str) -> GradleScript:
+    return GradleScript(path=path, module=module, original=content, content=content)
+
+
+def test_find_blocks_matches_nested_braces():
+    content = "android {\n    defaultConfig { minSdk 21 }\n}\nrepositories { mavenCentral() }\n"
+    assert blocks(content, "android") == ["android {\n    defaultConfig { minSdk 21 }\n}"]
+    assert blocks(content, "repositories") == ["repositories { mavenCentral() }"]
+
+
+def test_find_blocks_ignores_braces_in_strings_and_comments():
+    content = (
+        "repositories {\n"
+        "    maven { url 'https://example.com/}' }\n"
+        "    // old }\n"
+        "    /* removed } {\n"
+        "       jcenter() } */\n"
+        "    mavenCentral()\n"
+        "}\n"
+        "dependencies {}\n"
+    )
+    assert blocks(content, "repositories") == [content[:content.index("\ndependencies")]]
+
+
+def test_find_blocks_skips_unclosed_block():
+    assert _find_blocks("repositories {\n    google()\n", "repositories") == []
+
+
+def test_update_agp_version_plugins_block():
+    content = 'plugins {\n    id("com.android.application") version "7.0.0" apply false\n}\n'
+    assert update_agp_version(content, "8.2.0") == content.replace("7.0.0", "8.2.0")
+
+
+def test_update_agp_version_buildscript_classpath():
+    content = "dependencies {\n    classpath 'com.android.tools.build:gradle:4.1.3'\n}\n"
+    assert update_agp_version(content, "7.4.2") == content.replace("4.1.3", "7.4.2")
+
+
+def test_update_agp_version_leaves_other_dependencies():
+    content = "classpath 'org.jetbrains.kotlin:kotlin-gradle-plugin:1.9.0'\n"
+    assert update_agp_version(content, "8.2.0") == content
+
+
+def test_add_google_repo_only_where_missing():
+    content = "repositories {\n    mavenCentral()\n}\nallprojects {\n    repositories {\n        google()\n    }\n}\n"
+    updated = add_google_repo(content)
+    assert updated.startswith("repositories {\n    google()\n    mavenCentral()\n}")
+    assert updated.count("google()") == 2
+    assert add_google_repo(updated) == updated
+
+
+def test_set_build_tools_version_returns_changed_scripts():
+    app = script("/p/app/build.gradle", ":app", "android {\n    buildToolsVersion '29.0.2'\n}\n")
+    lib = script("/p/lib/build.gradle", ":lib", "android {\n    buildToolsVersion \"30.0.3\"\n}\n")
+    settings = script("/p/settings.gradle", ":", "include ':app', ':lib'\n")
+    project = GradleProject(index=None, scripts=[settings, app, lib])
+    assert project.set_build_tools_version("30.0.3") == [app]
+    assert project.build_tools_versions() == {":app": "30.0.3", ":lib": "30.0.3"}
+    assert project.set_build_tools_version("30.0.3") == []
+    assert not settings.changed
+
+
+def test_module_queries():
+    app = script("/p/app/build.gradle.kts", ":app", 'android {\n    compileSdk = 34\n    ndkVersion = "25.1.8937393"\n    defaultConfig { targetSdk = 33 }\n}\n')
+    project = GradleProject(index=None, scripts=[app])
+    assert project.compile_sdk_versions() == {":app": "34"}
+    assert project.target_sdk_versions() == {":app": "33"}
+    assert project.ndk_versions() == {":app": "25.1.8937393"}
@@ -0,0 +1,41 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+# Modules that `import builDroid` must not load: they are only needed by the
+# code paths that use them (results sheet, LLM providers, containers).
+HEAVY_MODULES = ["pandas", "openai", "google.genai", "docker"]
+
+# Seconds. Generous for slow CI machines; importing any one of the heavy
+# modules alone takes longer than builDroid does without them.
+IMPORT_BUDGET = float(os.getenv("BUILDROID_IMPORT_BUDGET", default="0.5"))
+
+PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import builDroid
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def import_builDroid() -> dict:
+    """Imports builDroid in a fresh interpreter and returns its import time and the heavy modules it loaded."""
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(SRC), os.getenv("PYTHONPATH")]))}
+    completed = subprocess.run([sys.executable, "-c", PROBE], capture_output=True, text=True, env=env)
+    assert completed.returncode == 0, f"import builDroid failed:\n{completed.stderr}"
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def test_import_loads_no_heavy_modules():
+    assert import_builDroid()["loaded"] == []
+
+
+def test_import_time_within_budget():
+    # The best of a few runs, so one slow start on a busy machine does not fail it.
+    seconds = min(import_builDroid()["seconds"] for _ in range(3))
+    assert seconds < IMPORT_BUDGET, f"import builDroid took {seconds:.3f}s, budget {IMPORT_BUDGET}s"
@@ -0,0 +1,61 @@
+import pytest
+
+from builDroid.utils.json_stream import CommandStreamParser, MalformedResponseError
+
+REPLY = '{"thoughts": "Build it {now}", "command": {"name": "linux_terminal", "args": {"command": "./gradlew build \\"x\\""}}, "extra": 1}'
+
+
+def feed(text: str, chunk_size: int = 1, **kwargs) -> tuple[CommandStreamParser, dict | None, int]:
+    """Feeds `text` in chunks. Returns the parser, the reply and how many characters it took."""
+    parser = CommandStreamParser(**kwargs)
+    for i in range(0, len(text), chunk_size):
+        reply = parser.feed(text[i:i + chunk_size])
+        if reply is not None:
+            return parser, reply, i + chunk_size
+    return parser, None, len(text)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, len(REPLY)])
+def test_reply_is_returned_when_command_is_complete(chunk_size):
+    _, reply, consumed = feed(REPLY, chunk_size)
+    assert reply == {
+        "thoughts": "Build it {now}",
+        "command": {"name": "linux_terminal", "args": {"command": './gradlew build "x"'}},
+    }
+    if chunk_size == 1:
+        assert consumed == REPLY.index(', "extra"')
+
+
+def test_preamble_before_the_object_is_skipped():
+    _, reply, _ = feed("Here is my answer:\n```json\n" + REPLY)
+    assert reply["command"]["name"] == "linux_terminal"
+
+
+def test_feed_after_reply_keeps_text():
+    parser, reply, _ = feed(REPLY, len(REPLY))
+    assert parser.feed(" trailing") is reply
+    assert parser.text.endswith(" trailing")
+
+
+def test_incomplete_reply_returns_none():
+    parser, reply, _ = feed(REPLY[:40])
+    assert reply is None
+    assert parser.text == REPLY[:40]
+
+
+@pytest.mark.parametrize("text, message", [
+    ("x" * 50, "no JSON object"),
+    ('{"thoughts": "a", "command": "linux_terminal"}', "not an object"),
+    ('{"thoughts": "a", "command": ["ls"]}', "not an object"),
+    ('{"thoughts": "a", "command": 3}', "not an object"),
+    ('{"thoughts": "a"}', "no 'command'"),
+    ('{"thoughts": ["a"}', "unexpected"),
+])
+def test_malformed_responses_fail_early(text, message):
+    with pytest.raises(MalformedResponseError, match=message):
+        feed(text, max_preamble=20)
+
+
+def test_nested_command_key_is_not_the_command():
+    _, reply, _ = feed('{"thoughts": {"command": "x"}, "command": {"name": "ls"}}')
+    assert reply == {"thoughts": {"command": "x"}, "command": {"name": "ls"}}
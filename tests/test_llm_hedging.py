@@ -0,0 +1,121 @@
+import threading
+import time
+
+import pytest
+
+from builDroid.utils.llm_hedging import HedgePolicy, request_cancelled
+from builDroid.utils.metrics import current_cycle, record_llm_call
+
+
+class Usage:
+    def __init__(self, prompt_tokens, completion_tokens):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+
+class Response:
+    def __init__(self, prompt_tokens, completion_tokens):
+        self.usage = Usage(prompt_tokens, completion_tokens)
+
+
+class Client:
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+def policy(**kwargs) -> HedgePolicy:
+    return HedgePolicy(api_key="key", base_url="", model="secondary-model", **kwargs)
+
+
+def answer(text, delay=0.0, tokens=(10, 5)):
+    """A request that records its usage in the cycle metrics and returns `text` after `delay` seconds."""
+    def call(client):
+        if client.closed.wait(delay):
+            raise ConnectionError("closed")
+        record_llm_call(Response(*tokens), delay)
+        return text
+    return call
+
+
+def test_deadline_uses_initial_delay_until_enough_samples():
+    p = policy(initial_delay=7.0, min_samples=3)
+    assert p.deadline() == 7.0
+    for seconds in (1.0, 2.0):
+        p._observe(seconds)
+    assert p.deadline() == 7.0
+    p._observe(3.0)
+    assert p.deadline() == 3.0
+
+
+def test_deadline_is_the_latency_percentile():
+    p = policy(percentile=90.0, min_samples=1)
+    for seconds in range(1, 11):
+        p._observe(float(seconds))
+    assert p.deadline() == 9.0
+    p.percentile = 50.0
+    assert p.deadline() == 5.0
+
+
+def test_fast_primary_is_not_hedged():
+    p = policy(initial_delay=5.0)
+    text = p.run((Client(), answer('{"ok": 1}')), lambda: pytest.fail("hedged"), is_valid=lambda t: True)
+    assert text == '{"ok": 1}'
+    assert p.stats["hedged"] == 0 and p.stats["primary_wins"] == 1
+
+
+def test_stalled_primary_loses_to_secondary():
+    p = policy(initial_delay=0.05)
+    primary = Client()
+    text = p.run((primary, answer("slow", delay=5)), lambda: (Client(), answer("fast")), is_valid=lambda t: True)
+    assert text == "fast"
+    assert primary.closed.is_set()
+    assert p.stats["secondary_wins"] == 1
+
+
+def test_invalid_primary_falls_back_to_secondary():
+    p = policy(initial_delay=5.0)
+    text = p.run((Client(), answer("not json")), lambda: (Client(), answer("{}")), is_valid=lambda t: t == "{}")
+    assert text == "{}"
+
+
+def test_only_the_used_request_counts_in_the_cycle(tmp_path):
+    from builDroid.utils.metrics import MetricsRecorder
+
+    recorder = MetricsRecorder("demo")
+    recorder.path = str(tmp_path / "metrics.jsonl")
+    p = policy(initial_delay=5.0)
+    with recorder.cycle(1) as cycle:
+        text = p.run(
+            (Client(), answer("not json", tokens=(100, 50))),
+            lambda: (Client(), answer("{}", tokens=(7, 3))),
+            is_valid=lambda t: t == "{}",
+        )
+        assert current_cycle() is cycle
+    assert text == "{}"
+    assert (cycle.llm_calls, cycle.prompt_tokens, cycle.completion_tokens) == (1, 7, 3)
+    assert (p.stats["losing_llm_calls"], p.stats["losing_prompt_tokens"], p.stats["losing_completion_tokens"]) == (1, 100, 50)
+
+
+def test_both_failing_raises_the_last_error():
+    def fail(client):
+        raise RuntimeError("down")
+    with pytest.raises(RuntimeError):
+        policy(initial_delay=5.0).run((Client(), fail), lambda: (Client(), fail), is_valid=lambda t: True)
+
+
+def test_losing_request_sees_cancellation():
+    seen = []
+    release = threading.Event()
+
+    def slow(client):
+        client.closed.wait(5)
+        seen.append(request_cancelled())
+        release.set()
+        raise ConnectionError("closed")
+
+    policy(initial_delay=0.01).run((Client(), slow), lambda: (Client(), answer("{}")), is_valid=lambda t: True)
+    assert release.wait(5)
+    assert seen == [True]
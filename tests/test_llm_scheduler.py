@@ -0,0 +1,90 @@
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+
+from builDroid.utils.llm_scheduler import (
+    PRIORITY_AGENT,
+    PRIORITY_POST_PROCESS,
+    LLMScheduler,
+    TokenBucket,
+    is_bad_request,
+    retry_after_seconds,
+)
+
+
+def error_with_headers(headers: dict) -> Exception:
+    error = Exception("rate limited")
+    error.response = SimpleNamespace(headers=headers)
+    return error
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(per_minute=60)
+    bucket._updated = 0.0
+    assert bucket.wait_time(60, now=0.0) == 0
+    bucket.take(60)
+    assert bucket.wait_time(1, now=0.0) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now=1.0) == 0
+    assert bucket.wait_time(30, now=1.0) == pytest.approx(29.0)
+
+
+def test_token_bucket_caps_amount_and_level():
+    bucket = TokenBucket(per_minute=60)
+    bucket._updated = 0.0
+    # More than the capacity waits for a full bucket instead of forever.
+    assert bucket.wait_time(500, now=0.0) == 0
+    bucket.give_back(100)
+    assert bucket.level == 60
+
+
+def test_token_bucket_debt_delays_later_requests():
+    bucket = TokenBucket(per_minute=60)
+    bucket._updated = 0.0
+    bucket.take(70)
+    assert bucket.wait_time(1, now=0.0) == pytest.approx(11.0)
+
+
+@pytest.mark.parametrize("headers, seconds", [
+    ({"retry-after": "7"}, 7.0),
+    ({"retry-after-ms": "1500"}, 1.5),
+    ({"retry-after": "-3"}, 0.0),
+    ({"retry-after": "soon"}, None),
+    ({}, None),
+])
+def test_retry_after_seconds(headers, seconds):
+    assert retry_after_seconds(error_with_headers(headers)) == seconds
+
+
+def test_retry_after_http_date():
+    headers = {"retry-after": formatdate(time.time() + 30, usegmt=True)}
+    assert 25 < retry_after_seconds(error_with_headers(headers)) <= 30
+
+
+def test_retry_after_without_response():
+    assert retry_after_seconds(ValueError("x")) is None
+
+
+def test_is_bad_request():
+    assert is_bad_request(SimpleNamespace(status_code=400))
+    assert is_bad_request(SimpleNamespace(code=404))
+    assert not is_bad_request(SimpleNamespace(status_code=429))
+    assert not is_bad_request(TimeoutError())
+
+
+def test_scheduler_without_limits_admits_immediately():
+    scheduler = LLMScheduler()
+    assert scheduler.acquire(1000, PRIORITY_AGENT) < 0.1
+    assert scheduler.acquire(1000, PRIORITY_POST_PROCESS) < 0.1
+    assert scheduler.stats["agent"]["requests"] == 1
+    assert scheduler.stats["post_process"]["requests"] == 1
+
+
+def test_scheduler_corrects_reserved_tokens():
+    scheduler = LLMScheduler(tokens_per_minute=1000)
+    scheduler.acquire(400, PRIORITY_AGENT)
+    level = scheduler.tokens.level
+    usage = SimpleNamespace(usage=SimpleNamespace(prompt_tokens=100, completion_tokens=50))
+    scheduler.complete(400, usage)
+    assert scheduler.tokens.level == pytest.approx(level + 250, abs=1)
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from builDroid.utils.error_classifier import ErrorMatch
+from builDroid.utils.model_cascade import ModelCascade, ModelTier, load_model_tiers
+
+
+def error(category: str = "Environment Issue", issue: str = "JDK_VERSION") -> list[ErrorMatch]:
+    return [ErrorMatch(category=category, issue=issue, start=0, end=1, text="x", versions=(), rule=0)]
+
+
+def cascade(escalate_after: int = 2, deescalate_after: int = 3) -> ModelCascade:
+    return ModelCascade(
+        [ModelTier("cheap", input_cost=1.0, output_cost=2.0), ModelTier("strong"), ModelTier("strongest")],
+        escalate_after=escalate_after, deescalate_after=deescalate_after,
+    )
+
+
+def test_escalates_on_repeated_error_class():
+    c = cascade()
+    assert c.observe_errors(error()) is None
+    assert c.observe_errors(error()) == "Environment Issue / JDK_VERSION repeated 2 times"
+    assert c.model == "strong"
+    assert c.stats[1]["escalations"] == 1
+
+
+def test_different_errors_do_not_escalate():
+    c = cascade()
+    c.observe_errors(error(issue="JDK_VERSION"))
+    c.observe_errors(error(issue="MISSING_NDK"))
+    c.observe_errors(error(issue="JDK_VERSION"))
+    assert c.level == 0
+
+
+def test_stays_on_last_tier():
+    c = cascade(escalate_after=1)
+    c.observe_errors(error())
+    c.observe_errors(error())
+    assert c.level == 2
+    assert c.observe_errors(error()) is None
+    assert not c.escalate()
+
+
+def test_one_clean_output_does_not_deescalate():
+    c = cascade()
+    c.escalate()
+    c.observe_errors([])
+    c.observe_errors([])
+    assert c.level == 1
+    c.observe_errors(error())
+    c.observe_errors([])
+    c.observe_errors([])
+    assert c.level == 1
+    c.observe_errors([])
+    assert c.level == 0
+
+
+def test_successful_build_deescalates_at_once():
+    c = cascade()
+    c.escalate()
+    c.escalate()
+    c.observe_errors(error(), build_succeeded=True)
+    assert c.level == 1
+
+
+def test_stats_are_kept_by_tier():
+    c = ModelCascade([ModelTier("same", input_cost=1.0), ModelTier("same", input_cost=10.0)])
+    c.record_completion(0, 1.0, 1, prompt_tokens=1_000_000, completion_tokens=0)
+    c.record_completion(1, 2.0, 2, prompt_tokens=1_000_000, completion_tokens=0)
+    c.record_cycle(1)
+    c.record_parse_failure(0)
+    assert c.stats[0]["cost"] == pytest.approx(1.0)
+    assert c.stats[1]["cost"] == pytest.approx(10.0)
+    assert (c.stats[1]["llm_calls"], c.stats[1]["cycles"], c.stats[0]["parse_failures"]) == (2, 1, 1)
+
+
+def test_from_settings():
+    c = ModelCascade.from_settings({"escalate_after": 4, "tiers": ["a", {"model": "b", "output_cost": 3}]}, "default")
+    assert [t.model for t in c.tiers] == ["a", "b"]
+    assert c.tiers[1].output_cost == 3.0
+    assert c.escalate_after == 4
+    assert ModelCascade.from_settings(None, "default").model == "default"
+    with pytest.raises(ValueError):
+        ModelTier.from_setting({"input_cost": 1})
+
+
+def test_save_and_load_stats(tmp_path):
+    c = cascade()
+    c.record_cycle(0)
+    c.save_stats("demo")
+    tiers = load_model_tiers("demo")
+    assert [tier["model"] for tier in tiers] == ["cheap", "strong", "strongest"]
+    assert tiers[0]["cycles"] == 1
+    assert json.loads((tmp_path / "builDroid_tests" / "demo" / "model_tiers.json").read_text())["deescalate_after"] == 3
+    assert load_model_tiers("missing") == []
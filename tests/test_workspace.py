@@ -0,0 +1,118 @@
+import io
+import os
+import stat
+import tarfile
+
+from builDroid.utils.workspace import export_overlay_changes
+
+
+def upper_layer(*members) -> tarfile.TarFile:
+    """An upper layer as `tar --xattrs -C upper .` archives it, opened as a stream."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w", format=tarfile.PAX_FORMAT) as archive:
+        for member, data in members:
+            archive.addfile(member, io.BytesIO(data) if data is not None else None)
+    buffer.seek(0)
+    return tarfile.open(fileobj=buffer, mode="r|")
+
+
+def directory(name: str, opaque: bool = False):
+    member = tarfile.TarInfo(name)
+    member.type = tarfile.DIRTYPE
+    member.mode = 0o755
+    if opaque:
+        member.pax_headers = {"SCHILY.xattr.trusted.overlay.opaque": "y"}
+    return member, None
+
+
+def file(name: str, data: bytes, mode: int = 0o644):
+    member = tarfile.TarInfo(name)
+    member.size = len(data)
+    member.mode = mode
+    member.mtime = 1_700_000_000
+    return member, data
+
+
+def whiteout(name: str):
+    member = tarfile.TarInfo(name)
+    member.type = tarfile.CHRTYPE
+    member.devmajor = member.devminor = 0
+    return member, None
+
+
+def symlink(name: str, target: str):
+    member = tarfile.TarInfo(name)
+    member.type = tarfile.SYMTYPE
+    member.linkname = target
+    return member, None
+
+
+def lower(tmp_path):
+    root = tmp_path / "project"
+    (root / "app" / "src").mkdir(parents=True)
+    (root / "app" / "build.gradle").write_text("old")
+    (root / "app" / "src" / "Old.java").write_text("old")
+    (root / "app" / "src" / "Keep.java").write_text("keep")
+    (root / "gone.txt").write_text("x")
+    (root / "libs").mkdir()
+    (root / "libs" / "a.jar").write_text("a")
+    return root
+
+
+def test_changed_and_new_files_are_written(tmp_path):
+    root = lower(tmp_path)
+    changed = export_overlay_changes(upper_layer(
+        directory("."), directory("./app"),
+        file("./app/build.gradle", b"new"),
+        file("./local.properties", b"sdk.dir=/sdk"),
+    ), str(root))
+    assert changed == 2
+    assert (root / "app" / "build.gradle").read_text() == "new"
+    assert (root / "local.properties").read_text() == "sdk.dir=/sdk"
+    assert (root / "app" / "src" / "Keep.java").read_text() == "keep"
+
+
+def test_whiteouts_remove_files_and_directories(tmp_path):
+    root = lower(tmp_path)
+    export_overlay_changes(upper_layer(directory("."), whiteout("./gone.txt"), whiteout("./libs")), str(root))
+    assert not (root / "gone.txt").exists()
+    assert not (root / "libs").exists()
+
+
+def test_opaque_directory_drops_lower_contents(tmp_path):
+    root = lower(tmp_path)
+    export_overlay_changes(upper_layer(
+        directory("."), directory("./app"), directory("./app/src", opaque=True),
+        file("./app/src/New.java", b"new"),
+    ), str(root))
+    assert sorted(os.listdir(root / "app" / "src")) == ["New.java"]
+    assert (root / "app" / "build.gradle").read_text() == "old"
+
+
+def test_symlinks_are_recreated(tmp_path):
+    root = lower(tmp_path)
+    export_overlay_changes(upper_layer(directory("."), symlink("./libs", "app/src")), str(root))
+    assert os.path.islink(root / "libs")
+    assert os.readlink(root / "libs") == "app/src"
+    assert (root / "app" / "src" / "Keep.java").exists()
+
+
+def test_root_only_files_become_readable(tmp_path):
+    root = lower(tmp_path)
+    export_overlay_changes(upper_layer(directory("."), file("./secret.properties", b"k=v", mode=0o600)), str(root))
+    mode = stat.S_IMODE(os.stat(root / "secret.properties").st_mode)
+    assert mode & stat.S_IRUSR and mode & stat.S_IWUSR
+
+
+def test_hard_linked_destination_is_not_written_through(tmp_path):
+    root = lower(tmp_path)
+    outside = tmp_path / "original.gradle"
+    os.link(root / "app" / "build.gradle", outside)
+    export_overlay_changes(upper_layer(directory("."), directory("./app"), file("./app/build.gradle", b"new")), str(root))
+    assert outside.read_text() == "old"
+
+
+def test_paths_outside_the_tree_are_ignored(tmp_path):
+    root = lower(tmp_path)
+    assert export_overlay_changes(upper_layer(file("../escape.txt", b"x")), str(root)) == 0
+    assert not (tmp_path / "escape.txt").exists()